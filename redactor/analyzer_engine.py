@@ -0,0 +1,121 @@
+"""
+最終段の重複除去を差し替えられる AnalyzerEngine です。
+
+Presidio の AnalyzerEngine.analyze は最後に EntityRecognizer.remove_duplicates で重複・包含された結果を除去しますが、
+この実装は採用済みの全結果と比較するため O(n²) で、大きな文書や閾値なしの分析（評価スクリプトのスイープ）では
+分析時間の大半を占めます。Presidio のクラスを書き換えずに、このエンジンのインスタンスだけが
+同じ結果を返す O(n log n) の実装（pattern_scanner.remove_duplicates）を使用します。
+
+analyze は AnalyzerEngine.analyze の処理を写したもので、Presidio の内部実装（_enhance_using_context など）に
+依存します。写し元と同じ処理であることを確認したバージョン（SUPPORTED_PRESIDIO_VERSIONS）以外の
+presidio-analyzer では、AnalyzerEngine.analyze をそのまま使用します。
+"""
+
+import re
+from importlib.metadata import PackageNotFoundError, version as package_version
+
+from presidio_analyzer import AnalyzerEngine, RecognizerResult
+
+try:
+    from .pattern_scanner import remove_duplicates
+except ImportError:
+    from pattern_scanner import remove_duplicates
+
+# analyze が写し元と同じ処理であることを確認した presidio-analyzer のバージョン
+SUPPORTED_PRESIDIO_VERSIONS = ("2.2.364",)
+
+
+def deduplication_supported(version=None):
+    """presidio-analyzer のバージョン（省略時はインストールされているバージョン）で analyze を置き換えられるかを返します。"""
+    if version is None:
+        try:
+            version = package_version("presidio-analyzer")
+        except PackageNotFoundError:
+            return False
+    return version in SUPPORTED_PRESIDIO_VERSIONS
+
+
+class DeduplicatingAnalyzerEngine(AnalyzerEngine):
+    """
+    重複除去の関数を指定できる AnalyzerEngine。
+
+    analyze の処理順序（Recognizer の実行 → コンテキストによるスコア補正 → 閾値による除外 → 重複除去 →
+    allow_list の除外）と結果は AnalyzerEngine と同じです。
+    score_threshold を省略した場合（Recognizer ごとの閾値を使う場合）、ad_hoc_recognizers を渡した場合、
+    log_decision_process が有効な場合と、対応しないバージョンの presidio-analyzer の場合は、
+    AnalyzerEngine.analyze をそのまま使用します。
+    """
+
+    def __init__(self, *args, deduplicate=remove_duplicates, **kwargs):
+        """
+        :param deduplicate: 検出結果のリストを受け取り、重複・包含された結果を除いたリストを返す関数
+                            （EntityRecognizer.remove_duplicates と同じ結果を返すこと）
+        """
+        super().__init__(*args, **kwargs)
+        self.deduplicate = deduplicate
+        self.replaces_analyze = deduplication_supported()
+
+    def analyze(
+        self,
+        text,
+        language,
+        entities=None,
+        correlation_id=None,
+        score_threshold=None,
+        return_decision_process=False,
+        ad_hoc_recognizers=None,
+        context=None,
+        allow_list=None,
+        allow_list_match="exact",
+        regex_flags=re.DOTALL | re.MULTILINE | re.IGNORECASE,
+        nlp_artifacts=None,
+    ):
+        if not self.replaces_analyze or score_threshold is None or ad_hoc_recognizers or self.log_decision_process:
+            return super().analyze(
+                text=text,
+                language=language,
+                entities=entities,
+                correlation_id=correlation_id,
+                score_threshold=score_threshold,
+                return_decision_process=return_decision_process,
+                ad_hoc_recognizers=ad_hoc_recognizers,
+                context=context,
+                allow_list=allow_list,
+                allow_list_match=allow_list_match,
+                regex_flags=regex_flags,
+                nlp_artifacts=nlp_artifacts,
+            )
+
+        all_fields = not entities
+        recognizers = self.registry.get_recognizers(language=language, entities=entities, all_fields=all_fields)
+        if all_fields:
+            entities = self.get_supported_entities(language=language)
+        if not nlp_artifacts:
+            nlp_artifacts = self.nlp_engine.process_text(text, language)
+
+        results = []
+        for recognizer in recognizers:
+            if not recognizer.is_loaded:
+                recognizer.load()
+                recognizer.is_loaded = True
+            current_results = recognizer.analyze(text=text, entities=entities, nlp_artifacts=nlp_artifacts)
+            if not current_results:
+                continue
+            # コンテキストによるスコア補正は Recognizer の ID で Recognizer を特定する
+            for result in current_results:
+                metadata = result.recognition_metadata
+                if not metadata:
+                    metadata = result.recognition_metadata = {}
+                metadata.setdefault(RecognizerResult.RECOGNIZER_IDENTIFIER_KEY, recognizer.id)
+                metadata.setdefault(RecognizerResult.RECOGNIZER_NAME_KEY, recognizer.name)
+            results.extend(current_results)
+
+        results = self._enhance_using_context(text, results, nlp_artifacts, recognizers, context)
+        results = [result for result in results if result.score >= score_threshold]
+        results = self.deduplicate(results)
+        if allow_list:
+            results = self._remove_allow_list(results, allow_list, text, regex_flags, allow_list_match)
+        if not return_decision_process:
+            for result in results:
+                result.analysis_explanation = None
+        return results
@@ -0,0 +1,107 @@
+"""
+正解の範囲（PII の位置）の注釈ファイルと、範囲の重なりによる検出結果の照合です。
+
+注釈は文書と同じディレクトリの <文書名>.spans.jsonl（例: synthetic_00000.md → synthetic_00000.spans.jsonl）に、
+1 行に 1 件 {"start": 開始位置, "end": 終了位置, "entity_type": エンティティタイプ} で保存します。
+位置は文書の文字（str のインデックス）単位です。redactor.corpus が生成し、redactor.evaluate が使用します。
+
+照合はエンティティタイプごとに行い、同じタイプの範囲と 1 文字以上重なれば一致とします
+（"パスワード: xxx" のようにラベルを含めて検出した場合も一致します）。
+"""
+
+import bisect
+import json
+from collections import defaultdict
+from pathlib import Path
+
+SPANS_SUFFIX = ".spans.jsonl"
+
+# 同じ種類として照合するエンティティタイプ（Presidio が ORG と ORGANIZATION のどちらも返すため）
+ENTITY_ALIASES = {"ORGANIZATION": "ORG"}
+
+
+def spans_path(document_path):
+    """文書に対応する注釈ファイルのパスを返します。"""
+    document_path = Path(document_path)
+    return document_path.with_name(document_path.stem + SPANS_SUFFIX)
+
+
+def dump_span(f, start, end, entity_type):
+    """注釈を 1 件書き込みます。"""
+    f.write(json.dumps({"start": start, "end": end, "entity_type": entity_type}) + "\n")
+
+
+def read_spans(path):
+    """注釈ファイルを (開始位置, 終了位置, エンティティタイプ) のリストで返します。"""
+    spans = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                span = json.loads(line)
+                spans.append((span["start"], span["end"], span["entity_type"]))
+    return spans
+
+
+def load_spans(document_path):
+    """文書の注釈を返します。注釈ファイルがない場合は None を返します。"""
+    path = spans_path(document_path)
+    return read_spans(path) if path.exists() else None
+
+
+def match_spans(expected, detected):
+    """
+    検出した範囲（(開始位置, 終了位置, エンティティタイプ) のリスト）ごとに、重なる正解の範囲（同じエンティティタイプのみ）の
+    expected 内の番号のリストを、detected と同じ順序で返します。
+    """
+    expected_by_type = defaultdict(list)
+    for index, (start, end, entity_type) in enumerate(expected):
+        expected_by_type[ENTITY_ALIASES.get(entity_type, entity_type)].append((start, end, index))
+    # 終了位置の累積最大値（単調増加）で、検出の開始位置より後に終わる最初の正解を二分探索する
+    max_ends_by_type = {}
+    for entity_type, spans in expected_by_type.items():
+        spans.sort()
+        max_ends = []
+        max_end = -1
+        for _, end, _ in spans:
+            max_end = max(max_end, end)
+            max_ends.append(max_end)
+        max_ends_by_type[entity_type] = max_ends
+
+    matches = []
+    for start, end, entity_type in detected:
+        entity_type = ENTITY_ALIASES.get(entity_type, entity_type)
+        spans = expected_by_type.get(entity_type, [])
+        found = []
+        index = bisect.bisect_right(max_ends_by_type.get(entity_type, []), start)
+        while index < len(spans) and spans[index][0] < end:
+            if spans[index][1] > start:
+                found.append(spans[index][2])
+            index += 1
+        matches.append(found)
+    return matches
+
+
+def score_spans(expected, detected):
+    """
+    正解の範囲と検出した範囲（どちらも (開始位置, 終了位置, エンティティタイプ) のリスト）を照合し、
+    エンティティタイプごとの {"tp", "fp", "fn", "exact"} を返します。
+
+    tp は検出した範囲と重なる正解の範囲の数、fn は重なる検出がない正解の範囲の数、
+    fp は正解の範囲と重ならない検出の数、exact は検出と開始・終了位置が完全に一致する正解の範囲の数です。
+    """
+    scores = defaultdict(lambda: {"tp": 0, "fp": 0, "fn": 0, "exact": 0})
+    matched = set()
+    exact = set()
+    for (start, end, entity_type), found in zip(detected, match_spans(expected, detected)):
+        if not found:
+            scores[ENTITY_ALIASES.get(entity_type, entity_type)]["fp"] += 1
+        for index in found:
+            matched.add(index)
+            if expected[index][:2] == (start, end):
+                exact.add(index)
+    for index, (_, _, entity_type) in enumerate(expected):
+        entity_scores = scores[ENTITY_ALIASES.get(entity_type, entity_type)]
+        entity_scores["tp" if index in matched else "fn"] += 1
+        if index in exact:
+            entity_scores["exact"] += 1
+    return dict(scores)
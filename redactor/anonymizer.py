@@ -0,0 +1,207 @@
+"""
+検出結果をトークン（<PERSON1> など）に置き換える匿名化エンジンです。
+
+presidio_anonymizer の AnonymizerEngine にカスタムオペレーター（エンティティごとの lambda）を渡す方式は、
+検出結果ごとにオペレーターの生成・検証と文字列全体の再構築を行うため、結果数に比例して遅くなります。
+EntityAnonymizer は同じ規則で重複・包含を解決したうえで、出力を 1 回の走査で組み立てます。
+
+出力は AnonymizerEngine（既定の MERGE_SIMILAR_OR_CONTAINED と空白区切りの結合）と同一です。
+  1. 同じエンティティタイプで重なる結果は 1 つに統合する（スコアは最大値）
+  2. 他の結果に包含される結果、同じ範囲でスコアが低い結果を除外する
+  3. 半角スペースのみで区切られた同じエンティティタイプの結果を結合する
+  4. 後ろの結果から順にトークンを割り当てる（番号の付き方も AnonymizerEngine と同じ）
+"""
+
+import re
+from collections import namedtuple
+
+# AnonymizerEngine._merge_entities_with_spaces_between と同じ判定（末尾の改行 1 つも許容される）
+_SPACES_ONLY = re.compile(r"^( )+$")
+
+AnonymizedText = namedtuple("AnonymizedText", ["text", "mapping", "items"])
+AnonymizedText.__doc__ = """
+匿名化の結果。
+
+text: 匿名化後のテキスト
+mapping: この呼び出しで出力したトークン → 元の値（前後の空白を除去）
+items: 置き換えた範囲ごとの dict（entity_type, original_text, anonymized_token, start, end, score）。
+       start / end は入力テキスト上の位置で、出現順に並びます。
+"""
+
+
+class _Span:
+    """競合解決中の検出結果（AnonymizerEngine と同様に範囲・スコアを書き換えるため可変）。"""
+
+    __slots__ = ("start", "end", "entity_type", "score")
+
+    def __init__(self, start, end, entity_type, score):
+        self.start = start
+        self.end = end
+        self.entity_type = entity_type
+        self.score = score
+
+
+def _merge_same_type(spans):
+    """
+    同じエンティティタイプで重なる（共通部分の長さが正の）結果を統合します。
+    spans は (start, end) の昇順で、統合後に残る結果の順序も維持します。
+    """
+    survivors = [True] * len(spans)
+    # エンティティタイプごとに、統合中の結果のインデックス
+    open_spans = {}
+    for i, span in enumerate(spans):
+        if span.start == span.end:
+            # 長さ 0 の結果はどの結果とも重ならない
+            continue
+        current_index = open_spans.get(span.entity_type)
+        if current_index is not None:
+            current = spans[current_index]
+            if span.start < current.end:
+                # 前の結果をこの結果に統合する（統合先は後ろの結果）
+                span.start = current.start
+                span.end = max(span.end, current.end)
+                span.score = max(span.score, current.score)
+                survivors[current_index] = False
+        open_spans[span.entity_type] = i
+    return [span for span, survived in zip(spans, survivors) if survived]
+
+
+def _remove_conflicts(spans):
+    """
+    他の結果に包含される結果と、同じ範囲でスコアが低い結果を除外します。
+    同じ範囲・同じスコアの場合は後ろの結果を残します（AnonymizerEngine と同じ）。
+    """
+    # 同じ範囲の結果のうち残すもの（スコア最大のうち最後の結果）
+    best = {}
+    for i, span in enumerate(spans):
+        key = (span.start, span.end)
+        previous = best.get(key)
+        if previous is None or span.score >= spans[previous].score:
+            best[key] = i
+
+    # 開始位置の昇順・終了位置の降順に走査し、それより前の範囲の最大終了位置で包含を判定する
+    contained = set()
+    max_end = None
+    for start, end in sorted(best, key=lambda key: (key[0], -key[1])):
+        if max_end is not None and max_end >= end:
+            contained.add((start, end))
+        elif max_end is None or end > max_end:
+            max_end = end
+
+    return [
+        span for i, span in enumerate(spans)
+        if best[(span.start, span.end)] == i and (span.start, span.end) not in contained
+    ]
+
+
+def _merge_spaces_between(text, spans):
+    """半角スペースのみで区切られた、隣り合う同じエンティティタイプの結果を結合します。"""
+    merged = []
+    previous = None
+    for span in spans:
+        if (
+            previous is not None
+            and previous.entity_type == span.entity_type
+            and _SPACES_ONLY.search(text[previous.end:span.start])
+        ):
+            merged.pop()
+            span.start = previous.start
+        merged.append(span)
+        previous = span
+    return merged
+
+
+def resolve_conflicts(text, results):
+    """
+    検出結果の重複・包含を AnonymizerEngine と同じ規則で解決し、置き換える範囲（_Span）のリストを返します。
+    入力の RecognizerResult は変更しません。
+    """
+    spans = [_Span(r.start, r.end, r.entity_type, r.score) for r in results]
+    spans.sort(key=lambda span: (span.start, span.end))
+    spans = _merge_same_type(spans)
+    spans = _remove_conflicts(spans)
+    return _merge_spaces_between(text, spans)
+
+
+class EntityAnonymizer:
+    """
+    エンティティタイプごとに出現順の番号でトークン化する匿名化エンジン。
+
+    同じ値（前後の空白を除去）には同じトークンを割り当てます。番号の対応はインスタンスが保持するため、
+    同じインスタンスで処理したテキスト（ストリーミングのウィンドウなど）の間で番号が一貫します。
+    ファイルごとに番号を振り直す場合は、ファイルごとに新しいインスタンスを作成してください。
+
+    番号の対応は get_state() で JSON にできる dict として取り出し、from_state() で復元できます。
+    API サーバーはこれをセッションに保存し、会話の各ターンで新しいメッセージだけを処理しても
+    同じ人物に同じトークン（<PERSON1> など）を割り当てます。
+    """
+
+    def __init__(self, entity_types):
+        """
+        :param entity_types: トークン化するエンティティタイプ（config.TARGET_ENTITIES）。
+                             それ以外のエンティティタイプは <エンティティタイプ> に置き換えます
+        """
+        self.entity_maps = {entity_type: {} for entity_type in entity_types}
+
+    @classmethod
+    def from_state(cls, entity_types, state):
+        """get_state() の戻り値から番号の対応を復元したインスタンスを作成します（state が None の場合は新規）。"""
+        anonymizer = cls(entity_types)
+        for entity_type, entity_map in (state or {}).items():
+            if entity_type in anonymizer.entity_maps:
+                anonymizer.entity_maps[entity_type].update(entity_map)
+        return anonymizer
+
+    def get_state(self):
+        """番号の対応（エンティティタイプ → {値: 番号}）を返します。JSON にそのまま変換できます。"""
+        return {entity_type: dict(entity_map) for entity_type, entity_map in self.entity_maps.items() if entity_map}
+
+    def token_for(self, entity_type, value):
+        """値に対応するトークンと、番号付けに使用した値（前後の空白を除去）を返します。"""
+        entity_map = self.entity_maps.get(entity_type)
+        if entity_map is None:
+            # AnonymizerEngine の既定オペレーター（replace）と同じ
+            return f"<{entity_type}>", None
+        val = value.strip()
+        index = entity_map.get(val)
+        if index is None:
+            index = len(entity_map) + 1
+            entity_map[val] = index
+        return f"<{entity_type}{index}>", val
+
+    def anonymize(self, text, results):
+        """
+        text 中の検出結果をトークンに置き換え、AnonymizedText を返します。
+
+        :param text: 元のテキスト
+        :param results: 検出結果（RecognizerResult のリスト。filter_common_words の出力など）
+        """
+        spans = resolve_conflicts(text, results)
+        if not spans:
+            return AnonymizedText(text, {}, [])
+
+        # AnonymizerEngine は後ろの結果から置き換えるため、番号も後ろの結果から割り当てる
+        ordered = sorted(spans, key=lambda span: (span.start, span.end), reverse=True)
+        tokens = [self.token_for(span.entity_type, text[span.start:span.end]) for span in ordered]
+        ordered.reverse()
+        tokens.reverse()
+
+        pieces = [text[:ordered[0].start]]
+        mapping = {}
+        items = []
+        for i, (span, (token, value)) in enumerate(zip(ordered, tokens)):
+            pieces.append(token)
+            # 次の結果と重なる場合は、重なった部分を次のトークンに含める
+            next_start = ordered[i + 1].start if i + 1 < len(ordered) else len(text)
+            pieces.append(text[min(span.end, next_start):next_start])
+            if value is not None:
+                mapping[token] = value
+            items.append({
+                "entity_type": span.entity_type,
+                "original_text": text[span.start:span.end],
+                "anonymized_token": token,
+                "start": span.start,
+                "end": span.end,
+                "score": span.score,
+            })
+        return AnonymizedText("".join(pieces), mapping, items)
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+秘匿化ロジックのベンチマークスクリプト
+
+既定では、文書ごとの秘匿化（分析 + 匿名化）のレイテンシ・スループット・メモリ使用量を測定します（run_suite）。
+
+- ウォームアップの後、time.perf_counter_ns で文書ごとの処理時間を計測し、文書サイズ（文字数）の区分ごとに
+  p50 / p95 / p99 を集計します。
+- 段階（フォーム形式の行・NLP・パターン・その他の Recognizer・後処理・誤検知フィルタ・匿名化）ごとの内訳は、
+  計測の影響がレイテンシに混ざらないよう、別の計測（analyze_text の profile）で集計します。
+- メモリはピーク RSS と、tracemalloc による文書ごとのピーク割り当て量・割り当ての多い箇所を報告します。
+  tracemalloc は処理を遅くするため、これも別の計測で行います。
+
+--json で結果を JSON に書き出し、--compare で以前の JSON（別のコミットの結果など）と比較できます。
+--filter-scaling を指定すると、データ量に対する filter_common_words の処理時間のスケーリングを測定します。
+"""
+
+import gc
+import json
+import platform
+import subprocess
+import time
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+# パスを追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from presidio_analyzer import PatternRecognizer
+from redactor.redactor import setup_analyzer, load_analyzer, analyze_text, redact_text, create_anonymizer, filter_common_words
+from redactor.pattern_scanner import MultiPatternRecognizer
+from redactor.profiling import recognizer_keys
+from redactor.snapshot import config_fingerprint
+from redactor import config
+
+# 段階の集計順（analyze_text の profile の段階 + patterns / other_recognizers / anonymize）
+STAGES = ("form_fields", "nlp", "patterns", "other_recognizers", "analyzer_postprocess", "filter_common_words", "anonymize")
+
+def build_scaled_text(base_text, records):
+    """
+    ベース文書のブロック（'---' 区切り）を records 件になるまで繰り返した文書を生成します。
+    CRM エクスポートのように同じ形式のレコードが大量に並ぶ文書を想定しています。
+    """
+    blocks = base_text.split("\n---\n")
+    return "\n---\n".join(blocks[i % len(blocks)] for i in range(records))
+
+def collect_pattern_candidates(analyzer, text):
+    """
+    NLP を通さずにパターン Recognizer のみで候補を収集します（filter_common_words への入力）。
+    """
+    candidates = []
+    for recognizer in analyzer.registry.recognizers:
+        if isinstance(recognizer, (PatternRecognizer, MultiPatternRecognizer)):
+            candidates.extend(recognizer.analyze(text=text, entities=config.TARGET_ENTITIES))
+    return candidates
+
+def bench_filter_scaling(analyzer, base_text, record_counts, repeat=3):
+    """
+    filter_common_words の処理時間をレコード数ごとに測定します。
+    """
+    rows = []
+    for records in record_counts:
+        text = build_scaled_text(base_text, records)
+        candidates = collect_pattern_candidates(analyzer, text)
+
+        best = None
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            filter_common_words(candidates, text)
+            elapsed = time.perf_counter() - start_time
+            best = elapsed if best is None else min(best, elapsed)
+
+        rows.append({
+            'records': records,
+            'chars': len(text),
+            'candidates': len(candidates),
+            'seconds': best,
+        })
+    return rows
+
+def percentile(sorted_values, q):
+    """昇順に並んだ値の q パーセンタイル（0 <= q <= 100、線形補間）を返します。"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize_ms(values_ns):
+    """ナノ秒の値のリストを、件数・平均・p50 / p95 / p99・最大（ミリ秒）の dict にまとめます。"""
+    values = sorted(value / 1e6 for value in values_ns)
+    return {
+        'samples': len(values),
+        'mean_ms': sum(values) / len(values) if values else 0.0,
+        'p50_ms': percentile(values, 50),
+        'p95_ms': percentile(values, 95),
+        'p99_ms': percentile(values, 99),
+        'max_ms': values[-1] if values else 0.0,
+    }
+
+def size_bucket(chars, edges):
+    """文字数が属する区分のラベル（"256-511" など）を返します。edges は区分の境界（昇順）です。"""
+    lower = 0
+    for edge in edges:
+        if chars < edge:
+            return f"{lower}-{edge - 1}"
+        lower = edge
+    return f"{lower}+"
+
+def load_documents(input_dir, limit=None, base_text=None, scaled_records=()):
+    """
+    ベンチマークする文書の (名前, テキスト) のリストを返します。
+    base_text と scaled_records を指定した場合は、build_scaled_text で作成した大きな文書も加えます。
+    """
+    documents = []
+    for path in sorted(Path(input_dir).glob("*.md"))[:limit]:
+        documents.append((path.name, path.read_text(encoding='utf-8')))
+    for records in scaled_records:
+        documents.append((f"scaled_{records}", build_scaled_text(base_text, records)))
+    return documents
+
+def _redact_ns(analyzer, text):
+    """
+    1 文書を秘匿化し、(全体, 匿名化) の処理時間（ナノ秒）を返します。結果キャッシュは使用しません。
+    STREAM_WINDOW_BYTES を超える文書は redact_text（ウィンドウ単位の処理）で秘匿化し、匿名化の時間は 0 とします。
+    """
+    if len(text.encode('utf-8')) > config.STREAM_WINDOW_BYTES:
+        start = time.perf_counter_ns()
+        redact_text(analyzer, text)
+        return time.perf_counter_ns() - start, 0
+    start = time.perf_counter_ns()
+    results = analyze_text(analyzer, text)
+    analyzed = time.perf_counter_ns()
+    create_anonymizer().anonymize(text, results)
+    end = time.perf_counter_ns()
+    return end - start, end - analyzed
+
+def _peak_rss_mb():
+    """現在のプロセスのピーク RSS（MB）を返します。"""
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def _git_commit(base_dir):
+    """作業ツリーのコミット（取得できない場合は None）を返します。"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=base_dir, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def measure_latency(analyzer, documents, iterations, edges):
+    """文書ごとに iterations 回秘匿化し、全体・文書サイズの区分ごとのレイテンシとスループットを返します。"""
+    samples = []
+    buckets = {}
+    total_chars = 0
+    gc.collect()
+    started = time.perf_counter_ns()
+    for _ in range(iterations):
+        for _, text in documents:
+            elapsed, _ = _redact_ns(analyzer, text)
+            samples.append(elapsed)
+            buckets.setdefault(size_bucket(len(text), edges), []).append(elapsed)
+            total_chars += len(text)
+    wall_seconds = (time.perf_counter_ns() - started) / 1e9
+
+    bucket_stats = {}
+    for label in sorted(buckets, key=lambda label: int(label.split("-")[0].rstrip("+"))):
+        stats = summarize_ms(buckets[label])
+        stats['documents'] = stats['samples'] // iterations
+        bucket_stats[label] = stats
+    return {
+        'overall': summarize_ms(samples),
+        'buckets': bucket_stats,
+        'throughput': {
+            'documents_per_second': len(samples) / wall_seconds if wall_seconds else 0.0,
+            'chars_per_second': total_chars / wall_seconds if wall_seconds else 0.0,
+        },
+    }
+
+def measure_stages(analyzer, documents):
+    """
+    analyze_text の profile で段階ごとの処理時間を集計します（文書ごとの値の平均・p50 / p95 / p99）。
+    ウィンドウ単位で処理する大きな文書（STREAM_WINDOW_BYTES 超）は集計しません。
+    """
+    keys = recognizer_keys(analyzer.registry.recognizers)
+    pattern_keys = {
+        keys[recognizer.id] for recognizer in analyzer.registry.recognizers
+        if isinstance(recognizer, (PatternRecognizer, MultiPatternRecognizer))
+    }
+    per_stage = {stage: [] for stage in STAGES}
+    for _, text in documents:
+        if len(text.encode('utf-8')) > config.STREAM_WINDOW_BYTES:
+            continue
+        profile = {}
+        results = analyze_text(analyzer, text, profile=profile)
+        stages = profile['stages']
+        seconds = {stage: stages[stage]['seconds'] for stage in stages if stage != 'recognizers'}
+        seconds['patterns'] = sum(stats['seconds'] for key, stats in profile['recognizers'].items() if key in pattern_keys)
+        seconds['other_recognizers'] = stages['recognizers']['seconds'] - seconds['patterns']
+        start = time.perf_counter_ns()
+        create_anonymizer().anonymize(text, results)
+        seconds['anonymize'] = (time.perf_counter_ns() - start) / 1e9
+        for stage in STAGES:
+            per_stage[stage].append(int(seconds.get(stage, 0.0) * 1e9))
+
+    total = sum(sum(values) for values in per_stage.values()) or 1
+    report = {}
+    for stage, values in per_stage.items():
+        stats = summarize_ms(values)
+        stats['share'] = sum(values) / total
+        report[stage] = stats
+    return report
+
+def measure_memory(analyzer, documents, top=10):
+    """tracemalloc で文書ごとのピーク割り当て量と、処理後も残っている割り当ての多い箇所を集計します。"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        peaks = []
+        for _, text in documents:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            _redact_ns(analyzer, text)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+        _, overall_peak = tracemalloc.get_traced_memory()
+        # 循環参照で残っている一時オブジェクトを回収し、実際に保持され続ける割り当てだけを数える
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+    finally:
+        tracemalloc.stop()
+
+    peaks.sort()
+    return {
+        'tracemalloc_peak_mb': overall_peak / (1024 * 1024),
+        'document_peak_kb': {
+            'p50': percentile(peaks, 50) / 1024,
+            'p95': percentile(peaks, 95) / 1024,
+            'max': peaks[-1] / 1024 if peaks else 0.0,
+        },
+        'retained_top': [
+            {'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", 'size_kb': stat.size / 1024, 'count': stat.count}
+            for stat in snapshot.statistics('lineno')[:top]
+        ],
+    }
+
+def run_suite(analyzer, documents, warmup=10, iterations=3, edges=(256, 512, 1024, 4096), memory=True):
+    """
+    ベンチマークを実行し、結果（JSON に書き出せる dict）を返します。
+    warmup 件の文書（先頭から順に繰り返し）を計測せずに処理してから計測します。
+    """
+    for i in range(warmup):
+        _redact_ns(analyzer, documents[i % len(documents)][1])
+    rss_after_warmup = _peak_rss_mb()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_commit': _git_commit(Path(__file__).resolve().parent.parent),
+            'config_fingerprint': config_fingerprint(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'documents': len(documents),
+            'chars': sum(len(text) for _, text in documents),
+            'warmup': warmup,
+            'iterations': iterations,
+            'bucket_edges': list(edges),
+        },
+        'latency': measure_latency(analyzer, documents, iterations, edges),
+        'stages': measure_stages(analyzer, documents),
+    }
+    report['memory'] = {'peak_rss_after_warmup_mb': rss_after_warmup}
+    if memory:
+        report['memory'].update(measure_memory(analyzer, documents))
+    report['memory']['peak_rss_mb'] = _peak_rss_mb()
+    return report
+
+def print_report(report):
+    """run_suite の結果を表形式で表示します。"""
+    meta = report['meta']
+    latency = report['latency']
+    print(f"文書数 {meta['documents']}（{meta['chars']} 文字）, ウォームアップ {meta['warmup']}, 反復 {meta['iterations']}")
+    print(f"\n{'文書サイズ（文字）':<16} {'文書数':>8} {'平均(ms)':>10} {'p50(ms)':>10} {'p95(ms)':>10} {'p99(ms)':>10} {'最大(ms)':>10}")
+    for label, stats in list(latency['buckets'].items()) + [('全体', latency['overall'])]:
+        documents = stats.get('documents', meta['documents'])
+        print(f"{label:<16} {documents:>8} {stats['mean_ms']:>10.2f} {stats['p50_ms']:>10.2f} {stats['p95_ms']:>10.2f} "
+              f"{stats['p99_ms']:>10.2f} {stats['max_ms']:>10.2f}")
+    throughput = latency['throughput']
+    print(f"スループット: {throughput['documents_per_second']:.1f} 文書/秒, {throughput['chars_per_second']:.0f} 文字/秒")
+
+    print(f"\n{'段階':<24} {'平均(ms)':>10} {'p50(ms)':>10} {'p95(ms)':>10} {'p99(ms)':>10} {'割合':>7}")
+    for stage, stats in report['stages'].items():
+        print(f"{stage:<24} {stats['mean_ms']:>10.3f} {stats['p50_ms']:>10.3f} {stats['p95_ms']:>10.3f} "
+              f"{stats['p99_ms']:>10.3f} {stats['share'] * 100:>6.1f}%")
+    print("（段階の内訳は計測のオーバーヘッドを含みます）")
+
+    memory = report['memory']
+    print(f"\nピーク RSS: {memory['peak_rss_mb']:.1f}MB（ウォームアップ後 {memory['peak_rss_after_warmup_mb']:.1f}MB）")
+    if 'tracemalloc_peak_mb' in memory:
+        peaks = memory['document_peak_kb']
+        print(f"tracemalloc: ピーク {memory['tracemalloc_peak_mb']:.1f}MB, "
+              f"文書あたりのピーク割り当て p50 {peaks['p50']:.0f}KB / p95 {peaks['p95']:.0f}KB / 最大 {peaks['max']:.0f}KB")
+        print("処理後も残っている割り当て:")
+        for stat in memory['retained_top']:
+            print(f"  {stat['size_kb']:>10.1f}KB {stat['count']:>8} {stat['location']}")
+
+def compare_reports(old, new):
+    """2 つの run_suite の結果のレイテンシ・段階ごとの処理時間の差を表示します。"""
+    def change(before, after):
+        return f"{(after / before - 1) * 100:+.1f}%" if before else "-"
+
+    print(f"比較: {old['meta'].get('git_commit')} -> {new['meta'].get('git_commit')}")
+    print(f"{'文書サイズ（文字）':<16} {'p50(ms)':>20} {'p95(ms)':>20} {'p99(ms)':>20}")
+    buckets = list(new['latency']['buckets'].items()) + [('全体', new['latency']['overall'])]
+    for label, stats in buckets:
+        before = old['latency']['overall'] if label == '全体' else old['latency']['buckets'].get(label)
+        if before is None:
+            continue
+        cells = [f"{before[key]:.2f}->{stats[key]:.2f} {change(before[key], stats[key]):>7}" for key in ('p50_ms', 'p95_ms', 'p99_ms')]
+        print(f"{label:<16} {cells[0]:>20} {cells[1]:>20} {cells[2]:>20}")
+    print(f"\n{'段階':<24} {'平均(ms)':>20}")
+    for stage, stats in new['stages'].items():
+        before = old['stages'].get(stage)
+        if before is not None:
+            print(f"{stage:<24} {before['mean_ms']:.3f}->{stats['mean_ms']:.3f} {change(before['mean_ms'], stats['mean_ms']):>7}")
+    old_rss, new_rss = old['memory']['peak_rss_mb'], new['memory']['peak_rss_mb']
+    print(f"\nピーク RSS: {old_rss:.1f}MB -> {new_rss:.1f}MB ({new_rss - old_rss:+.1f}MB)")
+
+def print_scaling(rows):
+    """スケーリング結果を表形式で表示します。"""
+    print(f"{'レコード数':>10} {'文字数':>10} {'候補数':>10} {'時間(ms)':>10} {'µs/候補':>10} {'時間比':>8}")
+    previous = None
+    for row in rows:
+        per_candidate = row['seconds'] * 1e6 / row['candidates'] if row['candidates'] else 0.0
+        ratio = f"{row['seconds'] / previous['seconds']:.2f}x" if previous and previous['seconds'] > 0 else "-"
+        print(f"{row['records']:>10} {row['chars']:>10} {row['candidates']:>10} {row['seconds'] * 1000:>10.2f} {per_candidate:>10.2f} {ratio:>8}")
+        previous = row
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="秘匿化ロジックのベンチマーク")
+    parser.add_argument("--input", type=str, help="ベンチマークする文書のディレクトリ", default="test_md")
+    parser.add_argument("--limit", type=int, help="文書数の上限", default=None)
+    parser.add_argument("--warmup", type=int, help="計測前に処理する文書数", default=10)
+    parser.add_argument("--iterations", type=int, help="各文書の計測回数", default=3)
+    parser.add_argument("--buckets", type=int, nargs="+", help="文書サイズ（文字数）の区分の境界", default=[256, 512, 1024, 4096])
+    parser.add_argument("--scaled", type=int, nargs="*", help="--base を繰り返して作る大きな文書のレコード数", default=[20, 80])
+    parser.add_argument("--no-memory", action="store_true", help="tracemalloc による計測を省略する")
+    parser.add_argument("--json", type=str, help="結果を書き出す JSON ファイル", default=None)
+    parser.add_argument("--compare", type=str, help="比較する以前の結果（JSON ファイル）", default=None)
+    parser.add_argument("--filter-scaling", action="store_true", help="filter_common_words のスケーリングを測定する")
+    parser.add_argument("--base", type=str, help="スケーリングの元にする文書", default="test_md/test_doc_85_crm_data_export.md")
+    parser.add_argument("--records", type=int, nargs="+", help="測定するレコード数（--filter-scaling）", default=[250, 500, 1000, 2000, 4000])
+    parser.add_argument("--repeat", type=int, help="各サイズの測定回数（最良値を採用、--filter-scaling）", default=3)
+
+    args = parser.parse_args()
+
+    base_dir = Path(__file__).resolve().parent.parent
+    base_text = (base_dir / args.base).read_text(encoding='utf-8')
+
+    if args.filter_scaling:
+        print("Analyzerを初期化中...")
+        analyzer = setup_analyzer()
+
+        print("\nfilter_common_words のスケーリング")
+        print("=" * 80)
+        print_scaling(bench_filter_scaling(analyzer, base_text, args.records, repeat=args.repeat))
+        sys.exit(0)
+
+    documents = load_documents(base_dir / args.input, args.limit, base_text, args.scaled)
+    if not documents:
+        print(f"{base_dir / args.input} に文書がありません")
+        sys.exit(1)
+
+    print("Analyzerを初期化中...")
+    analyzer = load_analyzer()
+    report = run_suite(analyzer, documents, warmup=args.warmup, iterations=args.iterations,
+                       edges=sorted(args.buckets), memory=not args.no_memory)
+    print("=" * 80)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n結果を {args.json} に書き出しました")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        print("=" * 80)
+        compare_reports(previous, report)
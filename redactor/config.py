@@ -2,6 +2,8 @@
 匿名化（マスキング）の設定を管理する構成ファイルです。
 """
 
+import os
+
 # --- NLP エンジン設定 ---
 # spaCy のモデルなどを指定します
 NLP_CONFIG = {
@@ -14,6 +16,100 @@ NLP_CONFIG = {
     ],
 }
 
+# NLP パイプラインの最小構成モード
+# True の場合、Presidio が使用しないコンポーネント（parser, morphologizer, attribute_ruler など）を読み込みません
+# トークン・レンマはトークナイザーが付与するため、固有表現抽出（ner）のみを残します
+# 有効にする前に `python -m redactor.evaluate --compare-pipeline` で F1 が低下しないことを確認してください
+NLP_MINIMAL_PIPELINE = False
+# 最小構成モードで残すコンポーネント（これらが依存する tok2vec などは自動的に残ります）
+NLP_REQUIRED_COMPONENTS = ["ner"]
+
+# True の場合、日本語のトークナイザーと Morphologizer を形態素情報をキャッシュする実装に置き換える（redactor.morph_cache）
+# 処理したトークン数に比例してメモリ使用量が増え続けるのを防ぐ。対応するバージョンの spaCy（3.7・3.8）でのみ有効
+NLP_CACHE_MORPH = True
+
+# nlp.pipe でまとめて処理する文書数（redactor.analyze_batch / main の既定値）
+NLP_BATCH_SIZE = 32
+
+# --- ストリーミング処理設定 ---
+# ファイルサイズがこのバイト数を超える場合は、ファイル全体を読み込まずにウィンドウ単位で処理する
+# 日本語トークナイザー（Sudachi）は 49149 バイトを超える入力を処理できないため、それ未満にすること
+STREAM_WINDOW_BYTES = 40000
+# ウィンドウ境界の前後に確保する重なりのバイト数
+# 最長のパターン（4096bit RSA 秘密鍵の PEM ブロックは約 3.3KB）より大きくすること
+STREAM_OVERLAP_BYTES = 8192
+
+# --- 増分処理設定 ---
+# 出力ディレクトリに保存するマニフェストのファイル名
+# 入力内容のハッシュと設定・コードのフィンガープリントが前回と同じファイルは再処理しない（--force で無効化）
+REDACTION_MANIFEST_NAME = ".redaction-manifest.json"
+
+# --- 結果キャッシュ設定（redactor.result_cache） ---
+# 同じテキストの検出結果を再利用する LRU キャッシュのエントリ数の上限（0 の場合はキャッシュしない）
+# キーはテキストのハッシュ、値は検出範囲のみのため、元のテキストや PII の値は保持しない
+RESULT_CACHE_MAX_ENTRIES = 10000
+# 結果キャッシュのメモリ使用量（概算）の上限（バイト）
+RESULT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# True の場合、文書を空行・"---" の行で区切ったブロック（段落）ごとに検出結果をキャッシュする
+# 繰り返し現れるブロック（定型のフッターなど）や、再提出された文書の変更のないブロックは分析を省略できる
+# ブロックをまたぐ文脈（見出しと本文など）は分析に使われなくなるため、有効にする前に精度を確認すること
+RESULT_CACHE_BY_PARAGRAPH = False
+
+# --- API サーバー設定（redactor.service） ---
+# 処理待ちの秘匿化リクエスト数の上限。超えた場合は 503 を返す（キューが際限なく伸びて応答が遅れるのを防ぐ）
+SERVICE_MAX_PENDING_REQUESTS = 256
+# /anonymize のマイクロバッチ: 最初のリクエストから最大この時間（ミリ秒）待ち、届いたリクエストをまとめて分析する
+# 0 の場合は待たずに分析し、分析中に届いたリクエストを次のバッチにまとめる（待つ場合はすべてのリクエストの遅延がこの時間だけ増える）
+SERVICE_BATCH_WAIT_MS = 0
+# /anonymize のマイクロバッチ: 1 回にまとめて分析するテキスト数の上限（1 の場合はまとめない）
+SERVICE_BATCH_MAX_TEXTS = 16
+# /anonymize・/deanonymize で受け付けるテキストの最大文字数
+SERVICE_MAX_TEXT_LENGTH = 50000
+# API キー（X-API-Key ヘッダー）。未設定の場合は認証しない（ローカル開発用）
+SERVICE_API_KEY = os.environ.get("REDACTOR_API_KEY")
+# セッションストアの接続先（memory:// = プロセス内メモリ、redis://host:port/db = Redis）
+# memory:// はワーカープロセス間で共有されないため、uvicorn --workers 2 以上では Redis を使用すること
+SESSION_STORE_URL = os.environ.get("REDACTOR_SESSION_STORE_URL", "memory://")
+# セッション（トークンと元の値の対応）の有効期間（秒）。アクセスのたびに延長される
+SESSION_TTL_SECONDS = 86400
+# /anonymize で、他のワーカーが同じセッションを先に更新していた場合に番号を割り当て直す回数の上限（超えた場合は 409 を返す）
+SESSION_SAVE_MAX_ATTEMPTS = 5
+# 復号化用にコンパイルしたマッピングをキャッシュするセッション数（LRU）
+DEANONYMIZER_CACHE_SESSIONS = 1024
+
+# --- Analyzer スナップショット設定 ---
+# 構築済みの AnalyzerEngine をディスクに保存し、次回以降の起動を高速化します
+# 設定やRecognizerの定義が変わるとフィンガープリントが変わり、自動的に再構築されます
+USE_ANALYZER_SNAPSHOT = True
+# スナップショットの保存先（相対パスの場合はリポジトリルートからのパス）
+ANALYZER_SNAPSHOT_DIR = ".cache/analyzer"
+
+# --- フォーム形式の行の高速処理（redactor.form_fields） ---
+# True の場合、"氏名: 山田太郎" のような行のうち、ラベルが CONTEXT_WORDS の単語を含む行は spaCy を使わずに分析する
+# （ラベルからエンティティタイプを判定し、値を正規表現の Recognizer で分類する）
+# NER のタイプを含む範囲に基づく評価で、無効の場合に検出できた範囲を失わないことを確認済み（README 参照）
+FORM_FIELD_FAST_PATH = True
+# ラベルが示すタイプの値全体をエンティティとして検出するタイプ（正規表現では検出できないもの）
+FORM_FIELD_VALUE_ENTITIES = ["PERSON", "ORG", "ORGANIZATION", "LOCATION"]
+# 値全体を検出した場合のスコア
+FORM_FIELD_SCORE = 0.9
+# 値全体を検出する値の最大文字数（これより長い値の行は通常どおり分析する）
+FORM_FIELD_MAX_VALUE_LENGTH = 64
+# CONTEXT_WORDS 以外にラベルとして認識する単語とエンティティタイプ
+FORM_FIELD_EXTRA_LABELS = {
+    "メールアドレス": "EMAIL_ADDRESS",
+    "メール": "EMAIL_ADDRESS",
+    "Email": "EMAIL_ADDRESS",
+    "E-mail": "EMAIL_ADDRESS",
+}
+# True の場合、Markdown の表・CSV を列単位で分析する（見出しと見本のセルから列のエンティティタイプを判定する。FORM_FIELD_FAST_PATH が有効な場合のみ）
+# 範囲に基づく評価で FORM_FIELD_FAST_PATH とあわせて再現率が下がらないことを確認済み（README 参照）
+TABLE_AWARE = True
+# 見出しが対応しない列のタイプを判定するために分析するセル数
+TABLE_SAMPLE_CELLS = 8
+# 見本のセルのうち、この割合以上が同じタイプと判定された場合に列全体をそのタイプとする
+TABLE_COLUMN_MIN_RATIO = 0.6
+
 # --- 検出設定 ---
 
 # 検出の閾値 (0.0 - 1.0)
@@ -53,6 +149,11 @@ ALLOW_LIST = [
     "Username",
 ]
 
+# カスタム PatternRecognizer を 1 つの Recognizer にまとめて実行するかどうか
+# True: MultiPatternRecognizer で全パターンを一括評価（Recognizer ごとのオーバーヘッドを削減）
+# False: PatternRecognizer を個別に登録（従来の動作）
+USE_COMBINED_PATTERN_SCANNER = True
+
 # --- カスタム Recognizer のスコア設定 ---
 # コンテキストなしのベーススコアを低めに設定し、コンテキストベースの動的調整を重視
 JP_PHONE_SCORE = 0.65  # コンテキストなしのベーススコアを下げ、周辺単語での底上げを狙う
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+負荷試験・スケーリング測定用の合成コーパス生成スクリプト
+
+test_md の生成スクリプト（generate_test_docs.py・generate_additional_docs.py）のテンプレートを元に、
+シード付きの乱数で任意の数・大きさ（1KB〜数百MB）の文書と、N 件のレコードの CRM エクスポートを生成します。
+文書ごとに、挿入したすべての PII の正解の範囲を JSONL（<文書名>.spans.jsonl、形式は redactor.annotations）に書き出します。
+
+- テンプレートの "ラベル: 値" の行のうち、ラベルが SLOT_LABELS にある行をスロットとし、値を生成した値に置き換えます。
+  SLOT_LABELS はテンプレートの値を確認して作成した一覧で、ラベルの単語からタイプを推定する form_fields の対応表とは
+  独立しています（同じ対応表で正解を作ると、フォームの高速処理が正解と同じ判定をするため再現率が高く出ます）。
+- それ以外の行（SLOT_LABELS にないラベルの行を含む）は地の文として使用します。テンプレートの元の PII
+  （スロットの値・その姓・正規表現で分かる値・鍵や証明書の本文）を含む行は使用しません。
+  ラベルのない行に書かれた、スロットにない人名などは注釈されずに残る場合があります。
+- PII の密度（1,000 文字あたりの PII の数）を指定した場合は、スロットの行を省略・追加して密度を揃えます。
+
+同じシードと引数からは同じコーパスが生成されます（文書ごとに独立した乱数を使用）。
+"""
+
+import importlib.util
+import random
+import re
+import string
+import sys
+import warnings
+from pathlib import Path
+
+# パスを追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from redactor.evaluate import extract_pii_patterns
+from redactor.annotations import dump_span, spans_path
+
+TEMPLATE_SCRIPTS = ("generate_test_docs.py", "generate_additional_docs.py")
+DOCUMENT_SEPARATOR = "\n---\n"
+# PII の密度を指定した場合に、テンプレート 1 つ分の文書に追加するスロットの行の上限
+MAX_SLOT_WRITES_PER_TEMPLATE = 1000
+
+# 注釈できない PII（証明書・鍵の本文など、SECRET_KEY・CERTIFICATE として検出される長い文字列）
+_UNANNOTATED_PII = re.compile(r'[a-zA-Z0-9\-_/+=.]{32,}|-----(?:BEGIN|END) ')
+_SIZE_UNITS = {"": 1, "B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+# テンプレートの "ラベル: 値" の行（箇条書き・番号付きリスト・太字のラベルを含む）
+_TEMPLATE_FIELD = re.compile(
+    r'^[ \t]*(?:[-*+][ \t]+|\d+[.)][ \t]+)?(?:\*\*)?(?P<label>[^\s:：|*#`>][^:：|`\n]{0,30}?)(?:\*\*)?'
+    r'[ \t　]*[:：](?:\*\*)?[ \t　]*(?P<value>\S[^\n]*?)[ \t　\r]*$',
+    re.MULTILINE,
+)
+
+# スロットとするラベル（完全一致）とエンティティタイプ。テンプレートで値がそのタイプの PII だけであるラベルを列挙しています
+SLOT_LABELS = {
+    **dict.fromkeys([
+        "氏名", "保護者氏名", "配偶者氏名", "旧氏名", "代表取締役", "代表者", "副代表", "研究代表者", "売主代表",
+        "担当者", "顧客担当者", "受付担当者", "担当教員", "担当営業", "カード会員",
+    ], "PERSON"),
+    **dict.fromkeys([
+        "会社名", "企業名", "保険会社", "管理会社", "保証会社", "依頼人名", "受取人名", "所属機関",
+    ], "ORG"),
+    **dict.fromkeys(["住所", "現住所", "所在地", "本店所在地", "株主住所", "物件所在地", "本籍"], "LOCATION"),
+    **dict.fromkeys([
+        "電話", "電話番号", "携帯", "TEL", "連絡先", "保護者電話", "保護者連絡先", "学生携帯",
+    ], "PHONE_NUMBER"),
+    **dict.fromkeys(["メール", "メールアドレス", "Email"], "EMAIL_ADDRESS"),
+    "カード番号": "CREDIT_CARD",
+    "マイナンバー": "MY_NUMBER",
+    "免許証番号": "DRIVERS_LICENSE",
+    "パスポート番号": "PASSPORT",
+    "旅券番号（旧）": "PASSPORT",
+    "口座番号": "BANK_ACCOUNT",
+    "納税者番号": "TAX_NUMBER",
+    "法人番号": "TAX_NUMBER",
+    "パスワード": "PASSWORD",
+    "Password": "PASSWORD",
+    "API Key": "SECRET_KEY",
+    "Secret Key": "SECRET_KEY",
+    "キャッシュカード暗証番号": "PIN",
+}
+
+# (姓, ローマ字)
+SURNAMES = [
+    ("佐藤", "sato"), ("鈴木", "suzuki"), ("高橋", "takahashi"), ("田中", "tanaka"), ("伊藤", "ito"),
+    ("渡辺", "watanabe"), ("山本", "yamamoto"), ("中村", "nakamura"), ("小林", "kobayashi"), ("加藤", "kato"),
+    ("吉田", "yoshida"), ("山田", "yamada"), ("佐々木", "sasaki"), ("山口", "yamaguchi"), ("松本", "matsumoto"),
+    ("井上", "inoue"), ("木村", "kimura"), ("清水", "shimizu"), ("森田", "morita"), ("石川", "ishikawa"),
+]
+# (名, ローマ字)
+GIVEN_NAMES = [
+    ("太郎", "taro"), ("花子", "hanako"), ("一郎", "ichiro"), ("美咲", "misaki"), ("健太", "kenta"),
+    ("直子", "naoko"), ("翔太", "shota"), ("陽菜", "hina"), ("大輔", "daisuke"), ("さくら", "sakura"),
+    ("拓也", "takuya"), ("結衣", "yui"), ("誠", "makoto"), ("愛", "ai"), ("浩二", "koji"), ("真由美", "mayumi"),
+]
+COMPANY_STEMS = [
+    "テクノソリューションズ", "グローバル商事", "山田製作所", "東都物産", "未来システム",
+    "青葉建設", "北斗電機", "桜川食品", "みなと不動産", "ひかり証券",
+]
+# (都道府県, 市区町村, 町名)
+ADDRESSES = [
+    ("東京都", "渋谷区", "神宮前"), ("東京都", "港区", "六本木"), ("大阪府", "大阪市北区", "梅田"),
+    ("神奈川県", "横浜市西区", "みなとみらい"), ("愛知県", "名古屋市中区", "栄"), ("福岡県", "福岡市博多区", "博多駅前"),
+    ("北海道", "札幌市中央区", "大通西"), ("京都府", "京都市中京区", "烏丸"), ("埼玉県", "さいたま市大宮区", "桜木町"),
+]
+EMAIL_DOMAINS = ["mail.example.jp", "corp.example.co.jp", "example.ne.jp", "example.org"]
+# CRM の備考（{person} は人名に置き換える）
+CRM_NOTES = [
+    "来週フォロー予定", "見積もり送付済み", "{person}さんから紹介", "特になし", "契約更新の打診あり",
+    "{person}さんに請求書を送付", "展示会で名刺交換", "-",
+]
+CRM_COLUMNS = ["顧客ID", "企業名", "担当者", "電話番号", "メールアドレス", "住所", "年間売上", "備考"]
+
+
+def parse_size(value):
+    """"500MB"・"4KB"・"1024" などの大きさをバイト数で返します。"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*', value.upper())
+    if not match or match.group(2) not in _SIZE_UNITS:
+        raise ValueError(f"大きさの形式が不正です: {value}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+def _luhn_complete(digits):
+    """Luhn のチェックディジットを付けた数字列を返します。"""
+    total = 0
+    for i, char in enumerate(reversed(digits)):
+        digit = int(char)
+        if i % 2 == 0:
+            digit = digit * 2 - 9 if digit > 4 else digit * 2
+        total += digit
+    return digits + str((10 - total % 10) % 10)
+
+
+def _my_number(rng):
+    """チェックディジットが正しい 12 桁の個人番号を返します。"""
+    digits = "".join(rng.choice(string.digits) for _ in range(11))
+    total = sum(int(digit) * (n + 1 if n <= 6 else n - 5) for n, digit in enumerate(reversed(digits), 1))
+    remainder = total % 11
+    return digits + str(0 if remainder <= 1 else 11 - remainder)
+
+
+class ValueFactory:
+    """エンティティタイプごとの値を、シード付きの乱数で生成します。"""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def digits(self, count):
+        return "".join(self.rng.choice(string.digits) for _ in range(count))
+
+    def person(self):
+        return self.rng.choice(SURNAMES)[0] + self.rng.choice(GIVEN_NAMES)[0]
+
+    def organization(self):
+        stem = self.rng.choice(COMPANY_STEMS)
+        return f"株式会社{stem}" if self.rng.random() < 0.5 else f"{stem}株式会社"
+
+    def location(self):
+        prefecture, city, town = self.rng.choice(ADDRESSES)
+        return f"{prefecture}{city}{town}{self.rng.randint(1, 9)}-{self.rng.randint(1, 30)}-{self.rng.randint(1, 20)}"
+
+    def phone_number(self):
+        if self.rng.random() < 0.5:
+            return f"0{self.rng.choice('789')}0-{self.digits(4)}-{self.digits(4)}"
+        return f"0{self.rng.randint(3, 6)}-{self.digits(4)}-{self.digits(4)}"
+
+    def email_address(self):
+        surname = self.rng.choice(SURNAMES)[1]
+        given = self.rng.choice(GIVEN_NAMES)[1]
+        return f"{given}.{surname}{self.rng.randint(1, 99)}@{self.rng.choice(EMAIL_DOMAINS)}"
+
+    def credit_card(self):
+        number = _luhn_complete("4" + self.digits(14))
+        return "-".join(number[i:i + 4] for i in range(0, 16, 4))
+
+    def password(self):
+        alphabet = string.ascii_letters + string.digits + "!#$%&"
+        return "".join(self.rng.choice(alphabet) for _ in range(12))
+
+    def secret_key(self):
+        alphabet = string.ascii_letters + string.digits
+        return f"sk_live_{''.join(self.rng.choice(alphabet) for _ in range(24))}"
+
+    def value(self, entity_type):
+        """entity_type の値を返します。生成できないタイプの場合は None を返します。"""
+        generator = _GENERATORS.get(entity_type)
+        return generator(self) if generator is not None else None
+
+
+_GENERATORS = {
+    "PERSON": ValueFactory.person,
+    "ORG": ValueFactory.organization,
+    "ORGANIZATION": ValueFactory.organization,
+    "LOCATION": ValueFactory.location,
+    "PHONE_NUMBER": ValueFactory.phone_number,
+    "EMAIL_ADDRESS": ValueFactory.email_address,
+    "CREDIT_CARD": ValueFactory.credit_card,
+    "MY_NUMBER": lambda factory: _my_number(factory.rng),
+    "DRIVERS_LICENSE": lambda factory: factory.digits(12),
+    "PASSPORT": lambda factory: factory.rng.choice(["TK", "TR", "MZ"]) + factory.digits(7),
+    "BANK_ACCOUNT": lambda factory: factory.digits(7),
+    "TAX_NUMBER": lambda factory: "T" + factory.digits(13),
+    "PASSWORD": ValueFactory.password,
+    "SECRET_KEY": ValueFactory.secret_key,
+    "SECURITY_CODE": lambda factory: factory.digits(3),
+    "PIN": lambda factory: factory.digits(4),
+}
+
+
+class Template:
+    """
+    テンプレート 1 つ分の行。lines は ("text", 行) または ("slot", 値の前, エンティティタイプ, 値の後) のリストです。
+    """
+
+    def __init__(self, name, lines):
+        self.name = name
+        self.lines = lines
+        self.slots = [line for line in lines if line[0] == "slot"]
+
+
+def parse_template(name, content, slot_labels=None):
+    """
+    テンプレートの文書をスロットの行と地の文の行に分けます。
+    slot_labels（ラベル → エンティティタイプ、省略時は SLOT_LABELS）にないラベルの行は地の文として扱います。
+    """
+    slot_labels = SLOT_LABELS if slot_labels is None else slot_labels
+    fields = {}  # 行の開始位置 -> (エンティティタイプ, 値の開始位置, 値の終了位置)
+    for match in _TEMPLATE_FIELD.finditer(content):
+        entity_type = slot_labels.get(match.group("label").strip())
+        if entity_type is not None:
+            fields[match.start()] = (entity_type, *match.span("value"))
+
+    # テンプレートの元の PII（スロットの値と人名の姓、正規表現で分かる値）
+    originals = set()
+    for entity_type, value_start, value_end in fields.values():
+        value = content[value_start:value_end]
+        originals.add(value)
+        if entity_type == "PERSON":
+            # "外為課 田中太郎" のように肩書きが付く値は、最後の語を人名とする
+            name = value.split()[-1]
+            originals.update(part for part in (name, name[:2]) if len(part) >= 2)
+    for values in extract_pii_patterns(content).values():
+        originals.update(values)
+    originals.discard("")
+
+    lines = []
+    position = 0
+    for line in content.splitlines(keepends=True):
+        field = fields.get(position)
+        if field is not None and field[0] in _GENERATORS:
+            entity_type, value_start, value_end = field
+            lines.append((
+                "slot",
+                content[position:value_start],
+                entity_type,
+                content[value_end:position + len(line)],
+            ))
+        elif field is None and not _UNANNOTATED_PII.search(line) and not any(value in line for value in originals):
+            lines.append(("text", line))
+        position += len(line)
+    return Template(name, lines)
+
+
+def load_templates(template_dir=None):
+    """test_md の生成スクリプトのテンプレートを読み込み、Template のリスト（テンプレート番号順）を返します。"""
+    template_dir = Path(template_dir) if template_dir else Path(__file__).resolve().parent.parent / "test_md"
+    templates = {}
+    for script in TEMPLATE_SCRIPTS:
+        path = template_dir / script
+        if not path.exists():
+            continue
+        spec = importlib.util.spec_from_file_location(path.stem, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        templates.update(module.templates)
+    return [parse_template(info["name"], info["content"]) for _, info in sorted(templates.items())]
+
+
+class SpanWriter:
+    """テキストを書き込みながら、PII の範囲を JSONL に書き出します（位置は文字単位）。"""
+
+    def __init__(self, text_file, spans_file):
+        self.text_file = text_file
+        self.spans_file = spans_file
+        self.position = 0
+        self.bytes = 0
+        self.spans = 0
+
+    def write(self, text):
+        self.text_file.write(text)
+        self.position += len(text)
+        self.bytes += len(text.encode('utf-8'))
+
+    def write_entity(self, entity_type, value):
+        dump_span(self.spans_file, self.position, self.position + len(value), entity_type)
+        self.spans += 1
+        self.write(value)
+
+
+def max_pii_density(slot_pool):
+    """
+    スロットの行だけで文書を作った場合の、1,000 文字あたりの PII の数（目安）を返します。
+    値の長さは乱数で変わるため、固定のシードで生成した値で行の平均の長さを求めます。
+    """
+    if not slot_pool:
+        return 0.0
+    factory = ValueFactory(random.Random(0))
+    chars = 0
+    for _, prefix, entity_type, suffix in slot_pool:
+        chars += len(prefix) + len(factory.value(entity_type)) + len(suffix if suffix.endswith("\n") else suffix + "\n")
+    return 1000 * len(slot_pool) / chars
+
+
+def write_template_instance(writer, template, factory, slot_pool, density=None):
+    """
+    テンプレートの文書を 1 つ書き込みます。
+    density（1,000 文字あたりの PII の数）を指定した場合は、文書全体の密度が目標を超える間はスロットの行を省略し、
+    下回る間は slot_pool のスロットの行を追加します。追加する行が MAX_SLOT_WRITES_PER_TEMPLATE に達した場合は、
+    警告して追加をやめます（地の文の行があるため、目標が max_pii_density に近いと密度が目標に届かないことがあります）。
+    """
+    def below_target():
+        return writer.spans < density * writer.position / 1000
+
+    added = 0
+    for line in template.lines:
+        if density is not None and line[0] == "text":
+            # 地の文の前に、目標の密度に達するまでスロットの行を追加する
+            while below_target() and added < MAX_SLOT_WRITES_PER_TEMPLATE:
+                _write_slot(writer, factory.rng.choice(slot_pool), factory)
+                added += 1
+                if added == MAX_SLOT_WRITES_PER_TEMPLATE:
+                    warnings.warn(
+                        f"PII の密度 {density} に達しないため、テンプレート {template.name} へのスロットの行の追加を"
+                        f" {MAX_SLOT_WRITES_PER_TEMPLATE} 行で打ち切りました（現在の密度 {1000 * writer.spans / writer.position:.1f}）"
+                    )
+        if line[0] == "text":
+            writer.write(line[1])
+        elif density is None or below_target():
+            _write_slot(writer, line, factory)
+
+
+def _write_slot(writer, line, factory):
+    _, prefix, entity_type, suffix = line
+    writer.write(prefix)
+    writer.write_entity(entity_type, factory.value(entity_type))
+    writer.write(suffix if suffix.endswith("\n") else suffix + "\n")
+
+
+def write_document(text_file, spans_file, templates, rng, size=None, density=None):
+    """
+    テンプレートをランダムに選んで文書を書き込み、(文字数, PII の数) を返します。
+    size（バイト数）を指定した場合は、大きさに達するまでテンプレートの文書を "---" で区切って連結します。
+    """
+    writer = SpanWriter(text_file, spans_file)
+    factory = ValueFactory(rng)
+    slot_pool = [slot for template in templates for slot in template.slots]
+    write_template_instance(writer, rng.choice(templates), factory, slot_pool, density)
+    while size is not None and writer.bytes < size:
+        writer.write(DOCUMENT_SEPARATOR)
+        write_template_instance(writer, rng.choice(templates), factory, slot_pool, density)
+    return writer.position, writer.spans
+
+
+def write_crm_export(text_file, spans_file, records, rng, format="blocks"):
+    """
+    N 件のレコードの CRM エクスポートを書き込み、(文字数, PII の数) を返します。
+    format は "blocks"（test_doc_85 と同じ "---" 区切りのレコード）・"table"（Markdown の表）・"csv" です。
+    """
+    writer = SpanWriter(text_file, spans_file)
+    factory = ValueFactory(rng)
+    if format == "csv":
+        writer.write(",".join(CRM_COLUMNS) + "\n")
+    elif format == "table":
+        writer.write("# CRMデータエクスポート\n\n| " + " | ".join(CRM_COLUMNS) + " |\n|" + "---|" * len(CRM_COLUMNS) + "\n")
+    else:
+        writer.write(f"# CRMデータエクスポート\n\n## エクスポート情報\n- レコード数: {records:,}件\n\n## レコード\n")
+
+    for index in range(records):
+        note = rng.choice(CRM_NOTES)
+        cells = [
+            (None, f"C-{100000 + index}"),
+            ("ORG", factory.organization()),
+            ("PERSON", factory.person()),
+            ("PHONE_NUMBER", factory.phone_number()),
+            ("EMAIL_ADDRESS", factory.email_address()),
+            ("LOCATION", factory.location()),
+            (None, f"¥{rng.randint(1, 500) * 1000000:,}"),
+        ]
+        if format == "blocks":
+            if index:
+                writer.write("\n---\n\n")
+            for column, (entity_type, value) in zip(CRM_COLUMNS, cells):
+                writer.write(f"{column}: ")
+                _write_value(writer, entity_type, value)
+                writer.write("\n")
+            writer.write("備考: ")
+            _write_note(writer, note, factory)
+            writer.write("\n")
+            continue
+
+        separator = "," if format == "csv" else " | "
+        writer.write("" if format == "csv" else "| ")
+        for column, (entity_type, value) in enumerate(cells):
+            if format == "csv" and "," in value:
+                writer.write('"')
+                _write_value(writer, entity_type, value)
+                writer.write('"')
+            else:
+                _write_value(writer, entity_type, value)
+            writer.write(separator)
+        _write_note(writer, note, factory)
+        writer.write("\n" if format == "csv" else " |\n")
+    return writer.position, writer.spans
+
+
+def _write_value(writer, entity_type, value):
+    if entity_type is None:
+        writer.write(value)
+    else:
+        writer.write_entity(entity_type, value)
+
+
+def _write_note(writer, note, factory):
+    """備考を書き込みます（{person} は生成した人名の PII とします）。"""
+    before, marker, after = note.partition("{person}")
+    writer.write(before)
+    if marker:
+        writer.write_entity("PERSON", factory.person())
+    writer.write(after)
+
+
+def generate_corpus(output_dir, documents=100, seed=0, size=None, density=None, crm_records=None, crm_format="blocks", templates=None):
+    """
+    合成コーパスを output_dir に書き出し、(文書数, 文字数, PII の数) を返します。
+    crm_records を指定した場合は、CRM エクスポートを documents 件生成します。
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if crm_records is None:
+        templates = templates or load_templates()
+        if not templates:
+            raise ValueError("テンプレートが見つかりません（test_md の生成スクリプトを確認してください）")
+        if density is not None:
+            limit = max_pii_density([slot for template in templates for slot in template.slots])
+            if density > limit:
+                raise ValueError(f"PII の密度 {density} は、スロットの行だけで到達できる密度（約 {limit:.1f}）を超えています")
+    suffix = ".csv" if crm_records is not None and crm_format == "csv" else ".md"
+
+    total_chars = 0
+    total_spans = 0
+    for index in range(documents):
+        # 文書ごとに独立した乱数を使用し、文書数を変えても同じ番号の文書は同じ内容にする
+        rng = random.Random(f"{seed}:{index}")
+        name = f"synthetic_crm_{index:05d}" if crm_records is not None else f"synthetic_{index:05d}"
+        document_path = output_dir / f"{name}{suffix}"
+        with open(document_path, 'w', encoding='utf-8', newline='') as text_file, \
+                open(spans_path(document_path), 'w', encoding='utf-8') as spans_file:
+            if crm_records is not None:
+                chars, spans = write_crm_export(text_file, spans_file, crm_records, rng, crm_format)
+            else:
+                chars, spans = write_document(text_file, spans_file, templates, rng, size, density)
+        total_chars += chars
+        total_spans += spans
+    return documents, total_chars, total_spans
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="負荷試験・スケーリング測定用の合成コーパスの生成")
+    parser.add_argument("--output", type=str, help="出力先ディレクトリ", default="synthetic")
+    parser.add_argument("--documents", type=int, help="生成する文書数", default=100)
+    parser.add_argument("--seed", type=int, help="乱数のシード", default=0)
+    parser.add_argument("--size", type=str, help="文書ごとの大きさ（例: 4KB, 10MB, 500MB。省略時はテンプレート 1 つ分）", default=None)
+    parser.add_argument("--pii-density", type=float, help="1,000 文字あたりの PII の数（省略時はテンプレートのまま）", default=None)
+    parser.add_argument("--crm-records", type=int, help="CRM エクスポートを生成する場合のレコード数", default=None)
+    parser.add_argument("--crm-format", choices=["blocks", "table", "csv"], help="CRM エクスポートの形式", default="blocks")
+
+    args = parser.parse_args()
+
+    count, chars, spans = generate_corpus(
+        args.output,
+        documents=args.documents,
+        seed=args.seed,
+        size=parse_size(args.size) if args.size else None,
+        density=args.pii_density,
+        crm_records=args.crm_records,
+        crm_format=args.crm_format,
+    )
+    print(f"完了! {count} 個の文書（{chars} 文字、PII {spans} 件）を {args.output} に生成しました")
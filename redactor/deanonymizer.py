@@ -0,0 +1,152 @@
+"""
+トークン（<PERSON1> など）を元の値に戻す復号化処理です。
+
+マッピング（トークン → 元の値）はトライ木の形の正規表現 1 つにコンパイルし（CompiledMapping）、
+テキストを先頭から 1 回走査してすべてのトークンを置き換えます。トークンごとに str.replace を繰り返す方式
+（O(トークン数 × 文字数)）と異なり、処理時間はマッピングの大きさにほとんど依存しません。
+コンパイル結果はセッションのバージョンごとにキャッシュします（CompiledMappingCache）。
+
+LLM の応答はストリーミング（SSE など）で少しずつ届くため、トークンがチャンクの境界で分割されることがあります。
+StreamingDeanonymizer はチャンクを受け取るたびに、確定した部分を復号化してすぐに返し、
+トークンの途中かもしれない末尾（"<PHONE_NUM" など）だけを次のチャンクまで保持します。
+"""
+
+import re
+from collections import OrderedDict
+
+try:
+    from . import config
+except ImportError:
+    import config
+
+
+def _trie_pattern(tokens):
+    """
+    トークンをトライ木にまとめた正規表現を返します（例: <(?:PERSON(?:1(?:0>|>)|2>)|EMAIL_ADDRESS1>)）。
+    共通の接頭辞を 1 回だけ照合するため、トークン数が多くても 1 文字あたりの照合は木の深さ程度で済みます。
+    あるトークンが別のトークンの接頭辞の場合は、長い方を優先します。
+    """
+    trie = {}
+    for token in tokens:
+        node = trie
+        for char in token:
+            node = node.setdefault(char, {})
+        node[None] = True  # トークンの終端
+
+    def build(node):
+        chars = sorted(char for char in node if char is not None)
+        branches = [re.escape(char) + build(node[char]) for char in chars]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if None in node:
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+class CompiledMapping:
+    """マッピングをコンパイルした復号化器。テキストを 1 回走査してトークンを元の値に置き換えます。"""
+
+    def __init__(self, mapping):
+        self.mapping = dict(mapping)
+        tokens = [token for token in self.mapping if token]
+        self._pattern = re.compile(_trie_pattern(tokens)) if tokens else None
+        self._prefixes = None
+
+    def __len__(self):
+        return len(self.mapping)
+
+    @property
+    def prefixes(self):
+        """トークンの真の接頭辞の集合（StreamingDeanonymizer が末尾を保持するかの判定に使用）。"""
+        if self._prefixes is None:
+            self._prefixes = {token[:i] for token in self.mapping for i in range(1, len(token))}
+        return self._prefixes
+
+    def deanonymize(self, text):
+        """text 中のトークンを元の値に置き換えます。"""
+        if self._pattern is None:
+            return text
+        mapping = self.mapping
+        return self._pattern.sub(lambda match: mapping[match.group()], text)
+
+
+class CompiledMappingCache:
+    """
+    セッション ID ごとに、最新バージョンのマッピングのコンパイル結果を保持する LRU キャッシュです。
+    セッションのバージョン（session_store の get_version）が変わっていなければ、マッピングの取得とコンパイルを省略できます。
+    """
+
+    def __init__(self, max_sessions=None):
+        self.max_sessions = max_sessions or config.DEANONYMIZER_CACHE_SESSIONS
+        self._entries = OrderedDict()  # session_id -> (バージョン, CompiledMapping)
+
+    def get(self, session_id, version):
+        """キャッシュ済みのバージョンが version と一致する場合にコンパイル結果を返します。"""
+        entry = self._entries.get(session_id)
+        if entry is None or entry[0] != version:
+            return None
+        self._entries.move_to_end(session_id)
+        return entry[1]
+
+    def put(self, session_id, version, mapping):
+        """マッピングをコンパイルしてキャッシュし、コンパイル結果を返します。"""
+        compiled = CompiledMapping(mapping)
+        self._entries[session_id] = (version, compiled)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+        return compiled
+
+    def discard(self, session_id):
+        self._entries.pop(session_id, None)
+
+
+def deanonymize(text, mapping):
+    """テキスト中のトークンを元の値に戻します（mapping は dict または CompiledMapping）。"""
+    if not isinstance(mapping, CompiledMapping):
+        mapping = CompiledMapping(mapping)
+    return mapping.deanonymize(text)
+
+
+class StreamingDeanonymizer:
+    """
+    チャンク単位で復号化します。
+
+        stream = StreamingDeanonymizer(mapping)
+        for chunk in chunks:
+            yield stream.feed(chunk)
+        yield stream.flush()
+
+    保持するのは、マッピングのいずれかのトークンの先頭部分と一致する末尾（"<" から始まる部分）のみです。
+    mapping には dict または CompiledMapping を渡します。
+    """
+
+    def __init__(self, mapping):
+        if not isinstance(mapping, CompiledMapping):
+            mapping = CompiledMapping(mapping)
+        self.mapping = mapping
+        # トークンの途中の可能性がある文字列（"<" から始まり ">" を含まない、トークンの真の接頭辞）
+        self._prefixes = mapping.prefixes
+        self._buffer = ""
+
+    def _held_from(self, text):
+        """text の末尾のうち、次のチャンクまで保持する部分の開始位置を返します（保持しない場合は len(text)）。"""
+        start = text.rfind("<")
+        if start != -1 and text[start:] in self._prefixes:
+            return start
+        return len(text)
+
+    def feed(self, chunk):
+        """チャンクを追加し、復号化が確定した部分を返します。"""
+        text = self._buffer + chunk
+        held_from = self._held_from(text)
+        self._buffer = text[held_from:]
+        return self.mapping.deanonymize(text[:held_from])
+
+    def flush(self):
+        """ストリームの終了時に、保持している末尾を返します（トークンとして完結しなかった文字列）。"""
+        text, self._buffer = self._buffer, ""
+        return self.mapping.deanonymize(text)
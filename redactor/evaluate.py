@@ -7,20 +7,28 @@
 
 import time
 import re
+import multiprocessing
+import numpy as np
 from pathlib import Path
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 import sys
 from pathlib import Path
 
 # パスを追加
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from redactor.redactor import setup_analyzer, filter_common_words
-from presidio_analyzer import AnalyzerEngine
-from presidio_anonymizer import AnonymizerEngine
-from presidio_anonymizer.entities import OperatorConfig
+from redactor.redactor import load_analyzer, analyze_text, analyze_batch, filter_common_words, _get_mp_context
+from redactor.profiling import new_profile, merge_profile, format_profile
+from redactor.annotations import load_spans, score_spans, match_spans, ENTITY_ALIASES
+from redactor.raw_results import RawResultsBuilder, RawResults, document_hash
+from redactor.form_fields import split_form_fields, merge_form_results
+from redactor.snapshot import format_timings
+from redactor.nlp_pipeline import pipeline_components
 from redactor import config
 
+# ワーカープロセスの Analyzer（fork の場合は親プロセスで読み込んだものを引き継ぐ）
+_worker_analyzer = None
+
 def extract_pii_patterns(text):
     """
     テキストからPIIパターンを抽出して、期待されるエンティティを返す
@@ -57,53 +65,53 @@ def extract_pii_patterns(text):
     
     return expected_entities
 
-def evaluate_detection(analyzer, text, file_path):
+def evaluate_detection(analyzer, text, file_path, results=None, profile=None):
     """
     単一ファイルの検出精度を評価
+    results を渡した場合は分析を省略します（analyze_batch でまとめて分析した場合）。
+    profile に dict を渡すと、段階ごとの処理時間と件数を書き込みます。
+
+    正解の範囲の注釈（<文書名>.spans.jsonl、redactor.annotations）がある場合は、エンティティタイプごとに
+    範囲の重なりで照合します。ない場合は、extract_pii_patterns で抽出した文字列と検出した文字列を比較します。
     """
-    # 期待されるPIIを抽出
-    expected_entities = extract_pii_patterns(text)
-    
-    # 実際の検出結果を取得
-    results = analyzer.analyze(
-        text=text,
-        language='ja',
-        entities=config.TARGET_ENTITIES,
-        allow_list=config.ALLOW_LIST,
-        score_threshold=config.DEFAULT_SCORE_THRESHOLD
-    )
+    # 実際の検出結果を取得（一般的な単語のフィルタリングを含む）
+    if results is None:
+        results = analyze_text(analyzer, text, profile=profile)
     
-    # 一般的な単語のフィルタリングを適用
-    results = filter_common_words(results, text)
-    
-    # 検出結果をエンティティタイプごとに分類
-    detected_entities = defaultdict(list)
-    for result in results:
-        detected_text = text[result.start:result.end].strip()
-        detected_entities[result.entity_type].append(detected_text)
-    
-    # 精度計算
-    total_expected = sum(len(v) for v in expected_entities.values())
-    total_detected = len(results)
-    
-    # True Positive, False Positive, False Negative を計算
-    tp = 0  # True Positive: 正しく検出されたPII
-    fp = 0  # False Positive: 誤検出
-    fn = 0  # False Negative: 検出漏れ
-    
-    # 各エンティティタイプごとに評価
-    all_entity_types = set(expected_entities.keys()) | set(detected_entities.keys())
-    
-    for entity_type in all_entity_types:
-        expected = set(expected_entities.get(entity_type, []))
-        detected = set(detected_entities.get(entity_type, []))
+    spans = load_spans(file_path)
+    if spans is not None:
+        mode = 'spans'
+        total_expected = len(spans)
+        per_entity = score_spans(spans, [(r.start, r.end, r.entity_type) for r in results])
+    else:
+        mode = 'strings'
+        # 期待されるPIIを抽出
+        expected_entities = extract_pii_patterns(text)
+        total_expected = sum(len(v) for v in expected_entities.values())
+        
+        # 検出結果をエンティティタイプごとに分類
+        detected_entities = defaultdict(list)
+        for result in results:
+            detected_text = text[result.start:result.end].strip()
+            detected_entities[result.entity_type].append(detected_text)
         
-        # True Positive: 期待されるPIIが検出された
-        tp += len(expected & detected)
-        # False Positive: 検出されたが期待されていない
-        fp += len(detected - expected)
-        # False Negative: 期待されたが検出されなかった
-        fn += len(expected - detected)
+        # 各エンティティタイプごとに評価
+        per_entity = {}
+        for entity_type in set(expected_entities.keys()) | set(detected_entities.keys()):
+            expected = set(expected_entities.get(entity_type, []))
+            detected = set(detected_entities.get(entity_type, []))
+            per_entity[entity_type] = {
+                # True Positive: 期待されるPIIが検出された
+                'tp': len(expected & detected),
+                # False Positive: 検出されたが期待されていない
+                'fp': len(detected - expected),
+                # False Negative: 期待されたが検出されなかった
+                'fn': len(expected - detected),
+            }
+    
+    tp = sum(scores['tp'] for scores in per_entity.values())
+    fp = sum(scores['fp'] for scores in per_entity.values())
+    fn = sum(scores['fn'] for scores in per_entity.values())
     
     # 一般的な日本語単語の誤検知をカウント
     common_word_fp = 0
@@ -114,23 +122,202 @@ def evaluate_detection(analyzer, text, file_path):
     
     return {
         'file': file_path.name,
+        'mode': mode,
         'total_expected': total_expected,
-        'total_detected': total_detected,
+        'total_detected': len(results),
         'tp': tp,
         'fp': fp,
         'fn': fn,
+        'per_entity': per_entity,
         'common_word_fp': common_word_fp,
         'precision': tp / (tp + fp) if (tp + fp) > 0 else 0.0,
         'recall': tp / (tp + fn) if (tp + fn) > 0 else 0.0,
         'f1': 2 * tp / (2 * tp + fp + fn) if (2 * tp + fp + fn) > 0 else 0.0,
     }
 
-def evaluate_all(test_dir, limit=None):
+def merge_entity_scores(all_results, mode=None):
+    """ファイルごとのエンティティタイプ別の件数を合計します（mode を指定した場合はその照合方法のファイルのみ）。"""
+    totals = {}
+    for result in all_results:
+        if mode is not None and result['mode'] != mode:
+            continue
+        for entity_type, scores in result['per_entity'].items():
+            merged = totals.setdefault(entity_type, {})
+            for key, value in scores.items():
+                merged[key] = merged.get(key, 0) + value
+    return totals
+
+def format_entity_scores(totals):
+    """エンティティタイプ別の件数と適合率・再現率・F1 を表形式の文字列（行のリスト）にします。"""
+    show_exact = any('exact' in scores for scores in totals.values())
+    header = f"{'エンティティ':<18} {'TP':>7} {'FP':>7} {'FN':>7} {'適合率':>8} {'再現率':>8} {'F1':>8}"
+    lines = [header + (f" {'完全一致':>8}" if show_exact else "")]
+    for entity_type, scores in sorted(totals.items(), key=lambda item: -(item[1]['tp'] + item[1]['fn'])):
+        tp, fp, fn = scores['tp'], scores['fp'], scores['fn']
+        precision = tp / (tp + fp) if (tp + fp) > 0 else 0.0
+        recall = tp / (tp + fn) if (tp + fn) > 0 else 0.0
+        f1 = 2 * tp / (2 * tp + fp + fn) if (2 * tp + fp + fn) > 0 else 0.0
+        line = f"{entity_type:<18} {tp:>7} {fp:>7} {fn:>7} {precision * 100:>7.2f}% {recall * 100:>7.2f}% {f1 * 100:>7.2f}%"
+        if show_exact:
+            line += f" {scores.get('exact', 0):>8}"
+        lines.append(line)
+    return lines
+
+def _slowest_parts(profile, count=3):
+    """プロファイルから処理時間の長い Recognizer・パターンを返します（ファイルごとの詳細用）。"""
+    parts = [
+        (key, stats['seconds'])
+        for section in ('recognizers', 'patterns')
+        for key, stats in profile[section].items()
+    ]
+    parts.sort(key=lambda item: -item[1])
+    return parts[:count]
+
+def _entity_score_sections(all_results):
+    """照合方法ごとのエンティティタイプ別の集計を、表示用の行のリストで返します。"""
+    lines = []
+    for mode, title in (('spans', "正解の範囲（*.spans.jsonl）との重なりで照合"), ('strings', "抽出した文字列との比較で照合")):
+        files = sum(1 for result in all_results if result['mode'] == mode)
+        if files:
+            lines.append(f"\nエンティティタイプ別: {title}（{files} ファイル）")
+            lines.extend("  " + line for line in format_entity_scores(merge_entity_scores(all_results, mode)))
+    return lines
+
+# 閾値の設定（name: 表示名、threshold: 全体の閾値、entity_thresholds: エンティティタイプ別の閾値）
+ScoreSetting = namedtuple("ScoreSetting", ["name", "threshold", "entity_thresholds"])
+
+def parse_score_setting(value):
+    """
+    "0.7" や "0.7,PERSON=0.9,PHONE_NUMBER=0.6" の形式の文字列を ScoreSetting にします。
+    先頭の数値が全体の閾値（DEFAULT_SCORE_THRESHOLD に相当）、"タイプ=数値" がエンティティタイプ別の閾値です。
+    """
+    threshold = config.DEFAULT_SCORE_THRESHOLD
+    entity_thresholds = {}
+    for part in value.split(","):
+        part = part.strip()
+        if "=" in part:
+            entity_type, score = part.split("=", 1)
+            entity_thresholds[entity_type.strip()] = float(score)
+        elif part:
+            threshold = float(part)
+    return ScoreSetting(value, threshold, entity_thresholds)
+
+def analyze_unthresholded(analyzer, text, explain=False):
     """
-    すべてのテストファイルを評価
+    閾値を適用せずにテキストを分析し、filter_common_words を適用する前の検出結果を返します（閾値のスイープ用）。
+
+    Presidio は閾値による除外の後に重複除去（同じタイプで包含され、スコアが同じか低い結果を除外）と
+    allow_list の除外を行います。重複除去で残る結果は閾値を上げても残るか、包含する結果と同時に除外されるため、
+    この結果に後から閾値を適用すると、その閾値で分析した結果と一致します。
+    explain が True の場合は判定過程（analysis_explanation: コンテキストによる補正前のスコアなど）を残します。
+
+    FORM_FIELD_FAST_PATH が有効な場合は、analyze_text と同じく split_form_fields で高速処理した値を除いたテキストを
+    閾値なしで分析し、高速処理の検出結果を加えます。高速処理する行は DEFAULT_SCORE_THRESHOLD で決まるため、
+    DEFAULT_SCORE_THRESHOLD 以外の閾値の結果は、高速処理する行も含めてその閾値で分析した結果とは一致しないことがあります。
+    """
+    form = split_form_fields(analyzer, text) if config.FORM_FIELD_FAST_PATH else None
+    results = analyzer.analyze(
+        text=form.free_text if form is not None else text,
+        language='ja',
+        entities=config.TARGET_ENTITIES,
+        allow_list=config.ALLOW_LIST,
+        score_threshold=0.0,
+        return_decision_process=explain,
+    )
+    return merge_form_results(form, results) if form is not None else results
+
+def apply_score_setting(results, text, setting):
+    """analyze_unthresholded の結果に閾値の設定を適用し、誤検知フィルタを適用した検出結果を返します。"""
+    kept = [
+        r for r in results
+        if r.score >= setting.entity_thresholds.get(r.entity_type, setting.threshold)
+    ]
+    return filter_common_words(kept, text)
+
+def _evaluate_file(analyzer, md_file, profile=False):
+    """1 ファイルを分析・評価します（処理時間は analyze_text のみ、正解データの抽出は含めない）。"""
+    with open(md_file, 'r', encoding='utf-8') as f:
+        text = f.read()
+    file_profile = {} if profile else None
+    start_time = time.perf_counter()
+    results = analyze_text(analyzer, text, profile=file_profile)
+    processing_time = time.perf_counter() - start_time
+    result = evaluate_detection(analyzer, text, md_file, results=results)
+    result['processing_time'] = processing_time
+    if profile:
+        result['profile'] = file_profile
+    return result
+
+def _sweep_file(analyzer, md_file, settings):
+    """
+    1 ファイルを 1 回だけ分析し、閾値の設定ごとの評価結果のリストを返します。
+    processing_time は分析の処理時間、scoring_time は設定ごとの閾値の適用・誤検知フィルタ・照合の処理時間です。
+    """
+    with open(md_file, 'r', encoding='utf-8') as f:
+        text = f.read()
+    start_time = time.perf_counter()
+    raw_results = analyze_unthresholded(analyzer, text)
+    processing_time = time.perf_counter() - start_time
+    outcomes = []
+    for setting in settings:
+        start_time = time.perf_counter()
+        result = evaluate_detection(analyzer, text, md_file, results=apply_score_setting(raw_results, text, setting))
+        result['scoring_time'] = time.perf_counter() - start_time
+        result['processing_time'] = processing_time
+        outcomes.append(result)
+    return outcomes
+
+def _raw_file(analyzer, md_file):
+    """1 ファイルを閾値なしで分析し、(内容のハッシュ, 判定過程を含む検出結果) を返します（--raw-cache の作成用）。"""
+    with open(md_file, 'r', encoding='utf-8') as f:
+        text = f.read()
+    return document_hash(text), analyze_unthresholded(analyzer, text, explain=True)
+
+def _init_eval_worker():
+    """ワーカープロセスの Analyzer を読み込みます（fork の場合は親プロセスのものを使用）。"""
+    global _worker_analyzer
+    if _worker_analyzer is None:
+        _worker_analyzer = load_analyzer()
+
+def _file_task(task):
+    """(関数, ファイル, 引数) を実行し、(ファイル, 関数の戻り値, エラー) を返します。"""
+    function, md_file, args = task
+    try:
+        return md_file, function(_worker_analyzer, md_file, *args), None
+    except Exception as e:
+        return md_file, None, str(e)
+
+def _run_files(analyzer, md_files, function, args=(), workers=1):
+    """
+    ファイルごとに function(analyzer, ファイル, *args) を実行し、(ファイル, 戻り値, エラー) を入力順に yield します
+    （_evaluate_file・_sweep_file・_raw_file）。
+    workers が 2 以上の場合は、ワーカーごとに Analyzer を持つ複数プロセスで並列に実行します。
+    """
+    global _worker_analyzer
+    tasks = [(function, md_file, args) for md_file in md_files]
+    if workers <= 1:
+        _worker_analyzer = analyzer
+        yield from map(_file_task, tasks)
+        return
+    ctx = _get_mp_context()
+    if ctx.get_start_method() == "fork":
+        # fork 前にモジュール変数へ設定しておくことで子プロセスへ引き継ぐ
+        _worker_analyzer = analyzer
+    chunksize = max(1, min(16, len(tasks) // (workers * 4)))
+    with ctx.Pool(processes=workers, initializer=_init_eval_worker) as pool:
+        yield from pool.imap(_file_task, tasks, chunksize=chunksize)
+
+def evaluate_all(test_dir, limit=None, batch_size=1, profile=False, pattern="*.md", workers=1):
+    """
+    すべてのテストファイル（pattern に一致するファイル）を評価
+    batch_size が 2 以上の場合は analyze_batch でまとめて分析し、
+    ファイルごとの処理時間はバッチの処理時間をファイル数で割った値とします。
+    workers が 2 以上の場合はファイルを複数プロセス（ワーカーごとの Analyzer）で並列に評価します。
+    総処理時間はファイルごとの処理時間の合計で、経過時間（壁時計）は wall_time に返します。
+    profile が True の場合は Recognizer・フィルタ段階ごとの処理時間と件数を集計します。
     """
     test_path = Path(test_dir)
-    md_files = sorted(list(test_path.glob("*.md")))
+    md_files = sorted(list(test_path.glob(pattern)))
     
     if limit:
         md_files = md_files[:limit]
@@ -140,33 +327,62 @@ def evaluate_all(test_dir, limit=None):
     
     # Analyzerを初期化
     print("Analyzerを初期化中...")
-    analyzer = setup_analyzer()
+    startup_timings = {}
+    analyzer = load_analyzer(timings=startup_timings)
+    print(f"起動時間: {format_timings(startup_timings)}")
     
     # 評価結果を格納
     all_results = []
     total_processing_time = 0
+    total_profile = new_profile() if profile else None
     
     # 各ファイルを評価
-    for i, md_file in enumerate(md_files, 1):
-        try:
-            with open(md_file, 'r', encoding='utf-8') as f:
-                text = f.read()
-            
-            # 処理時間を測定
-            start_time = time.time()
-            result = evaluate_detection(analyzer, text, md_file)
-            processing_time = time.time() - start_time
-            total_processing_time += processing_time
-            
-            result['processing_time'] = processing_time
+    wall_start = time.perf_counter()
+    if batch_size <= 1:
+        for i, (md_file, result, error) in enumerate(_run_files(analyzer, md_files, _evaluate_file, (profile,), workers), 1):
+            if error is not None:
+                print(f"エラー ({md_file.name}): {error}")
+                continue
+            total_processing_time += result['processing_time']
+            if profile:
+                merge_profile(total_profile, result['profile'])
             all_results.append(result)
             
             if i % 10 == 0:
                 print(f"処理済み: {i}/{len(md_files)} ファイル")
-        
-        except Exception as e:
-            print(f"エラー ({md_file.name}): {e}")
-            continue
+    else:
+        for offset in range(0, len(md_files), batch_size):
+            chunk = []
+            for md_file in md_files[offset:offset + batch_size]:
+                try:
+                    with open(md_file, 'r', encoding='utf-8') as f:
+                        chunk.append((md_file, f.read()))
+                except Exception as e:
+                    print(f"エラー ({md_file.name}): {e}")
+            if not chunk:
+                continue
+            
+            try:
+                # バッチ全体の処理時間を測定
+                batch_profiles = [] if profile else None
+                start_time = time.perf_counter()
+                batch_results = analyze_batch(analyzer, [text for _, text in chunk], batch_size=batch_size, profiles=batch_profiles)
+                processing_time = time.perf_counter() - start_time
+            except Exception as e:
+                print(f"エラー (バッチ {offset + 1}-{offset + len(chunk)}): {e}")
+                continue
+            total_processing_time += processing_time
+            
+            for i, ((md_file, text), results) in enumerate(zip(chunk, batch_results)):
+                result = evaluate_detection(analyzer, text, md_file, results=results)
+                result['processing_time'] = processing_time / len(chunk)
+                if profile:
+                    result['profile'] = batch_profiles[i]
+                    merge_profile(total_profile, batch_profiles[i])
+                all_results.append(result)
+            
+            print(f"処理済み: {offset + len(chunk)}/{len(md_files)} ファイル")
+    wall_time = time.perf_counter() - wall_start
     
     # 集計結果を計算
     total_tp = sum(r['tp'] for r in all_results)
@@ -190,6 +406,8 @@ def evaluate_all(test_dir, limit=None):
     print(f"  False Positive (FP): {total_fp}")
     print(f"  False Negative (FN): {total_fn}")
     print(f"  一般的な単語の誤検知: {total_common_word_fp}")
+    for line in _entity_score_sections(all_results):
+        print(line)
     print(f"\n精度指標:")
     print(f"  Precision (適合率): {overall_precision * 100:.2f}%")
     print(f"  Recall (再現率): {overall_recall * 100:.2f}%")
@@ -198,18 +416,33 @@ def evaluate_all(test_dir, limit=None):
     print(f"  総処理時間: {total_processing_time:.2f}秒")
     print(f"  平均処理時間: {avg_processing_time * 1000:.2f}ミリ秒/ファイル")
     print(f"  処理速度: {len(all_results) / total_processing_time:.2f}ファイル/秒")
+    if workers > 1:
+        print(f"  経過時間: {wall_time:.2f}秒（{workers} ワーカー、{len(all_results) / wall_time:.2f}ファイル/秒）")
     print("=" * 80)
     
+    if profile and all_results:
+        print("\n段階別の処理時間（プロファイル）")
+        print("=" * 80)
+        for line in format_profile(total_profile, files=len(all_results)):
+            print(line)
+        print("=" * 80)
+    
     # 詳細結果をファイルに保存
     output_file = Path(__file__).parent.parent / "evaluation_results.txt"
     with open(output_file, 'w', encoding='utf-8') as f:
         f.write("評価結果詳細\n")
         f.write("=" * 80 + "\n\n")
         for result in all_results:
-            f.write(f"ファイル: {result['file']}\n")
+            f.write(f"ファイル: {result['file']}（{'正解の範囲' if result['mode'] == 'spans' else '文字列の比較'}）\n")
             f.write(f"  TP: {result['tp']}, FP: {result['fp']}, FN: {result['fn']}\n")
             f.write(f"  Precision: {result['precision'] * 100:.2f}%, Recall: {result['recall'] * 100:.2f}%, F1: {result['f1'] * 100:.2f}%\n")
-            f.write(f"  処理時間: {result['processing_time'] * 1000:.2f}ms\n\n")
+            f.write(f"  処理時間: {result['processing_time'] * 1000:.2f}ms\n")
+            if 'profile' in result:
+                stages = ", ".join(f"{name} {stats['seconds'] * 1000:.2f}ms" for name, stats in result['profile']['stages'].items())
+                slowest = ", ".join(f"{name} {seconds * 1000:.2f}ms" for name, seconds in _slowest_parts(result['profile']))
+                f.write(f"  段階別: {stages}\n")
+                f.write(f"  時間の長い Recognizer/パターン: {slowest}\n")
+            f.write("\n")
         
         f.write("\n" + "=" * 80 + "\n")
         f.write("集計結果\n")
@@ -218,6 +451,15 @@ def evaluate_all(test_dir, limit=None):
         f.write(f"Recall: {overall_recall * 100:.2f}%\n")
         f.write(f"F1-Score: {overall_f1 * 100:.2f}%\n")
         f.write(f"平均処理時間: {avg_processing_time * 1000:.2f}ms/ファイル\n")
+        for line in _entity_score_sections(all_results):
+            f.write(line + "\n")
+        
+        if profile and all_results:
+            f.write("\n" + "=" * 80 + "\n")
+            f.write("段階別の処理時間（プロファイル）\n")
+            f.write("=" * 80 + "\n")
+            for line in format_profile(total_profile, files=len(all_results)):
+                f.write(line + "\n")
     
     print(f"\n詳細結果を保存しました: {output_file}")
     
@@ -225,20 +467,422 @@ def evaluate_all(test_dir, limit=None):
         'precision': overall_precision,
         'recall': overall_recall,
         'f1': overall_f1,
+        'per_entity': merge_entity_scores(all_results),
         'avg_processing_time': avg_processing_time,
         'total_processing_time': total_processing_time,
+        'wall_time': wall_time,
+        'workers': workers,
+        'nlp_components': pipeline_components(analyzer.nlp_engine),
+        'profile': total_profile,
     }
 
+def sweep_score_settings(test_dir, settings, limit=None, pattern="*.md", workers=1):
+    """
+    閾値の設定（ScoreSetting のリスト）ごとの精度を評価します。
+    各ファイルの分析は 1 回だけで（analyze_unthresholded）、設定ごとには閾値の適用・誤検知フィルタ・照合のみを実行するため、
+    設定の数が増えても処理時間はほぼ 1 回分の評価と同じです。
+    """
+    md_files = sorted(Path(test_dir).glob(pattern))
+    if limit:
+        md_files = md_files[:limit]
+    
+    print(f"評価対象ファイル数: {len(md_files)}、閾値の設定: {len(settings)} 件")
+    if config.FORM_FIELD_FAST_PATH:
+        print(f"（フォーム形式の行の高速処理: 有効。高速処理する行は閾値 {config.DEFAULT_SCORE_THRESHOLD} で決定します）")
+    else:
+        print("（フォーム形式の行の高速処理: 無効）")
+    print("=" * 80)
+    print("Analyzerを初期化中...")
+    startup_timings = {}
+    analyzer = load_analyzer(timings=startup_timings)
+    print(f"起動時間: {format_timings(startup_timings)}")
+    
+    per_setting = [[] for _ in settings]
+    total_processing_time = 0
+    total_scoring_time = 0
+    wall_start = time.perf_counter()
+    for i, (md_file, outcomes, error) in enumerate(_run_files(analyzer, md_files, _sweep_file, (settings,), workers), 1):
+        if error is not None:
+            print(f"エラー ({md_file.name}): {error}")
+            continue
+        total_processing_time += outcomes[0]['processing_time']
+        for results, result in zip(per_setting, outcomes):
+            total_scoring_time += result['scoring_time']
+            results.append(result)
+        if i % 10 == 0:
+            print(f"処理済み: {i}/{len(md_files)} ファイル")
+    wall_time = time.perf_counter() - wall_start
+    
+    summaries = []
+    print("\n" + "=" * 80)
+    print("閾値のスイープ結果")
+    print("=" * 80)
+    print(f"{'設定':<28} {'TP':>7} {'FP':>7} {'FN':>7} {'適合率':>8} {'再現率':>8} {'F1':>8}")
+    for setting, all_results in zip(settings, per_setting):
+        tp = sum(r['tp'] for r in all_results)
+        fp = sum(r['fp'] for r in all_results)
+        fn = sum(r['fn'] for r in all_results)
+        summary = {
+            'setting': setting,
+            'tp': tp,
+            'fp': fp,
+            'fn': fn,
+            'precision': tp / (tp + fp) if (tp + fp) > 0 else 0.0,
+            'recall': tp / (tp + fn) if (tp + fn) > 0 else 0.0,
+            'f1': 2 * tp / (2 * tp + fp + fn) if (2 * tp + fp + fn) > 0 else 0.0,
+            'per_entity': merge_entity_scores(all_results),
+        }
+        summaries.append(summary)
+        print(f"{setting.name:<28} {tp:>7} {fp:>7} {fn:>7} {summary['precision'] * 100:>7.2f}% "
+              f"{summary['recall'] * 100:>7.2f}% {summary['f1'] * 100:>7.2f}%")
+    for setting, all_results in zip(settings, per_setting):
+        print(f"\n[{setting.name}]", end="")
+        for line in _entity_score_sections(all_results):
+            print(line)
+    print("\n処理時間:")
+    print(f"  分析（1 回分）: {total_processing_time:.2f}秒")
+    print(f"  閾値の適用・照合（{len(settings)} 設定）: {total_scoring_time:.2f}秒")
+    print(f"  経過時間: {wall_time:.2f}秒（{workers} ワーカー）")
+    print("=" * 80)
+    return summaries
+
+def build_raw_cache(test_dir, cache_path, limit=None, pattern="*.md", workers=1):
+    """
+    テストファイルを閾値なしで 1 回ずつ分析し、検出結果を cache_path（redactor.raw_results の形式）に保存します。
+    文書名は test_dir からの相対パスで保存します。
+    """
+    test_path = Path(test_dir)
+    md_files = sorted(test_path.glob(pattern))
+    if limit:
+        md_files = md_files[:limit]
+    print(f"閾値なしの分析結果を作成中: {len(md_files)} ファイル -> {cache_path}")
+    analyzer = load_analyzer()
+    enhancer = analyzer.context_aware_enhancer
+    builder = RawResultsBuilder({
+        "pattern": pattern,
+        "form_field_fast_path": config.FORM_FIELD_FAST_PATH,
+        "table_aware": config.FORM_FIELD_FAST_PATH and config.TABLE_AWARE,
+        "context_similarity_factor": enhancer.context_similarity_factor if enhancer is not None else 0.0,
+        "min_score_with_context_similarity": enhancer.min_score_with_context_similarity if enhancer is not None else 0.0,
+    })
+    start_time = time.perf_counter()
+    for i, (md_file, outcome, error) in enumerate(_run_files(analyzer, md_files, _raw_file, (), workers), 1):
+        if error is not None:
+            print(f"エラー ({md_file.name}): {error}")
+            continue
+        text_hash, results = outcome
+        builder.add_document(str(md_file.relative_to(test_path)), text_hash, results)
+        if i % 10 == 0:
+            print(f"処理済み: {i}/{len(md_files)} ファイル")
+    builder.save(cache_path)
+    print(f"分析時間: {time.perf_counter() - start_time:.2f}秒、検出結果: {builder.offsets[-1]} 件")
+
+def load_raw_cache(test_dir, cache_path, limit=None, pattern="*.md", workers=1, rebuild=False):
+    """キャッシュを読み込みます。ない場合・設定やコードが作成時から変更されている場合は作成し直します。"""
+    cache_path = Path(cache_path)
+    if not rebuild and cache_path.exists():
+        raw = RawResults(cache_path)
+        if raw.is_current():
+            return raw
+        print("設定・コードがキャッシュの作成時から変更されているため、作成し直します")
+    build_raw_cache(test_dir, cache_path, limit=limit, pattern=pattern, workers=workers)
+    return RawResults(cache_path)
+
+def _any_present(presence, groups):
+    """
+    presence（閾値 × 検出結果の bool 配列）から、検出結果の番号のリスト（groups）ごとに
+    いずれかが検出されているかを閾値 × グループの bool 配列で返します。
+    """
+    if not groups:
+        return np.zeros((presence.shape[0], 0), dtype=bool)
+    columns = np.concatenate([np.asarray(group, dtype=np.int64) for group in groups])
+    starts = np.cumsum([0] + [len(group) for group in groups[:-1]])
+    return np.logical_or.reduceat(presence[:, columns], starts, axis=1)
+
+def _detections_by_threshold(results, scores, text, thresholds):
+    """
+    閾値ごとに filter_common_words を適用した検出結果を求め、(検出範囲のリスト, 閾値 × 検出範囲の bool 配列) を返します。
+
+    閾値 t で残る検出結果は、t 以上で最小のスコア（文書内のスコアの段階）で残るものと同じため、
+    filter_common_words は閾値の数ではなく、閾値の範囲にある文書内のスコアの段階ごとに 1 回だけ実行します。
+    """
+    levels = np.unique(scores)
+    level_index = np.searchsorted(levels, thresholds, side='left')
+    detections = {}
+    level_columns = {}
+    for level in np.unique(level_index):
+        if level == len(levels):
+            continue  # すべての検出結果が閾値未満
+        kept = [results[i] for i in np.flatnonzero(scores >= levels[level])]
+        level_columns[level] = [
+            detections.setdefault((r.start, r.end, r.entity_type), len(detections))
+            for r in filter_common_words(kept, text)
+        ]
+    # 最後の行は検出結果なし（閾値がすべてのスコアを上回る場合）
+    level_presence = np.zeros((len(levels) + 1, len(detections)), dtype=bool)
+    for level, columns in level_columns.items():
+        level_presence[level, columns] = True
+    return list(detections), level_presence[level_index]
+
+def _count_by_type(present, types, expected_counts, matched):
+    """
+    グループ（正解の範囲・検出した文字列など）ごとの検出の有無から、エンティティタイプ別の件数を閾値ごとの配列で返します。
+
+    :param present: 閾値 × グループの bool 配列
+    :param types: グループのエンティティタイプのリスト
+    :param expected_counts: エンティティタイプごとの正解の数（fn = 正解の数 - tp）
+    :param matched: グループが正解に一致するか（True は tp、False は fp として数える）の bool 配列
+    """
+    types = np.asarray(types, dtype=object)
+    counts = {}
+    for entity_type in set(types.tolist()) | set(expected_counts):
+        mask = types == entity_type
+        tp = present[:, mask & matched].sum(axis=1)
+        counts[entity_type] = {
+            'tp': tp,
+            'fp': present[:, mask & ~matched].sum(axis=1),
+            'fn': expected_counts.get(entity_type, 0) - tp,
+        }
+    return counts
+
+def _count_spans(spans, detections, presence):
+    """正解の範囲との重なりで、閾値ごとのエンティティタイプ別の件数を返します（score_spans と同じ基準）。"""
+    matches = match_spans(spans, detections)
+    covering = defaultdict(list)
+    exact = defaultdict(list)
+    for column, ((start, end, _), found) in enumerate(zip(detections, matches)):
+        for index in found:
+            covering[index].append(column)
+            if spans[index][:2] == (start, end):
+                exact[index].append(column)
+    span_types = [ENTITY_ALIASES.get(entity_type, entity_type) for _, _, entity_type in spans]
+    expected_counts = defaultdict(int)
+    for entity_type in span_types:
+        expected_counts[entity_type] += 1
+
+    # 正解の範囲（重なる検出があるもの）は tp、どの正解とも重ならない検出は fp のグループとして数える
+    covered_spans = sorted(covering)
+    unmatched = [column for column, found in enumerate(matches) if not found]
+    groups = [covering[index] for index in covered_spans] + [[column] for column in unmatched]
+    types = [span_types[index] for index in covered_spans] + [
+        ENTITY_ALIASES.get(detections[column][2], detections[column][2]) for column in unmatched
+    ]
+    is_expected = np.array([True] * len(covered_spans) + [False] * len(unmatched), dtype=bool)
+    counts = _count_by_type(_any_present(presence, groups), types, expected_counts, is_expected)
+
+    exact_spans = sorted(exact)
+    exact_present = _any_present(presence, [exact[index] for index in exact_spans])
+    exact_types = np.asarray([span_types[index] for index in exact_spans], dtype=object)
+    for entity_type, entity_counts in counts.items():
+        entity_counts['exact'] = exact_present[:, exact_types == entity_type].sum(axis=1)
+    return counts
+
+def _count_strings(text, detections, presence):
+    """extract_pii_patterns で抽出した文字列との比較で、閾値ごとのエンティティタイプ別の件数を返します（evaluate_detection と同じ基準）。"""
+    expected_entities = {entity_type: set(values) for entity_type, values in extract_pii_patterns(text).items()}
+    strings = defaultdict(list)
+    for column, (start, end, entity_type) in enumerate(detections):
+        strings[(entity_type, text[start:end].strip())].append(column)
+    keys = list(strings)
+    is_expected = np.array([value in expected_entities.get(entity_type, ()) for entity_type, value in keys], dtype=bool)
+    expected_counts = {entity_type: len(values) for entity_type, values in expected_entities.items()}
+    return _count_by_type(
+        _any_present(presence, [strings[key] for key in keys]),
+        [entity_type for entity_type, _ in keys],
+        expected_counts,
+        is_expected,
+    )
+
+def threshold_curves(raw, test_dir, thresholds, base_scores=None):
+    """
+    キャッシュ（RawResults）から、閾値ごとのエンティティタイプ別の件数を計算します（再分析は行いません）。
+    base_scores（{パターン名: ベーススコア}）を指定した場合は、スコアを計算し直してから閾値を適用します。
+
+    各閾値の結果は、その閾値で evaluate_all を実行した結果と一致します（キャッシュの作成時に FORM_FIELD_FAST_PATH が
+    有効だった場合は、DEFAULT_SCORE_THRESHOLD 以外の閾値では一致しないことがあります。analyze_unthresholded を参照）。
+    戻り値は {"thresholds": 閾値の配列, "per_entity": {タイプ: {"tp", "fp", "fn"（, "exact"）: 閾値ごとの配列}},
+    "files": 照合したファイル数, "skipped": キャッシュ作成後に変更・削除されたファイル名のリスト} です。
+    """
+    thresholds = np.sort(np.asarray(thresholds, dtype=np.float64))
+    score = raw.rescore(base_scores) if base_scores else raw.score
+    test_path = Path(test_dir)
+    totals = {}
+    skipped = []
+    files = 0
+    for index, name in enumerate(raw.documents):
+        path = test_path / name
+        if not path.exists():
+            skipped.append(name)
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        if document_hash(text) != raw.hashes[index]:
+            skipped.append(name)
+            continue
+        results = raw.document_results(index, score)
+        scores = score[raw.offsets[index]:raw.offsets[index + 1]]
+        detections, presence = _detections_by_threshold(results, scores, text, thresholds)
+        spans = load_spans(path)
+        if spans is not None:
+            counts = _count_spans(spans, detections, presence)
+        else:
+            counts = _count_strings(text, detections, presence)
+        for entity_type, entity_counts in counts.items():
+            merged = totals.setdefault(entity_type, {})
+            for key, values in entity_counts.items():
+                merged[key] = merged.get(key, 0) + values
+        files += 1
+    return {"thresholds": thresholds, "per_entity": totals, "files": files, "skipped": skipped}
+
+def _curve_metrics(tp, fp, fn):
+    """閾値ごとの件数の配列から (適合率, 再現率, F1) の配列を返します。"""
+    tp, fp, fn = (np.asarray(values, dtype=np.float64) for values in (tp, fp, fn))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        f1 = np.where(2 * tp + fp + fn > 0, 2 * tp / (2 * tp + fp + fn), 0.0)
+    return precision, recall, f1
+
+def print_threshold_curves(curves):
+    """閾値ごとの精度と、エンティティタイプごとに F1 が最大となる閾値を表示します。"""
+    thresholds = curves["thresholds"]
+    per_entity = curves["per_entity"]
+    zeros = np.zeros(len(thresholds), dtype=np.int64)
+    tp = sum((counts['tp'] for counts in per_entity.values()), zeros)
+    fp = sum((counts['fp'] for counts in per_entity.values()), zeros)
+    fn = sum((counts['fn'] for counts in per_entity.values()), zeros)
+    precision, recall, f1 = _curve_metrics(tp, fp, fn)
+
+    print("\n" + "=" * 80)
+    print(f"閾値ごとの精度（{curves['files']} ファイル）")
+    print("=" * 80)
+    if curves["skipped"]:
+        print(f"キャッシュの作成後に変更・削除されたため除外: {len(curves['skipped'])} ファイル（--rebuild-raw で作り直してください）")
+    print(f"{'閾値':>6} {'TP':>7} {'FP':>7} {'FN':>7} {'適合率':>8} {'再現率':>8} {'F1':>8}")
+    for i, threshold in enumerate(thresholds):
+        print(f"{threshold:>6.2f} {tp[i]:>7} {fp[i]:>7} {fn[i]:>7} {precision[i] * 100:>7.2f}% {recall[i] * 100:>7.2f}% {f1[i] * 100:>7.2f}%")
+
+    print("\nエンティティタイプ別の F1 が最大となる閾値:")
+    print(f"  {'エンティティ':<18} {'閾値':>6} {'TP':>7} {'FP':>7} {'FN':>7} {'適合率':>8} {'再現率':>8} {'F1':>8}")
+    no_expected = []
+    for entity_type, counts in sorted(per_entity.items(), key=lambda item: -int((item[1]['tp'] + item[1]['fn']).max())):
+        if not (counts['tp'] + counts['fn']).any():
+            no_expected.append(entity_type)
+            continue
+        entity_precision, entity_recall, entity_f1 = _curve_metrics(counts['tp'], counts['fp'], counts['fn'])
+        best = int(np.argmax(entity_f1))
+        print(f"  {entity_type:<18} {thresholds[best]:>6.2f} {counts['tp'][best]:>7} {counts['fp'][best]:>7} {counts['fn'][best]:>7} "
+              f"{entity_precision[best] * 100:>7.2f}% {entity_recall[best] * 100:>7.2f}% {entity_f1[best] * 100:>7.2f}%")
+    if no_expected:
+        print(f"  正解のないエンティティタイプ（FP のみ）: {', '.join(no_expected)}")
+    print("=" * 80)
+
+def _peak_rss_mb():
+    """現在のプロセスのピーク RSS（MB）を返します。"""
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def _evaluate_pipeline_mode(minimal, test_dir, limit, queue):
+    """子プロセスで NLP パイプライン構成を切り替えて評価し、結果を queue に返します。"""
+    config.NLP_MINIMAL_PIPELINE = minimal
+    summary = evaluate_all(test_dir, limit=limit)
+    summary['peak_rss_mb'] = _peak_rss_mb()
+    queue.put(summary)
+
+def compare_pipeline_modes(test_dir, limit=None):
+    """
+    NLP パイプラインの完全構成と最小構成（config.NLP_MINIMAL_PIPELINE）を比較します。
+    メモリ使用量を正しく比較するため、構成ごとに別プロセスで評価します。
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("fork")
+    else:
+        ctx = multiprocessing.get_context("spawn")
+
+    summaries = {}
+    for label, minimal in (("full", False), ("minimal", True)):
+        print(f"\n[{label}] パイプライン構成で評価中...")
+        queue = ctx.Queue()
+        process = ctx.Process(target=_evaluate_pipeline_mode, args=(minimal, test_dir, limit, queue))
+        process.start()
+        summaries[label] = queue.get()
+        process.join()
+
+    full, minimal = summaries["full"], summaries["minimal"]
+    print("\n" + "=" * 80)
+    print("NLP パイプライン構成の比較")
+    print("=" * 80)
+    for label, summary in summaries.items():
+        components = ", ".join(name for names in summary['nlp_components'].values() for name in names)
+        print(f"{label:>8}: 平均処理時間 {summary['avg_processing_time'] * 1000:.2f}ms/ファイル, "
+              f"ピークRSS {summary['peak_rss_mb']:.1f}MB, F1 {summary['f1'] * 100:.2f}%")
+        print(f"          コンポーネント: {components}")
+
+    latency_change = (minimal['avg_processing_time'] / full['avg_processing_time'] - 1) * 100 if full['avg_processing_time'] > 0 else 0.0
+    f1_change = (minimal['f1'] - full['f1']) * 100
+    print("\n差分 (minimal - full):")
+    print(f"  平均処理時間: {latency_change:+.1f}%")
+    print(f"  ピークRSS: {minimal['peak_rss_mb'] - full['peak_rss_mb']:+.1f}MB")
+    print(f"  F1-Score: {f1_change:+.2f}pt")
+    if f1_change < 0:
+        print("  警告: 最小構成で F1-Score が低下しています")
+    else:
+        print("  F1-Score の低下はありません")
+    print("=" * 80)
+
+    return summaries
+
 if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description="秘匿化ロジックの評価")
     parser.add_argument("--input", type=str, help="テストファイルのディレクトリ", default="test_md")
     parser.add_argument("--limit", type=int, help="評価するファイル数の上限", default=None)
+    parser.add_argument("--pattern", type=str, help="評価するファイルの glob パターン（例: '*.csv'）", default="*.md")
+    parser.add_argument("--batch-size", type=int, help="nlp.pipe でまとめて分析するファイル数（1 = ファイルごと）", default=1)
+    parser.add_argument("--profile", action="store_true", help="Recognizer・フィルタ段階ごとの処理時間と件数を集計する")
+    parser.add_argument("--compare-pipeline", action="store_true", help="NLPパイプラインの完全構成と最小構成を比較する")
+    parser.add_argument("--workers", type=int, help="並列に評価するプロセス数（1 = 直列）", default=1)
+    parser.add_argument("--sweep", type=str, nargs="+", metavar="SETTING", default=None,
+                        help="閾値の設定ごとに評価する（例: 0.6 0.7 0.85 '0.85,PERSON=0.9'）。分析はファイルごとに 1 回のみ")
+    parser.add_argument("--raw-cache", type=str, default=None,
+                        help="閾値なしの分析結果のキャッシュ（.npz）。なければ作成し、--thresholds の閾値ごとの精度を再分析せずに計算する")
+    parser.add_argument("--rebuild-raw", action="store_true", help="--raw-cache のキャッシュを作成し直す")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=None,
+                        help="--raw-cache で精度を計算する閾値（デフォルト: 0.30〜1.00 を 0.05 刻み）")
+    parser.add_argument("--base-score", type=str, nargs="+", metavar="PATTERN=SCORE", default=None,
+                        help="--raw-cache でパターンのベーススコアを変更する（例: jp_phone_pattern=0.75）")
     
     args = parser.parse_args()
+    if args.workers > 1 and args.batch_size > 1:
+        parser.error("--workers と --batch-size は同時に指定できません")
     
     base_dir = Path(__file__).resolve().parent.parent
     test_dir = base_dir / args.input
     
-    evaluate_all(test_dir, limit=args.limit)
+    if args.compare_pipeline:
+        compare_pipeline_modes(test_dir, limit=args.limit)
+    elif args.raw_cache:
+        raw = load_raw_cache(test_dir, base_dir / args.raw_cache, limit=args.limit, pattern=args.pattern,
+                             workers=args.workers, rebuild=args.rebuild_raw)
+        base_scores = {}
+        for value in args.base_score or []:
+            name, score = value.split("=", 1)
+            base_scores[name.strip()] = float(score)
+        thresholds = args.thresholds or np.round(np.arange(0.30, 1.0001, 0.05), 2)
+        start_time = time.perf_counter()
+        try:
+            curves = threshold_curves(raw, test_dir, thresholds, base_scores=base_scores)
+        except KeyError as e:
+            names = ", ".join(name for name, _, _ in raw.pattern_summary())
+            parser.error(f"{e.args[0]}（キャッシュのパターン: {names}）")
+        print_threshold_curves(curves)
+        print(f"計算時間: {time.perf_counter() - start_time:.2f}秒（{len(raw)} 件の検出結果、{len(thresholds)} 閾値）")
+    elif args.sweep:
+        sweep_score_settings(test_dir, [parse_score_setting(value) for value in args.sweep],
+                             limit=args.limit, pattern=args.pattern, workers=args.workers)
+    else:
+        evaluate_all(test_dir, limit=args.limit, batch_size=args.batch_size, profile=args.profile,
+                     pattern=args.pattern, workers=args.workers)
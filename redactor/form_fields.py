@@ -0,0 +1,294 @@
+"""
+フォーム形式の行（"- 氏名: 山田太郎" や "電話: 03-1234-5678" など）を spaCy を使わずに分析する高速処理です。
+
+ラベルからエンティティタイプを判定する対応表は config.CONTEXT_WORDS から作成します
+（ラベルに含まれるコンテキスト単語のうち、最も後ろで終わるもの＝日本語の複合語の主要部を優先します）。
+対応するラベルの行は、正規表現の Recognizer だけで値を分類し、値の範囲を spaCy の分析対象（free_text）から除外します。
+ラベルは free_text に残すため、隣接する行の検出結果は従来どおりラベルの単語（"依頼人名" の "名" など）を
+コンテキストとしてスコアを補正されます。
+
+- 値全体がエンティティとなるタイプ（config.FORM_FIELD_VALUE_ENTITIES: PERSON・ORG・LOCATION など）は、
+  同じタイプの検出がなければ値全体をそのタイプとして検出します。
+- それ以外のタイプ（電話番号・口座番号など）は、値が正規表現の検出結果と記号・数字だけで説明できる場合のみ
+  高速処理の対象とします。説明できない文字（"連絡先: 山田 090-..." の "山田" など）が残る行は通常どおり分析します。
+
+config.TABLE_AWARE が有効な場合は、Markdown の表・CSV も列単位で同様に分析します（redactor.tables）。
+
+除外した値は同じ長さの全角空白に置き換えるため、free_text の検出位置は元のテキストの位置と一致します
+（半角空白の連続は spaCy で 1 つのトークンになり、NER が前後の語と空白をまとめて固有表現とするため使用しません）。
+"""
+
+import bisect
+import re
+from collections import namedtuple
+
+from presidio_analyzer import EntityRecognizer, PatternRecognizer, RecognizerResult
+
+try:
+    from . import config
+    from .pattern_scanner import MultiPatternRecognizer, PATTERN_GROUP_KEY, remove_duplicates
+    from .tables import find_tables, analyze_tables
+except ImportError:
+    import config
+    from pattern_scanner import MultiPatternRecognizer, PATTERN_GROUP_KEY, remove_duplicates
+    from tables import find_tables, analyze_tables
+
+# 箇条書き・番号付きリスト・太字のラベルに対応する "ラベル: 値" の行
+_FORM_LINE = re.compile(
+    r'^[ \t]*(?:[-*+][ \t]+|\d+[.)][ \t]+)?(?:\*\*)?'
+    r'(?P<label>[^\s:：|*#`>][^:：|`\n]{0,30}?)'
+    r'(?:\*\*)?[ \t　]*[:：](?:\*\*)?[ \t　]*'
+    r'(?P<value>[^\n]*?)[ \t　\r]*$',
+    re.MULTILINE,
+)
+# 説明できない値の文字（文字・かな・漢字）
+_WORD_CHAR = re.compile(r'[^\W\d_]')
+# 空白に置き換える文字（改行は残して行の構造を保つ）と、置き換え後の文字
+_NOT_NEWLINE = re.compile(r'[^\r\n]')
+_BLANK = "\u3000"
+# ラベル（表の見出し）から値全体を検出した結果の Recognizer 名（recognition_metadata）
+FORM_FIELD_RECOGNIZER_NAME = "FormFieldRecognizer"
+
+FormField = namedtuple("FormField", ["line_start", "line_end", "label", "value_start", "value_end", "entity_type"])
+# covered: free_text の検出結果を使用しない範囲（空白に置き換えた値・セルと、ラベル・表の見出し）の重ならない昇順のリスト
+FormFields = namedtuple("FormFields", ["free_text", "results", "fields", "covered"])
+
+
+def build_label_map():
+    """
+    (ラベルの単語, エンティティタイプ) のリストを返します。config.CONTEXT_WORDS と config.FORM_FIELD_EXTRA_LABELS から作成し、
+    1 文字の単語（"名"・"第" など、ラベル以外でも頻出するもの）は除外します。
+    同じ単語が複数のタイプにある場合（ORG と ORGANIZATION など）は先に定義されたタイプを使用します。
+    """
+    label_map = {}
+    for entity_type, words in config.CONTEXT_WORDS.items():
+        if entity_type not in config.TARGET_ENTITIES:
+            continue
+        for word in words:
+            if len(word) >= 2:
+                label_map.setdefault(word.lower(), entity_type)
+    for word, entity_type in config.FORM_FIELD_EXTRA_LABELS.items():
+        label_map.setdefault(word.lower(), entity_type)
+    return list(label_map.items())
+
+
+class FormFieldParser:
+    """ラベルからエンティティタイプを判定し、フォーム形式の行を取り出します。"""
+
+    def __init__(self, label_map=None):
+        self.label_map = label_map if label_map is not None else build_label_map()
+        self._label_types = {}
+
+    def label_entity(self, label):
+        """ラベルに対応するエンティティタイプを返します。対応しない場合は None を返します。"""
+        entity_type = self._label_types.get(label, "")
+        if entity_type != "":
+            return entity_type
+        lowered = label.lower()
+        best = None
+        for word, word_type in self.label_map:
+            index = lowered.rfind(word)
+            if index == -1:
+                continue
+            # 最も後ろで終わる単語（同じ位置なら長い単語）を優先する: "取引先担当者" -> 担当（PERSON）
+            rank = (index + len(word), len(word))
+            if best is None or rank > best[0]:
+                best = (rank, word_type)
+        entity_type = best[1] if best is not None else None
+        self._label_types[label] = entity_type
+        return entity_type
+
+    def parse(self, text):
+        """ラベルが対応する "ラベル: 値" の行を FormField のリストで返します（値が空の行は除外）。"""
+        fields = []
+        for match in _FORM_LINE.finditer(text):
+            value_start, value_end = match.span("value")
+            if value_start == value_end:
+                continue
+            label = match.group("label").strip()
+            entity_type = self.label_entity(label)
+            if entity_type is None:
+                continue
+            # 値を囲む太字・コードの記号は値に含めない
+            value = match.group("value")
+            for mark in ("**", "`"):
+                if len(value) > 2 * len(mark) and value.startswith(mark) and value.endswith(mark):
+                    value_start += len(mark)
+                    value_end -= len(mark)
+                    value = value[len(mark):-len(mark)]
+            line_start, line_end = match.span()
+            fields.append(FormField(line_start, line_end, label, value_start, value_end, entity_type))
+        return fields
+
+
+_default_parser = None
+
+def _get_parser():
+    global _default_parser
+    if _default_parser is None:
+        _default_parser = FormFieldParser()
+    return _default_parser
+
+
+def _context_words(recognizer, result):
+    """検出結果の Recognizer（MultiPatternRecognizer の場合は元の Recognizer）のコンテキスト単語を返します。"""
+    if isinstance(recognizer, MultiPatternRecognizer):
+        group_index = (result.recognition_metadata or {}).get(PATTERN_GROUP_KEY)
+        return recognizer.groups[group_index][2] if group_index is not None else None
+    return recognizer.context
+
+
+def _scan_segments(analyzer, text, segments):
+    """
+    (開始位置, 終了位置, ラベル) の範囲だけをつなげたテキストに正規表現の Recognizer を実行し、範囲ごとの検出結果を返します。
+    ラベルに Recognizer のコンテキスト単語が含まれる場合は、LemmaContextAwareEnhancer と同じ値でスコアを補正します。
+    """
+    recognizers = [
+        recognizer
+        for recognizer in analyzer.registry.get_recognizers(language='ja', entities=config.TARGET_ENTITIES)
+        if isinstance(recognizer, (PatternRecognizer, MultiPatternRecognizer))
+    ]
+    enhancer = analyzer.context_aware_enhancer
+    segment_starts = []
+    position = 0
+    for start, end, _ in segments:
+        segment_starts.append(position)
+        position += end - start + 1
+    compact = "\n".join(text[start:end] for start, end, _ in segments)
+
+    per_segment = [[] for _ in segments]
+    for recognizer in recognizers:
+        for result in recognizer.analyze(compact, config.TARGET_ENTITIES, None) or []:
+            index = bisect.bisect_right(segment_starts, result.start) - 1
+            start, end, label = segments[index]
+            delta = start - segment_starts[index]
+            # 範囲をまたぐ一致は元のテキスト上の位置に戻せないため使用しない
+            if result.end + delta > end:
+                continue
+            result.start += delta
+            result.end += delta
+            context = _context_words(recognizer, result)
+            label = label.lower()
+            if enhancer is not None and context and any(word.lower() in label for word in context):
+                result.score = min(
+                    max(result.score + enhancer.context_similarity_factor, enhancer.min_score_with_context_similarity),
+                    EntityRecognizer.MAX_SCORE,
+                )
+                # raw_results がベーススコアを変更したときに補正し直せるよう、Presidio の補正と同じ印を付ける
+                result.recognition_metadata = dict(result.recognition_metadata or {})
+                result.recognition_metadata[RecognizerResult.IS_SCORE_ENHANCED_BY_CONTEXT_KEY] = True
+            if result.score >= config.DEFAULT_SCORE_THRESHOLD:
+                per_segment[index].append(result)
+    return per_segment
+
+
+def _explained(text, value_start, value_end, results):
+    """値のうち検出結果で覆われない部分に、文字（かな・漢字・英字）が残っていないかを返します。"""
+    covered = sorted((max(r.start, value_start), min(r.end, value_end)) for r in results)
+    position = value_start
+    for start, end in covered:
+        if start > position and _WORD_CHAR.search(text, position, start):
+            return False
+        position = max(position, end)
+    return not _WORD_CHAR.search(text, position, value_end)
+
+
+def split_form_fields(analyzer, text, parser=None):
+    """
+    フォーム形式の行（と表）を分析し、FormFields（spaCy で分析するテキスト・高速処理した範囲の検出結果・対象の行）を返します。
+    検出結果は閾値・allow_list・重複除去を適用済みで、filter_common_words は適用していません。
+    """
+    parser = parser or _get_parser()
+    results = []
+    handled = []  # 空白に置き換える範囲
+    labels = []  # 高速処理した値のラベル・表の見出しの範囲
+
+    table_ranges = []
+    if config.TABLE_AWARE:
+        tables = find_tables(text)
+        if tables:
+            table_results, handled = analyze_tables(
+                analyzer,
+                text,
+                tables,
+                parser,
+                lambda cells, label: _scan_segments(analyzer, text, [(cell.start, cell.end, label) for cell in cells]),
+                lambda cell, found: _explained(text, cell.start, cell.end, found),
+            )
+            results.extend(table_results)
+            table_ranges = [(table.lines[0][0], table.lines[-1][1]) for table in tables]
+            labels.extend(table.lines[0] for table in tables)
+
+    fields = [
+        field for field in parser.parse(text)
+        if not any(start <= field.line_start < end for start, end in table_ranges)
+    ]
+    accepted = []
+    segments = [(field.line_start, field.line_end, field.label) for field in fields]
+    for field, line_results in zip(fields, _scan_segments(analyzer, text, segments) if fields else []):
+        # ラベルは free_text に残して通常どおり分析するため、値の範囲の検出結果だけを使用する
+        line_results = [r for r in line_results if r.start >= field.value_start and r.end <= field.value_end]
+        if field.entity_type in config.FORM_FIELD_VALUE_ENTITIES:
+            value_length = field.value_end - field.value_start
+            if value_length > config.FORM_FIELD_MAX_VALUE_LENGTH:
+                continue
+            if not any(r.entity_type == field.entity_type for r in line_results):
+                line_results.append(RecognizerResult(
+                    entity_type=field.entity_type,
+                    start=field.value_start,
+                    end=field.value_end,
+                    score=config.FORM_FIELD_SCORE,
+                ))
+        elif not _explained(text, field.value_start, field.value_end, line_results):
+            continue
+        accepted.append(field)
+        results.extend(line_results)
+        handled.append((field.value_start, field.value_end))
+        labels.append((field.line_start, field.value_start))
+
+    if not handled:
+        return FormFields(text, [], [], [])
+
+    allow_list = set(config.ALLOW_LIST)
+    results = [r for r in results if text[r.start:r.end] not in allow_list]
+    results = remove_duplicates(results)
+    for result in results:
+        if not result.recognition_metadata:
+            result.recognition_metadata = {RecognizerResult.RECOGNIZER_NAME_KEY: FORM_FIELD_RECOGNIZER_NAME}
+
+    # 高速処理した範囲を同じ長さの全角空白に置き換え、検出位置を元のテキストと揃える
+    pieces = []
+    position = 0
+    for start, end in sorted(handled):
+        if end <= position:
+            continue
+        start = max(start, position)
+        pieces.append(text[position:start])
+        pieces.append(_NOT_NEWLINE.sub(_BLANK, text[start:end]))
+        position = end
+    pieces.append(text[position:])
+
+    covered = []
+    for start, end in sorted(handled + labels):
+        if covered and start <= covered[-1][1]:
+            covered[-1] = (covered[-1][0], max(covered[-1][1], end))
+        else:
+            covered.append((start, end))
+    return FormFields("".join(pieces), results, accepted, covered)
+
+
+def merge_form_results(form, results):
+    """
+    free_text の検出結果（results）に高速処理の検出結果を加えて返します。
+    空白に置き換えた値と重なる検出結果（NER が空白と前後の語をまとめて固有表現とした場合など）は高速処理の検出結果と
+    矛盾するため、ラベル・表の見出しと重なる検出結果（"メールアドレス" の一部を人名とした場合など）はラベルであるため除外します。
+    """
+    starts = [start for start, _ in form.covered]
+    kept = []
+    for result in results:
+        # covered は重ならない昇順の範囲のため、result.end より前に始まる最後の範囲だけを確認すればよい
+        index = bisect.bisect_left(starts, result.end) - 1
+        if index >= 0 and form.covered[index][1] > result.start:
+            continue
+        kept.append(result)
+    return kept + form.results
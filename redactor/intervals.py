@@ -0,0 +1,50 @@
+"""
+検出範囲の包含判定を高速に行うためのインデックスです。
+"""
+
+import bisect
+
+
+class ContainmentIndex:
+    """
+    登録済みの範囲 [start, end) のいずれかに、指定した範囲が包含されるかを判定するインデックス。
+
+    開始位置の候補を事前に受け取り、座標圧縮した Fenwick 木に「開始位置が x 以下の範囲の最大終了位置」
+    を保持します。登録・判定はいずれも O(log n) で、登録順は任意です。
+    """
+
+    def __init__(self, starts):
+        """
+        :param starts: 登録する可能性のある範囲の開始位置（重複可）
+        """
+        self._starts = sorted(set(starts))
+        self._size = len(self._starts)
+        self._tree = [-1] * (self._size + 1)
+        self._ranges = set()
+
+    def add(self, start, end):
+        """範囲を登録します。start はコンストラクタで渡した開始位置のいずれかである必要があります。"""
+        self._ranges.add((start, end))
+        i = bisect.bisect_left(self._starts, start) + 1
+        while i <= self._size:
+            if self._tree[i] < end:
+                self._tree[i] = end
+            i += i & -i
+
+    def __contains__(self, range_key):
+        """(start, end) と完全に一致する範囲が登録済みかを返します。"""
+        return range_key in self._ranges
+
+    def max_end_before(self, start):
+        """開始位置が start 以下の登録済み範囲のうち、最大の終了位置を返します（なければ -1）。"""
+        i = bisect.bisect_right(self._starts, start)
+        max_end = -1
+        while i > 0:
+            if self._tree[i] > max_end:
+                max_end = self._tree[i]
+            i -= i & -i
+        return max_end
+
+    def contains(self, start, end):
+        """[start, end) を完全に包含する（または一致する）登録済み範囲があるかを返します。"""
+        return self.max_end_before(start) >= end
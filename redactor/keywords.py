@@ -0,0 +1,136 @@
+"""
+コンテキスト単語の出現位置を文書ごとに一括で求めるためのキーワード検索です。
+
+filter_common_words では検出結果ごとに周辺テキストを切り出し、すべてのコンテキスト単語について
+部分文字列検索を行っていました（O(単語数 × 周辺文字数) / 結果）。
+Aho-Corasick オートマトンで文書を 1 回だけ走査して出現位置を求め、
+結果ごとの判定は出現位置に対する範囲クエリ（O(log n)）で行います。
+"""
+
+import bisect
+from collections import deque
+
+
+class KeywordAutomaton:
+    """
+    複数のキーワードを 1 回の走査で検索する Aho-Corasick オートマトン。
+
+    範囲クエリでは「終了位置ごとに最も短い一致」だけがあれば十分なため、
+    各状態には一致するキーワードの最短の長さのみを保持します。
+    """
+
+    def __init__(self, words):
+        """
+        :param words: 検索するキーワード（大文字・小文字を区別しない）
+        """
+        self.words = sorted({word.lower() for word in words})
+        # 空文字列は常に部分文字列として一致する（`"" in text` と同じ扱い）
+        self.matches_empty = "" in self.words
+        self._goto = [{}]
+        self._fail = [0]
+        self._min_length = [0]
+
+        for word in self.words:
+            if not word:
+                continue
+            state = 0
+            for char in word:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._min_length.append(0)
+                state = next_state
+            if not self._min_length[state] or len(word) < self._min_length[state]:
+                self._min_length[state] = len(word)
+
+        # 幅優先で失敗遷移を設定し、失敗先で一致する最短のキーワード長を引き継ぐ
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                inherited = self._min_length[fail]
+                if inherited and (not self._min_length[next_state] or inherited < self._min_length[next_state]):
+                    self._min_length[next_state] = inherited
+                queue.append(next_state)
+
+    def search(self, text):
+        """
+        text 中のキーワードの出現位置を返します（大文字・小文字を区別しない）。
+        """
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # 小文字化で文字数が変わる文字（'İ' など）を含む場合は位置がずれるため、範囲ごとに検索する
+            return SubstringHits(text, self.words)
+        return self.scan(lowered)
+
+    def scan(self, text):
+        """
+        text を走査し、キーワードの出現位置のインデックスを返します。
+        text は呼び出し側で小文字化しておく必要があります。
+        """
+        goto = self._goto
+        fail = self._fail
+        min_length = self._min_length
+        ends = []
+        starts = []
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            length = min_length[state]
+            if length:
+                ends.append(i + 1)
+                starts.append(i + 1 - length)
+        return KeywordHits(starts, ends, self.matches_empty)
+
+
+class KeywordHits:
+    """
+    キーワードの出現位置に対して「範囲 [start, end) 内に完全に収まる出現があるか」を判定します。
+
+    出現位置は終了位置の昇順で、開始位置の累積最大値を保持するため、判定は二分探索 1 回です。
+    """
+
+    def __init__(self, starts, ends, matches_empty=False):
+        self._ends = ends
+        self._max_starts = []
+        max_start = -1
+        for start in starts:
+            if start > max_start:
+                max_start = start
+            self._max_starts.append(max_start)
+        self.matches_empty = matches_empty
+
+    def __len__(self):
+        return len(self._ends)
+
+    def any_within(self, start, end):
+        """[start, end) 内に完全に収まる出現があるかを返します。"""
+        if self.matches_empty:
+            return True
+        i = bisect.bisect_right(self._ends, end)
+        return i > 0 and self._max_starts[i - 1] >= start
+
+
+class SubstringHits:
+    """
+    KeywordHits と同じ判定を、範囲ごとの部分文字列検索で行います（小文字化で位置がずれる文書用）。
+    """
+
+    def __init__(self, text, words):
+        self._text = text
+        self._words = words
+
+    def any_within(self, start, end):
+        """[start, end) を小文字化したテキストにいずれかのキーワードが含まれるかを返します。"""
+        window = self._text[start:end].lower()
+        return any(word in window for word in self._words)
@@ -0,0 +1,88 @@
+"""
+秘匿化済みファイルのマニフェスト（増分処理用のキャッシュ）です。
+
+出力ファイルごとに、入力内容のハッシュと設定・コードのフィンガープリント
+（snapshot.config_fingerprint）を記録します。次回の実行時に入力・設定・出力ファイルが
+いずれも変わっていなければ、そのファイルの秘匿化を省略します。
+マニフェストには入力ファイルのパスとハッシュのみを保存し、本文や検出結果は保存しません。
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_sha256(path):
+    """ファイル内容の SHA-256 を返します（巨大なファイルも一定のメモリで計算する）。"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RedactionManifest:
+    """
+    出力ファイル名をキーに、秘匿化したときの入力ハッシュ・フィンガープリント・出力ファイルの状態を保持します。
+    出力ファイルのサイズと更新時刻も記録し、出力が削除・変更された場合は再処理します。
+    """
+
+    def __init__(self, path, entries=None):
+        self.path = Path(path)
+        self.entries = entries if entries is not None else {}
+
+    @classmethod
+    def load(cls, path):
+        """マニフェストを読み込みます。存在しない・壊れている場合は空のマニフェストを返します。"""
+        path = Path(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            print(f"マニフェストの読み込みに失敗したため、すべてのファイルを再処理します: {e}")
+            return cls(path)
+        if data.get("version") != MANIFEST_VERSION:
+            return cls(path)
+        return cls(path, data.get("entries", {}))
+
+    def save(self):
+        """マニフェストを保存します（書き込み途中のファイルを読まないよう置換で反映）。"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def is_valid(self, output_path, input_sha256, fingerprint):
+        """記録済みの出力が、同じ入力内容・同じ設定で作成され、その後変更されていないかを返します。"""
+        entry = self.entries.get(Path(output_path).name)
+        if entry is None:
+            return False
+        if entry.get("input_sha256") != input_sha256 or entry.get("fingerprint") != fingerprint:
+            return False
+        try:
+            stat = os.stat(output_path)
+        except OSError:
+            return False
+        return entry.get("output_size") == stat.st_size and entry.get("output_mtime_ns") == stat.st_mtime_ns
+
+    def record(self, input_path, output_path, input_sha256, fingerprint):
+        """秘匿化に成功した出力を記録します。"""
+        stat = os.stat(output_path)
+        self.entries[Path(output_path).name] = {
+            "input": str(input_path),
+            "input_sha256": input_sha256,
+            "fingerprint": fingerprint,
+            "output_size": stat.st_size,
+            "output_mtime_ns": stat.st_mtime_ns,
+        }
+
+    def discard(self, output_path):
+        """出力の記録を削除します（秘匿化に失敗した場合など）。"""
+        self.entries.pop(Path(output_path).name, None)
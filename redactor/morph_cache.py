@@ -0,0 +1,157 @@
+"""
+日本語パイプラインのトークナイザーと Morphologizer を、形態素情報のハッシュをキャッシュする実装に置き換えます。
+
+spaCy の JapaneseTokenizer と Morphologizer（extend = true）は、トークンごとに dict から形態素情報を作成して
+Morphology.add に渡します。Morphology.add(dict) は登録済みの解析でも毎回メモリプールに領域を確保して解放しないため、
+処理したトークン数に比例してメモリ使用量が増え続けます（巨大なファイルのストリーミング処理や API サーバーで問題になる）。
+
+置き換える実装は spaCy の JapaneseTokenizer.__call__ と Morphologizer.set_annotations の処理を写したもので、
+spaCy の内部実装に依存します。写し元と同じ処理であることを確認したバージョン（SUPPORTED_SPACY_VERSIONS）以外の
+spaCy では置き換えず、標準のコンポーネントをそのまま使用します。config.NLP_CACHE_MORPH = False でも無効にできます。
+"""
+
+import re
+
+import spacy
+from spacy.lang.ja import JapaneseTokenizer, get_dtokens_and_spaces, resolve_pos
+from spacy.morphology import Morphology
+from spacy.pipeline import Morphologizer
+from spacy.tokens import Doc, MorphAnalysis
+
+try:
+    from . import config
+except ImportError:
+    import config
+
+# 置き換える実装が写し元と同じ処理であることを確認した spaCy のバージョン（メジャー.マイナー）
+SUPPORTED_SPACY_VERSIONS = ("3.7", "3.8")
+
+
+def morph_cache_supported(version=None):
+    """spaCy のバージョン（省略時はインストールされているバージョン）で置き換えを使用できるかを返します。"""
+    version = version or spacy.__version__
+    return ".".join(version.split(".")[:2]) in SUPPORTED_SPACY_VERSIONS
+
+
+class CachedMorphJapaneseTokenizer(JapaneseTokenizer):
+    """
+    形態素情報（活用・読み）のハッシュをキャッシュする JapaneseTokenizer。
+
+    spaCy の JapaneseTokenizer はトークンごとに dict から MorphAnalysis を作成しますが、
+    Morphology.add(dict) は登録済みの解析でも毎回メモリプールに領域を確保して解放しないため、
+    処理したトークン数に比例してメモリ使用量が増え続けます。
+    同じ形態素情報は登録済みのハッシュで設定し、大きなファイルや長時間の処理でもメモリが増えないようにします。
+    """
+
+    def __init__(self, vocab, split_mode=None):
+        super().__init__(vocab, split_mode=split_mode)
+        self._morph_keys = {}
+
+    def __reduce__(self):
+        return CachedMorphJapaneseTokenizer, (self.vocab, self.split_mode)
+
+    def _morph_key(self, inflection, reading):
+        """活用・読みに対応する形態素情報のハッシュを返します（初回のみ Morphology に登録）。"""
+        key = self._morph_keys.get((inflection, reading))
+        if key is None:
+            morph = {}
+            if inflection:
+                # it's normal for this to be empty for non-inflecting types
+                morph["Inflection"] = inflection
+            if reading:
+                # 記号はそれ自体が読みになるため、"=" などは置き換える（JapaneseTokenizer と同じ）
+                morph["Reading"] = re.sub("[=|]", "_", reading)
+            key = self.vocab.morphology.add(morph)
+            self._morph_keys[(inflection, reading)] = key
+        return key
+
+    def __call__(self, text):
+        # JapaneseTokenizer.__call__ と同じ処理で、形態素情報の設定方法のみ異なる
+        sudachipy_tokens = self.tokenizer.tokenize(text)
+        dtokens = self._get_dtokens(sudachipy_tokens)
+        dtokens, spaces = get_dtokens_and_spaces(dtokens, text)
+
+        words, tags, inflections, lemmas, norms, readings, sub_tokens_list = (
+            zip(*dtokens) if dtokens else [[]] * 7
+        )
+        sub_tokens_list = list(sub_tokens_list)
+        doc = Doc(self.vocab, words=list(words), spaces=spaces)
+        next_pos = None  # for bi-gram rules
+        for idx, (token, dtoken) in enumerate(zip(doc, dtokens)):
+            token.tag_ = dtoken.tag
+            if next_pos:  # already identified in previous iteration
+                token.pos = next_pos
+                next_pos = None
+            else:
+                token.pos, next_pos = resolve_pos(
+                    token.orth_,
+                    dtoken.tag,
+                    tags[idx + 1] if idx + 1 < len(tags) else None,
+                )
+            # if there's no lemma info (it's an unk) just use the surface
+            token.lemma_ = dtoken.lemma if dtoken.lemma else dtoken.surface
+            token.norm_ = dtoken.norm
+            token.set_morph(self._morph_key(dtoken.inf, dtoken.reading))
+        if self.need_subtokens:
+            doc.user_data["sub_tokens"] = sub_tokens_list
+        return doc
+
+
+class CachedMorphMorphologizer(Morphologizer):
+    """
+    extend = true の場合の形態素情報の統合結果をキャッシュする Morphologizer。
+
+    Morphologizer は extend = true のとき、トークナイザーが付与した形態素情報と予測結果を
+    dict で統合して Morphology.add に渡すため、CachedMorphJapaneseTokenizer と同じ理由で
+    処理したトークン数に比例してメモリ使用量が増え続けます。
+    (元の形態素情報, 予測ラベル) ごとに統合結果のハッシュを再利用します。
+    """
+
+    def set_annotations(self, docs, batch_tag_ids):
+        if not self.cfg["extend"]:
+            return super().set_annotations(docs, batch_tag_ids)
+        if isinstance(docs, Doc):
+            docs = [docs]
+
+        morph_keys = self.__dict__.setdefault("_morph_keys", {})
+        overwrite = self.cfg["overwrite"]
+        labels = self.labels
+        for doc, doc_tag_ids in zip(docs, batch_tag_ids):
+            if hasattr(doc_tag_ids, "get"):
+                doc_tag_ids = doc_tag_ids.get()
+            for token, tag_id in zip(doc, doc_tag_ids):
+                morph = labels[tag_id]
+                current = token.morph.key
+                key = morph_keys.get((current, morph))
+                if key is None:
+                    predicted = Morphology.feats_to_dict(self.cfg["labels_morph"].get(morph, 0))
+                    existing = Morphology.feats_to_dict(self.vocab.strings[current])
+                    if overwrite:
+                        # morphologizer morph overwrites any existing features while extending
+                        existing.update(predicted)
+                        extended_morph = existing
+                    else:
+                        # existing features are preserved and any new features are added
+                        predicted.update(existing)
+                        extended_morph = predicted
+                    key = self.vocab.morphology.add(extended_morph)
+                    morph_keys[(current, morph)] = key
+                token.morph = MorphAnalysis.from_id(self.vocab, key)
+                if token.pos == 0 or overwrite:
+                    token.pos = self.cfg["labels_pos"].get(morph, 0)
+
+
+def use_cached_morph(nlp):
+    """
+    日本語パイプラインのトークナイザーと Morphologizer を、形態素情報をキャッシュする実装に置き換えます。
+    学習済みの重みや設定はそのまま使用するため、解析結果は変わりません。
+    config.NLP_CACHE_MORPH が無効な場合と、対応しないバージョンの spaCy の場合は何もしません。
+    """
+    if not config.NLP_CACHE_MORPH or not morph_cache_supported():
+        return nlp
+    if type(nlp.tokenizer) is JapaneseTokenizer:
+        nlp.tokenizer = CachedMorphJapaneseTokenizer(nlp.vocab, split_mode=nlp.tokenizer.split_mode)
+    for _, component in nlp.pipeline:
+        if type(component) is Morphologizer:
+            component.__class__ = CachedMorphMorphologizer
+    return nlp
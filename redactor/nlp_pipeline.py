@@ -0,0 +1,130 @@
+"""
+spaCy パイプラインの構成を管理します。
+
+Presidio が spaCy から使用するのは、トークン・レンマ（日本語ではトークナイザーが付与）と
+固有表現（ner）のみです。最小構成モードでは構文解析（parser）や形態素タグ付け（morphologizer）
+などのコンポーネントを読み込まないようにし、analyze ごとの処理時間とメモリ使用量を削減します。
+"""
+
+from pathlib import Path
+
+import spacy
+from spacy.language import Language
+from presidio_analyzer.nlp_engine import NlpEngineProvider, SpacyNlpEngine
+
+try:
+    from . import config
+    from .morph_cache import use_cached_morph
+except ImportError:
+    import config
+    from morph_cache import use_cached_morph
+
+# 他のコンポーネントから参照（listen）される共有埋め込みコンポーネントのファクトリ名
+_EMBEDDING_FACTORIES = ("tok2vec", "transformer")
+# 文境界を設定するコンポーネント（ner は文境界をまたいだ固有表現を出力しない）
+_SENTENCE_COMPONENTS = ("parser", "senter")
+_SENTENCE_END_CHARS = {"。", "．", "！", "？", "!", "?"}
+
+@Language.component("newline_sentencizer")
+def newline_sentencizer(doc):
+    """
+    句点・改行で文境界を設定する軽量コンポーネントです。
+    parser を除外した場合に、ner が行をまたいだ固有表現を出力しないようにするために使用します。
+    """
+    previous = None
+    for token in doc:
+        token.is_sent_start = previous is None or previous.text in _SENTENCE_END_CHARS or "\n" in previous.text
+        previous = token
+    return doc
+
+def _model_config_path(model_name):
+    """モデル名またはパスから、モデルの config.cfg のパスを返します。"""
+    path = Path(model_name)
+    if not path.exists():
+        path = spacy.util.get_package_path(model_name)
+    if (path / "config.cfg").exists():
+        return path / "config.cfg"
+    # パッケージとしてインストールされたモデルは <パッケージ>/<名前>-<バージョン>/config.cfg に配置される
+    candidates = sorted(path.glob("*/config.cfg"))
+    if not candidates:
+        raise FileNotFoundError(f"config.cfg が見つかりません: {model_name}")
+    return candidates[-1]
+
+def _find_listener_upstreams(node):
+    """コンポーネント設定を再帰的に走査し、Tok2Vec/Transformer リスナーの upstream 名を返します。"""
+    upstreams = set()
+    if isinstance(node, dict):
+        architecture = node.get("@architectures", "")
+        if "Listener" in architecture:
+            upstreams.add(node.get("upstream", "*"))
+        for value in node.values():
+            upstreams |= _find_listener_upstreams(value)
+    return upstreams
+
+def excluded_components(model_name, required_components):
+    """
+    required_components の動作に必要なコンポーネント（リスナーが参照する tok2vec など）を残し、
+    それ以外のコンポーネント名をリストで返します。
+    """
+    model_config = spacy.util.load_config(_model_config_path(model_name), interpolate=False)
+    pipeline = list(model_config["nlp"]["pipeline"])
+    components = model_config["components"]
+
+    keep = {name for name in required_components if name in pipeline}
+    for name in list(keep):
+        for upstream in _find_listener_upstreams(dict(components.get(name, {}))):
+            if upstream == "*":
+                keep |= {
+                    other for other in pipeline
+                    if components.get(other, {}).get("factory") in _EMBEDDING_FACTORIES
+                }
+            elif upstream in pipeline:
+                keep.add(upstream)
+
+    return [name for name in pipeline if name not in keep]
+
+class JapaneseSpacyNlpEngine(SpacyNlpEngine):
+    """
+    日本語モデルのトークナイザーと Morphologizer を、形態素情報をキャッシュする実装に置き換える SpacyNlpEngine。
+    長時間の処理や巨大なファイルのストリーミング処理でメモリ使用量が増え続けないようにします（redactor.morph_cache）。
+    """
+
+    def load(self):
+        super().load()
+        for nlp in self.nlp.values():
+            use_cached_morph(nlp)
+
+class MinimalSpacyNlpEngine(SpacyNlpEngine):
+    """
+    config.NLP_REQUIRED_COMPONENTS 以外のコンポーネントを読み込まない SpacyNlpEngine。
+    除外したコンポーネントはメモリにも載らないため、disable よりも RSS を削減できます。
+    parser を除外した場合は newline_sentencizer を ner の前に追加します。
+    """
+
+    def load(self):
+        self.nlp = {}
+        for model in self.models:
+            self._validate_model_params(model)
+            self._download_spacy_model_if_needed(model["model_name"])
+            exclude = excluded_components(model["model_name"], config.NLP_REQUIRED_COMPONENTS)
+            nlp = spacy.load(model["model_name"], exclude=exclude)
+            # 文境界を与えていたコンポーネントを除外した場合は、軽量な文分割で代替する
+            if "ner" in nlp.pipe_names and any(name in exclude for name in _SENTENCE_COMPONENTS):
+                nlp.add_pipe("newline_sentencizer", before="ner")
+            self.nlp[model["lang_code"]] = use_cached_morph(nlp)
+
+def create_nlp_engine():
+    """config の設定に従って NLP エンジンを作成します。"""
+    if config.NLP_CONFIG.get("nlp_engine_name") == "spacy":
+        engine_class = MinimalSpacyNlpEngine if config.NLP_MINIMAL_PIPELINE else JapaneseSpacyNlpEngine
+        provider = NlpEngineProvider(
+            nlp_engines=(engine_class,),
+            nlp_configuration=config.NLP_CONFIG,
+        )
+    else:
+        provider = NlpEngineProvider(nlp_configuration=config.NLP_CONFIG)
+    return provider.create_engine()
+
+def pipeline_components(nlp_engine):
+    """読み込まれた spaCy パイプラインのコンポーネント名を言語ごとに返します。"""
+    return {lang: list(nlp.pipe_names) for lang, nlp in nlp_engine.nlp.items()}
@@ -0,0 +1,291 @@
+"""
+複数のカスタム PatternRecognizer を 1 つの Recognizer にまとめて実行するスキャナーです。
+
+Recognizer ごとに発生していた以下のコストをまとめて削減します。
+- Recognizer ごとの結果生成・重複除去（Presidio の remove_duplicates は O(n²)）
+- LemmaContextAwareEnhancer による検出結果ごとのトークン全走査（O(結果数 × トークン数)）
+
+検出結果・スコア・コンテキストによるスコア補正は、個別の PatternRecognizer を
+登録した場合と同じになるように実装しています。
+"""
+
+import bisect
+import logging
+import time
+
+# Presidio の PatternRecognizer と同じ regex モジュールを使用する（\b などの挙動を揃えるため）
+import regex as re
+from presidio_analyzer import LocalRecognizer, RecognizerResult, PatternRecognizer, EntityRecognizer
+# PatternRecognizer と同じ正規表現のタイムアウト（環境変数 REGEX_TIMEOUT_SECONDS、既定 60 秒）
+from presidio_analyzer.pattern_recognizer import REGEX_TIMEOUT_SECONDS
+
+try:
+    from .intervals import ContainmentIndex
+except ImportError:
+    from intervals import ContainmentIndex
+
+# Presidio の PatternRecognizer と同じ既定フラグ
+DEFAULT_REGEX_FLAGS = re.DOTALL | re.MULTILINE | re.IGNORECASE
+
+# recognition_metadata にパターン情報を残すためのキー
+PATTERN_NAME_KEY = "pattern_name"
+PATTERN_GROUP_KEY = "pattern_group"
+
+logger = logging.getLogger("presidio-analyzer")
+
+
+def pattern_key(entity_type, pattern_name):
+    """パターンごとの集計キー（プロファイリング用）を返します。"""
+    return f"{entity_type}:{pattern_name}"
+
+
+def remove_contained(results):
+    """
+    EntityRecognizer.remove_duplicates と同じ規則で重複・包含された結果を除去します。
+
+    スコア降順・開始位置昇順・長さ降順で並べ、既に採用した結果に包含されるものを除外します。
+    包含判定は ContainmentIndex で行うため O(n log n) です。
+    同一エンティティタイプの結果のみを渡すことを前提とします。
+    """
+    if not results:
+        return []
+    results = sorted(results, key=lambda x: (-x.score, x.start, -(x.end - x.start)))
+    index = ContainmentIndex(r.start for r in results)
+    filtered_results = []
+
+    for result in results:
+        if result.score == 0:
+            continue
+        if index.contains(result.start, result.end):
+            continue
+        filtered_results.append(result)
+        index.add(result.start, result.end)
+
+    return filtered_results
+
+
+def remove_duplicates(results):
+    """
+    EntityRecognizer.remove_duplicates（AnalyzerEngine.analyze の最終段）と同じ結果を返す重複除去です。
+
+    元の実装は採用済みの全結果と比較するため O(n²) で、大きな文書では分析時間の大半を占めます。
+    エンティティタイプごとの ContainmentIndex で包含判定を行い O(n log n) にしています。
+    出力の順序も元の実装と同じです。
+    """
+    results = sorted(set(results), key=lambda x: (-x.score, x.start, -(x.end - x.start)))
+    starts_by_type = {}
+    for result in results:
+        starts_by_type.setdefault(result.entity_type, []).append(result.start)
+    indexes = {entity_type: ContainmentIndex(starts) for entity_type, starts in starts_by_type.items()}
+    filtered_results = []
+
+    for result in results:
+        if result.score == 0:
+            continue
+        # 同一の結果は包含判定にも該当するため、元の実装の一致判定は包含判定に含まれる
+        index = indexes[result.entity_type]
+        if index.contains(result.start, result.end):
+            continue
+        filtered_results.append(result)
+        index.add(result.start, result.end)
+
+    return filtered_results
+
+
+class MultiPatternRecognizer(LocalRecognizer):
+    """
+    複数の PatternRecognizer の定義（エンティティ・パターン・コンテキスト単語）を
+    まとめて保持し、1 回の analyze 呼び出しですべてのパターンを評価する Recognizer。
+
+    コンテキストによるスコア補正は本クラスで行い（enhance_using_context）、
+    AnalyzerEngine 側のエンハンサーが同じ結果を再走査しないようにします。
+    """
+
+    def __init__(
+        self,
+        recognizers,
+        context_aware_enhancer=None,
+        supported_language="ja",
+        name="MultiPatternRecognizer",
+        global_regex_flags=DEFAULT_REGEX_FLAGS,
+    ):
+        """
+        :param recognizers: まとめる PatternRecognizer のリスト
+        :param context_aware_enhancer: AnalyzerEngine に設定したものと同じ LemmaContextAwareEnhancer
+        :param supported_language: 対応言語
+        :param name: Recognizer 名
+        :param global_regex_flags: 正規表現のフラグ
+        """
+        supported_entities = []
+        for recognizer in recognizers:
+            for entity in recognizer.supported_entities:
+                if entity not in supported_entities:
+                    supported_entities.append(entity)
+
+        super().__init__(
+            supported_entities=supported_entities,
+            supported_language=supported_language,
+            name=name,
+        )
+        # AnalyzerEngine のエンハンサーに処理させないため、Recognizer 自体のコンテキストは空にする
+        self.context = None
+        self.context_aware_enhancer = context_aware_enhancer
+        self.global_regex_flags = global_regex_flags
+        # パターンごとの処理時間・一致数を記録する dict（profiling.instrument_recognizers が設定する）
+        self.profile = None
+
+        # グループ = 元の PatternRecognizer 1 つ分
+        # (エンティティタイプ, グループ名, コンテキスト単語, [(パターン名, 正規表現, コンパイル済み, スコア), ...])
+        self.groups = []
+        self._pattern_regex = {}
+        for index, recognizer in enumerate(recognizers):
+            entity_type = recognizer.supported_entities[0]
+            group_name = f"{entity_type}:{recognizer.patterns[0].name}" if recognizer.patterns else f"{entity_type}:{index}"
+            patterns = [
+                (pattern.name, pattern.regex, re.compile(pattern.regex, flags=global_regex_flags), pattern.score)
+                for pattern in recognizer.patterns
+            ]
+            self.groups.append((entity_type, group_name, recognizer.context or [], patterns))
+            for pattern_name, regex, _, _ in patterns:
+                self._pattern_regex[(index, pattern_name)] = regex
+
+    def load(self):  # noqa: D102
+        pass
+
+    def scan(self, text, entities=None):
+        """
+        テキストを走査し、すべてのパターンの一致を返します。
+        PatternRecognizer と同じく、REGEX_TIMEOUT_SECONDS 秒を超えたパターンは警告して以降の一致を打ち切ります
+        （バックトラックが爆発するパターンで分析全体が止まらないようにするため）。
+
+        :return: (開始位置, 終了位置, エンティティタイプ, パターン名, ベーススコア, グループ番号) のリスト
+        """
+        profile = getattr(self, "profile", None)
+        matches = []
+        for group_index, (entity_type, _, _, patterns) in enumerate(self.groups):
+            if entities is not None and entity_type not in entities:
+                continue
+            for pattern_name, _, compiled, score in patterns:
+                if profile is not None:
+                    start_time = time.perf_counter()
+                    matched_before = len(matches)
+                try:
+                    for match in compiled.finditer(text, timeout=REGEX_TIMEOUT_SECONDS):
+                        start, end = match.span()
+                        if start == end:
+                            continue
+                        matches.append((start, end, entity_type, pattern_name, score, group_index))
+                except TimeoutError:
+                    logger.warning(
+                        "Regex pattern '%s' timed out after %s seconds, skipping.",
+                        pattern_name,
+                        REGEX_TIMEOUT_SECONDS,
+                        exc_info=True,
+                    )
+                if profile is not None:
+                    stats = profile.setdefault(
+                        pattern_key(entity_type, pattern_name), {"seconds": 0.0, "candidates": 0, "survivors": 0}
+                    )
+                    stats["seconds"] += time.perf_counter() - start_time
+                    stats["candidates"] += len(matches) - matched_before
+        return matches
+
+    def analyze(self, text, entities, nlp_artifacts=None, regex_flags=None):
+        """
+        すべてのパターンを評価し、グループ（元の Recognizer）単位で重複を除去した結果を返します。
+        """
+        grouped = {}
+        for start, end, entity_type, pattern_name, score, group_index in self.scan(text, entities):
+            group_name = self.groups[group_index][1]
+            explanation = PatternRecognizer.build_regex_explanation(
+                group_name,
+                pattern_name,
+                self._pattern_regex[(group_index, pattern_name)],
+                score,
+                None,
+                self.global_regex_flags,
+            )
+            result = RecognizerResult(
+                entity_type=entity_type,
+                start=start,
+                end=end,
+                score=score,
+                analysis_explanation=explanation,
+                recognition_metadata={
+                    RecognizerResult.RECOGNIZER_NAME_KEY: self.name,
+                    RecognizerResult.RECOGNIZER_IDENTIFIER_KEY: self.id,
+                    PATTERN_NAME_KEY: pattern_name,
+                    PATTERN_GROUP_KEY: group_index,
+                },
+            )
+            grouped.setdefault(group_index, []).append(result)
+
+        results = []
+        for group_index in sorted(grouped):
+            results.extend(remove_contained(grouped[group_index]))
+        return results
+
+    def enhance_using_context(
+        self,
+        text,
+        raw_recognizer_results,
+        other_raw_recognizer_results,
+        nlp_artifacts,
+        context=None,
+    ):
+        """
+        LemmaContextAwareEnhancer と同じ規則でコンテキスト単語によるスコア補正を行います。
+
+        トークン位置と検索対象のキーワード位置を事前に並べておき、
+        検出結果ごとの探索を二分探索で行います。
+        """
+        enhancer = self.context_aware_enhancer
+        if enhancer is None or nlp_artifacts is None or not nlp_artifacts.tokens:
+            return raw_recognizer_results
+
+        context = [word.lower() for word in context] if context else []
+
+        # 各トークンの終了位置（_find_index_of_match_token の探索を二分探索に置き換える）
+        token_ends = [
+            index + len(token)
+            for index, token in zip(nlp_artifacts.tokens_indices, nlp_artifacts.tokens)
+        ]
+        # キーワードに該当するレンマの位置（_add_n_words の走査を二分探索に置き換える）
+        keywords = set(nlp_artifacts.keywords)
+        lemmas = [lemma.lower() for lemma in nlp_artifacts.lemmas]
+        keyword_positions = [i for i, lemma in enumerate(lemmas) if lemma in keywords]
+
+        for result in raw_recognizer_results:
+            group_index = result.recognition_metadata.get(PATTERN_GROUP_KEY)
+            if group_index is None:
+                continue
+            group_context = self.groups[group_index][2]
+            if not group_context:
+                continue
+            if result.recognition_metadata.get(RecognizerResult.IS_SCORE_ENHANCED_BY_CONTEXT_KEY):
+                continue
+
+            token_index = bisect.bisect_right(token_ends, result.start)
+            if token_index >= len(token_ends):
+                continue
+
+            # 対象トークン自身を含めて前方 prefix_count + 1 語、後方 suffix_count + 1 語
+            backward_end = bisect.bisect_right(keyword_positions, token_index)
+            backward = keyword_positions[max(0, backward_end - (enhancer.context_prefix_count + 1)):backward_end]
+            forward_start = bisect.bisect_left(keyword_positions, token_index)
+            forward = keyword_positions[forward_start:forward_start + enhancer.context_suffix_count + 1]
+            surrounding_words = list({lemmas[i] for i in backward} | {lemmas[i] for i in forward})
+            surrounding_words.extend(context)
+
+            supportive_context_word = enhancer._find_supportive_word_in_context(
+                surrounding_words, group_context, enhancer.context_matching_mode
+            )
+            if supportive_context_word != "":
+                result.score += enhancer.context_similarity_factor
+                result.score = max(result.score, enhancer.min_score_with_context_similarity)
+                result.score = min(result.score, EntityRecognizer.MAX_SCORE)
+                result.analysis_explanation.set_supportive_context_word(supportive_context_word)
+                result.analysis_explanation.set_improved_score(result.score)
+                result.recognition_metadata[RecognizerResult.IS_SCORE_ENHANCED_BY_CONTEXT_KEY] = True
+
+        return raw_recognizer_results
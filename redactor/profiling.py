@@ -0,0 +1,138 @@
+"""
+分析処理のプロファイリング（Recognizer・フィルタ段階ごとの処理時間と件数の計測）です。
+
+redactor.analyze_text(..., profile={}) のように dict を渡した場合のみ計測し、
+1 回の分析ごとに以下の構造で結果を書き込みます。
+
+    {
+        "total_seconds": 全体の処理時間,
+        "stages": {
+            "form_fields": {"seconds", "output"},                # フォーム形式の行の高速処理（有効な場合）
+            "nlp": {"seconds"},                                  # spaCy（NER・トークン化）
+            "recognizers": {"seconds", "output"},                # 全 Recognizer の合計
+            "analyzer_postprocess": {"seconds", "input", "output"},  # コンテキスト補正・閾値・重複除去
+            "filter_common_words": {"seconds", "input", "output"},
+        },
+        "recognizers": {Recognizer 名: {"seconds", "candidates", "survivors"}},
+        "patterns": {"エンティティ:パターン名": {"seconds", "candidates", "survivors"}},
+    }
+
+candidates は Recognizer（パターン）が出力した候補数、survivors は filter_common_words 後まで
+残った検出結果の数です。patterns は MultiPatternRecognizer 内のパターンごとの内訳です。
+"""
+
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from presidio_analyzer import RecognizerResult
+
+try:
+    from .pattern_scanner import MultiPatternRecognizer, PATTERN_NAME_KEY, pattern_key
+except ImportError:
+    from pattern_scanner import MultiPatternRecognizer, PATTERN_NAME_KEY, pattern_key
+
+
+def new_profile():
+    """空のプロファイルを返します。"""
+    return {"total_seconds": 0.0, "stages": {}, "recognizers": {}, "patterns": {}}
+
+
+def recognizer_keys(recognizers):
+    """
+    Recognizer の id から集計キー（Recognizer 名）への対応を返します。
+    同名の Recognizer（個別登録の PatternRecognizer など）はエンティティタイプで区別します。
+    """
+    names = Counter(recognizer.name for recognizer in recognizers)
+    keys = {}
+    for recognizer in recognizers:
+        key = recognizer.name
+        if names[key] > 1:
+            key = f"{key}:{','.join(recognizer.supported_entities)}"
+        keys[recognizer.id] = key
+    return keys
+
+
+@contextmanager
+def instrument_recognizers(recognizers, profile):
+    """
+    with ブロック内で、各 Recognizer の analyze の処理時間と候補数を profile に記録します。
+    MultiPatternRecognizer はパターンごとの内訳も記録します。
+    """
+    keys = recognizer_keys(recognizers)
+    recognizer_stats = profile["recognizers"]
+    originals = []
+
+    def wrap(recognizer, analyze, key):
+        def timed_analyze(*args, **kwargs):
+            start_time = time.perf_counter()
+            results = analyze(*args, **kwargs)
+            stats = recognizer_stats.setdefault(key, {"seconds": 0.0, "candidates": 0, "survivors": 0})
+            stats["seconds"] += time.perf_counter() - start_time
+            stats["candidates"] += len(results or [])
+            return results
+        return timed_analyze
+
+    try:
+        for recognizer in recognizers:
+            originals.append(recognizer)
+            # インスタンス属性で上書きし、終了時に削除してクラスのメソッドに戻す
+            recognizer.analyze = wrap(recognizer, recognizer.analyze, keys[recognizer.id])
+            if isinstance(recognizer, MultiPatternRecognizer):
+                recognizer.profile = profile["patterns"]
+        yield keys
+    finally:
+        for recognizer in originals:
+            recognizer.__dict__.pop("analyze", None)
+            if isinstance(recognizer, MultiPatternRecognizer):
+                recognizer.profile = None
+
+
+def count_survivors(profile, results, keys):
+    """filter_common_words 後の検出結果を、出力元の Recognizer・パターンごとに数えます。"""
+    for result in results:
+        metadata = result.recognition_metadata or {}
+        key = keys.get(metadata.get(RecognizerResult.RECOGNIZER_IDENTIFIER_KEY))
+        if key is not None:
+            profile["recognizers"].setdefault(key, {"seconds": 0.0, "candidates": 0, "survivors": 0})["survivors"] += 1
+        pattern_name = metadata.get(PATTERN_NAME_KEY)
+        if pattern_name is not None:
+            stats = profile["patterns"].setdefault(
+                pattern_key(result.entity_type, pattern_name), {"seconds": 0.0, "candidates": 0, "survivors": 0}
+            )
+            stats["survivors"] += 1
+
+
+def merge_profile(total, profile):
+    """profile の値を total に加算します（evaluate_all での集計用）。"""
+    total["total_seconds"] += profile["total_seconds"]
+    for section in ("stages", "recognizers", "patterns"):
+        for key, stats in profile[section].items():
+            merged = total[section].setdefault(key, {})
+            for name, value in stats.items():
+                merged[name] = merged.get(name, 0) + value
+    return total
+
+
+def format_profile(profile, files=1):
+    """プロファイルを表形式の文字列（行のリスト）にします。処理時間の長い順に並べます。"""
+    total = profile["total_seconds"] or 1e-12
+    lines = [f"{'段階':<36} {'時間(ms)':>10} {'割合':>7} {'入力':>8} {'出力':>8}"]
+    for key, stats in profile["stages"].items():
+        lines.append(
+            f"{key:<36} {stats['seconds'] * 1000 / files:>10.2f} {stats['seconds'] / total * 100:>6.1f}%"
+            f" {stats.get('input', ''):>8} {stats.get('output', ''):>8}"
+        )
+    for section, title in (("recognizers", "Recognizer"), ("patterns", "パターン（MultiPatternRecognizer 内訳）")):
+        if not profile[section]:
+            continue
+        lines.append("")
+        lines.append(f"{title:<36} {'時間(ms)':>10} {'割合':>7} {'候補数':>8} {'残存数':>8}")
+        for key, stats in sorted(profile[section].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(
+                f"{key:<36} {stats['seconds'] * 1000 / files:>10.2f} {stats['seconds'] / total * 100:>6.1f}%"
+                f" {stats['candidates']:>8} {stats['survivors']:>8}"
+            )
+    if files > 1:
+        lines.append(f"（時間は {files} ファイルの平均、件数は合計）")
+    return lines
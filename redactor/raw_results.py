@@ -0,0 +1,169 @@
+"""
+閾値を適用する前の分析結果（RecognizerResult）をコーパス単位で保存する、閾値スイープ用のキャッシュです。
+
+redactor.evaluate の --raw-cache が文書ごとに 1 回だけ閾値なしで分析した結果を保存し、
+任意の閾値の組み合わせ（・パターンのベーススコアの変更）に対する精度を、再分析せずに計算します。
+
+ファイルは NumPy の圧縮形式（.npz）で、検出結果 1 件を以下の配列の 1 要素として保持します。
+
+    start, end       検出位置（int32）
+    entity           エンティティタイプ（entity_types の番号、int16）
+    recognizer       Recognizer 名（recognizers の番号、int16）
+    pattern          パターン名（patterns の番号、パターン以外の Recognizer は -1、int16）
+    score            コンテキストによる補正後のスコア（float64、閾値と正確に比較するため単精度にしない）
+    original_score   コンテキストによる補正前のスコア（float64）
+    enhanced         コンテキストによりスコアを補正したかどうか（bool）
+
+文書ごとの範囲は offsets（文書 i の検出結果は offsets[i]:offsets[i + 1]）で表し、文書名と内容のハッシュ、
+作成時の設定のフィンガープリント・コンテキスト補正の設定（metadata）を合わせて保存します。
+result_cache と同様に、元のテキストや PII の値は保存しません（照合時は文書を読み直します）。
+"""
+
+import hashlib
+import json
+
+import numpy as np
+from presidio_analyzer import EntityRecognizer, RecognizerResult
+
+try:
+    from . import snapshot
+    from .pattern_scanner import PATTERN_NAME_KEY
+except ImportError:
+    import snapshot
+    from pattern_scanner import PATTERN_NAME_KEY
+
+RAW_RESULTS_SUFFIX = ".npz"
+
+
+def document_hash(text):
+    """文書の内容のハッシュ（キャッシュ作成後に文書が変更されていないかの確認用）を返します。"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _pattern_name(result):
+    """検出結果のパターン名を返します（MultiPatternRecognizer はメタデータ、PatternRecognizer は判定過程から取得）。"""
+    metadata = result.recognition_metadata or {}
+    if metadata.get(PATTERN_NAME_KEY) is not None:
+        return metadata[PATTERN_NAME_KEY]
+    explanation = result.analysis_explanation
+    return getattr(explanation, "pattern_name", None) if explanation is not None else None
+
+
+class RawResultsBuilder:
+    """文書ごとの検出結果（return_decision_process=True で分析したもの）を追加し、save() で保存します。"""
+
+    def __init__(self, metadata=None):
+        self.metadata = dict(metadata or {})
+        self.documents = []
+        self.hashes = []
+        self.offsets = [0]
+        self._columns = {name: [] for name in ("start", "end", "entity", "recognizer", "pattern", "score", "original_score", "enhanced")}
+        self._names = {"entity": {}, "recognizer": {}, "pattern": {}}
+
+    def _code(self, table, name):
+        return self._names[table].setdefault(name, len(self._names[table]))
+
+    def add_document(self, name, text_hash, results):
+        """文書の検出結果を追加します。"""
+        columns = self._columns
+        for result in results:
+            metadata = result.recognition_metadata or {}
+            explanation = result.analysis_explanation
+            pattern = _pattern_name(result)
+            columns["start"].append(result.start)
+            columns["end"].append(result.end)
+            columns["entity"].append(self._code("entity", result.entity_type))
+            columns["recognizer"].append(self._code("recognizer", metadata.get(RecognizerResult.RECOGNIZER_NAME_KEY, "")))
+            columns["pattern"].append(self._code("pattern", pattern) if pattern is not None else -1)
+            columns["score"].append(result.score)
+            columns["original_score"].append(explanation.original_score if explanation is not None else result.score)
+            columns["enhanced"].append(bool(metadata.get(RecognizerResult.IS_SCORE_ENHANCED_BY_CONTEXT_KEY)))
+        self.documents.append(name)
+        self.hashes.append(text_hash)
+        self.offsets.append(len(columns["start"]))
+
+    def save(self, path):
+        """キャッシュを保存します（fingerprint は作成時の設定・コードのフィンガープリント）。"""
+        columns = self._columns
+        metadata = dict(self.metadata, fingerprint=self.metadata.get("fingerprint") or snapshot.config_fingerprint())
+        np.savez_compressed(
+            path,
+            start=np.asarray(columns["start"], dtype=np.int32),
+            end=np.asarray(columns["end"], dtype=np.int32),
+            entity=np.asarray(columns["entity"], dtype=np.int16),
+            recognizer=np.asarray(columns["recognizer"], dtype=np.int16),
+            pattern=np.asarray(columns["pattern"], dtype=np.int16),
+            score=np.asarray(columns["score"], dtype=np.float64),
+            original_score=np.asarray(columns["original_score"], dtype=np.float64),
+            enhanced=np.asarray(columns["enhanced"], dtype=bool),
+            offsets=np.asarray(self.offsets, dtype=np.int64),
+            documents=np.asarray(self.documents, dtype=str),
+            hashes=np.asarray(self.hashes, dtype=str),
+            entity_types=np.asarray(list(self._names["entity"]), dtype=str),
+            recognizers=np.asarray(list(self._names["recognizer"]), dtype=str),
+            patterns=np.asarray(list(self._names["pattern"]), dtype=str),
+            metadata=np.asarray(json.dumps(metadata, ensure_ascii=False)),
+        )
+
+
+class RawResults:
+    """保存したキャッシュを読み込み、閾値・ベーススコアを変えた検出結果を作成します。"""
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            for name in ("start", "end", "entity", "recognizer", "pattern", "score", "original_score", "enhanced", "offsets"):
+                setattr(self, name, data[name])
+            self.documents = data["documents"].tolist()
+            self.hashes = data["hashes"].tolist()
+            self.entity_types = data["entity_types"].tolist()
+            self.recognizers = data["recognizers"].tolist()
+            self.patterns = data["patterns"].tolist()
+            self.metadata = json.loads(data["metadata"].item())
+
+    def __len__(self):
+        return len(self.score)
+
+    def is_current(self):
+        """作成時と現在の設定・コードのフィンガープリントが一致するかを返します。"""
+        return self.metadata.get("fingerprint") == snapshot.config_fingerprint()
+
+    def pattern_summary(self):
+        """パターンごとの (パターン名, 件数, ベーススコア) のリストを返します（rescore で指定できる名前の一覧）。"""
+        summary = []
+        for code, name in enumerate(self.patterns):
+            mask = self.pattern == code
+            scores = np.unique(self.original_score[mask])
+            summary.append((name, int(mask.sum()), scores.tolist()))
+        return summary
+
+    def rescore(self, base_scores):
+        """
+        パターンのベーススコア（{パターン名: スコア}、config の *_SCORE に相当）を変更した場合のスコアの配列を返します。
+        コンテキストにより補正された検出結果は、作成時と同じ規則（+context_similarity_factor、
+        min_score_with_context_similarity 以上、1.0 以下）で補正し直します。
+
+        Presidio の重複除去はキャッシュ作成時のスコアで適用済みのため、同じタイプで包含関係にある検出結果の
+        スコアの大小が入れ替わる場合は、その設定で分析した結果と一致しないことがあります。
+        """
+        score = self.score.copy()
+        factor = self.metadata.get("context_similarity_factor", 0.0)
+        min_score = self.metadata.get("min_score_with_context_similarity", 0.0)
+        for name, base_score in base_scores.items():
+            if name not in self.patterns:
+                raise KeyError(f"キャッシュにないパターンです: {name}")
+            mask = self.pattern == self.patterns.index(name)
+            enhanced = np.minimum(np.maximum(base_score + factor, min_score), EntityRecognizer.MAX_SCORE)
+            score[mask] = np.where(self.enhanced[mask], enhanced, base_score)
+        return score
+
+    def document_results(self, index, score=None):
+        """文書 index の検出結果を RecognizerResult のリスト（スコアは score、省略時は作成時のスコア）で返します。"""
+        score = self.score if score is None else score
+        begin, end = self.offsets[index], self.offsets[index + 1]
+        entity_types = self.entity_types
+        return [
+            RecognizerResult(entity_types[entity], int(start), int(stop), float(value))
+            for start, stop, entity, value in zip(
+                self.start[begin:end], self.end[begin:end], self.entity[begin:end], score[begin:end]
+            )
+        ]
@@ -1,25 +1,56 @@
+import io
 import os
-import sys
 import argparse
 import re
+import time
+import multiprocessing
 from pathlib import Path
-from presidio_analyzer import AnalyzerEngine, PatternRecognizer, Pattern
-from presidio_anonymizer import AnonymizerEngine
-from presidio_anonymizer.entities import OperatorConfig
-from presidio_analyzer.nlp_engine import NlpEngineProvider
+from presidio_analyzer import PatternRecognizer, Pattern, RecognizerResult
 from presidio_analyzer.context_aware_enhancers import LemmaContextAwareEnhancer
 
 # 設定ファイルをインポート
 try:
     from . import config
+    from .pattern_scanner import MultiPatternRecognizer
+    from .analyzer_engine import DeduplicatingAnalyzerEngine
+    from .intervals import ContainmentIndex
+    from . import snapshot
+    from .nlp_pipeline import create_nlp_engine
+    from .streaming import redact_stream
+    from .manifest import RedactionManifest, file_sha256
+    from .keywords import KeywordAutomaton
+    from .anonymizer import EntityAnonymizer, AnonymizedText
+    from .result_cache import ResultCache, split_blocks
+    from .form_fields import split_form_fields, merge_form_results
+    from . import profiling
 except ImportError:
     import config
+    from pattern_scanner import MultiPatternRecognizer
+    from analyzer_engine import DeduplicatingAnalyzerEngine
+    from intervals import ContainmentIndex
+    import snapshot
+    from nlp_pipeline import create_nlp_engine
+    from streaming import redact_stream
+    from manifest import RedactionManifest, file_sha256
+    from keywords import KeywordAutomaton
+    from anonymizer import EntityAnonymizer, AnonymizedText
+    from result_cache import ResultCache, split_blocks
+    from form_fields import split_form_fields, merge_form_results
+    import profiling
 
-def setup_analyzer():
-    """Presidio AnalyzerEngine を日本語サポートとカスタム Recognizer でセットアップします。"""
-    # 設定ファイルから NLP 設定を取得
-    provider = NlpEngineProvider(nlp_configuration=config.NLP_CONFIG)
-    nlp_engine = provider.create_engine()
+def setup_analyzer(timings=None):
+    """
+    Presidio AnalyzerEngine を日本語サポートとカスタム Recognizer でセットアップします。
+
+    timings に dict を渡すと、フェーズごとの所要時間（秒）を書き込みます。
+    """
+    if timings is None:
+        timings = {}
+
+    # 設定ファイルから NLP 設定を取得（最小構成モードでは不要なコンポーネントを読み込まない）
+    phase_start = time.perf_counter()
+    nlp_engine = create_nlp_engine()
+    timings["nlp_engine"] = time.perf_counter() - phase_start
     
     # 日本語向けのコンテキストエンハンサーを設定
     # コンテキスト単語が見つかった場合のスコア向上率を調整
@@ -31,13 +62,19 @@ def setup_analyzer():
     )
     
     # 設定ファイルから閾値を取得
-    analyzer = AnalyzerEngine(
+    # 最終段の重複除去（Presidio の実装は O(n²)）は同じ結果を返す O(n log n) の実装で行う
+    phase_start = time.perf_counter()
+    analyzer = DeduplicatingAnalyzerEngine(
         nlp_engine=nlp_engine, 
         default_score_threshold=config.DEFAULT_SCORE_THRESHOLD,
         context_aware_enhancer=context_aware_enhancer
     )
+    timings["analyzer_engine"] = time.perf_counter() - phase_start
+    phase_start = time.perf_counter()
 
     # --- 日本語向けのカスタム Recognizer ---
+    # ここで定義した Recognizer は最後にまとめて AnalyzerEngine に登録する
+    custom_recognizers = []
 
     # 1. 日本の電話番号 Recognizer
     # より厳密な日本の電話番号パターン（0始まり、10〜11桁の構成を想定）
@@ -52,7 +89,7 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("PHONE_NUMBER"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(jp_phone_recognizer)
+    custom_recognizers.append(jp_phone_recognizer)
 
     # 2. メールアドレス Recognizer
     email_pattern = Pattern(
@@ -65,7 +102,7 @@ def setup_analyzer():
         patterns=[email_pattern],
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(email_recognizer)
+    custom_recognizers.append(email_recognizer)
 
     # 3. クレジットカード Recognizer
     cc_pattern = Pattern(
@@ -79,7 +116,7 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("CREDIT_CARD"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(cc_recognizer)
+    custom_recognizers.append(cc_recognizer)
 
     # 4. ローマ字氏名 Recognizer
     # 大文字の 苗字 名前 または 名前 苗字
@@ -94,7 +131,7 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("PERSON"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(romaji_name_recognizer)
+    custom_recognizers.append(romaji_name_recognizer)
 
     # 4b. 日本語氏名 Recognizer (漢字・かな・カナ、文脈重視)
     # より柔軟なパターン：特定の記号への依存を減らし、一般的な区切り文字に対応
@@ -116,7 +153,7 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("PERSON"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(jp_name_recognizer)
+    custom_recognizers.append(jp_name_recognizer)
 
     # 5. 日本の組織名 Recognizer (接尾辞による補完、より柔軟なパターン)
     # より汎用的な組織名パターン：接尾辞の前の文字列も柔軟に
@@ -132,7 +169,7 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("ORG"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(org_recognizer)
+    custom_recognizers.append(org_recognizer)
     
     # 5b. ORGANIZATIONエンティティ用のRecognizer（Presidioが返す可能性がある形式）
     organization_recognizer = PatternRecognizer(
@@ -141,7 +178,7 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("ORGANIZATION"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(organization_recognizer)
+    custom_recognizers.append(organization_recognizer)
 
     # 5c. 日本の住所 Recognizer (LOCATION)
     # 都道府県名 + 市区町村 + 番地 + 建物名のパターン
@@ -161,12 +198,12 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("MY_NUMBER"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(mynumber_recognizer)
+    custom_recognizers.append(mynumber_recognizer)
 
     # 7. 運転免許証番号 Recognizer (12桁、前後の「第」「号」を許容)
     license_pattern = Pattern(
         name="license_pattern",
-        regex=r"(?:第?\s*)?(\d{12})(?:\s*号)?",
+        regex=r"(?:第\s*)?(\d{12})(?:\s*号)?",
         score=config.DRIVERS_LICENSE_SCORE
     )
     license_recognizer = PatternRecognizer(
@@ -175,7 +212,7 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("DRIVERS_LICENSE"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(license_recognizer)
+    custom_recognizers.append(license_recognizer)
 
     # 8. パスポート番号 Recognizer (英字1-2文字 + 数字7-8桁)
     passport_pattern = Pattern(
@@ -189,7 +226,7 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("PASSPORT"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(passport_recognizer)
+    custom_recognizers.append(passport_recognizer)
 
     # 9. 口座番号 Recognizer (7桁)
     bank_account_pattern = Pattern(
@@ -203,7 +240,7 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("BANK_ACCOUNT"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(bank_account_recognizer)
+    custom_recognizers.append(bank_account_recognizer)
 
     # 10. 納税者番号 / 登録番号 Recognizer (T + 13桁)
     tax_number_pattern = Pattern(
@@ -217,7 +254,7 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("TAX_NUMBER"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(tax_number_recognizer)
+    custom_recognizers.append(tax_number_recognizer)
 
     # 11. パスワード Recognizer (文脈重視 + より柔軟なパターン)
     # look-behindは固定幅である必要があるため、別のアプローチを使用
@@ -244,7 +281,7 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("PASSWORD"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(password_recognizer)
+    custom_recognizers.append(password_recognizer)
 
     # 12. Secret Key Recognizer (文脈重視 + プレフィックス対応)
     secret_key_patterns = [
@@ -265,7 +302,7 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("SECRET_KEY"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(secret_key_recognizer)
+    custom_recognizers.append(secret_key_recognizer)
 
     # 13. 証明書 / 秘密鍵 Recognizer (ブロック検出)
     cert_pattern = Pattern(
@@ -278,7 +315,7 @@ def setup_analyzer():
         patterns=[cert_pattern],
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(cert_recognizer)
+    custom_recognizers.append(cert_recognizer)
 
     # 14. セキュリティコード Recognizer (3-4桁、文脈重視)
     security_code_pattern = Pattern(
@@ -292,7 +329,7 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("SECURITY_CODE"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(security_code_recognizer)
+    custom_recognizers.append(security_code_recognizer)
 
     # 15. 暗証番号（PIN）Recognizer (4桁、文脈必須)
     # 暗証番号は通常4桁の数字で、コンテキスト単語と一緒に出現
@@ -307,10 +344,38 @@ def setup_analyzer():
         context=config.CONTEXT_WORDS.get("PIN"),
         supported_language="ja"
     )
-    analyzer.registry.add_recognizer(pin_recognizer)
+    custom_recognizers.append(pin_recognizer)
+
+    if config.USE_COMBINED_PATTERN_SCANNER:
+        # すべてのカスタムパターンを 1 つの Recognizer で評価する
+        # コンテキストによるスコア補正も同じエンハンサー設定で Recognizer 内で行う
+        analyzer.registry.add_recognizer(
+            MultiPatternRecognizer(
+                custom_recognizers,
+                context_aware_enhancer=context_aware_enhancer,
+                supported_language="ja",
+            )
+        )
+    else:
+        for recognizer in custom_recognizers:
+            analyzer.registry.add_recognizer(recognizer)
+    timings["custom_recognizers"] = time.perf_counter() - phase_start
 
     return analyzer
 
+def load_analyzer(timings=None, rebuild=False):
+    """
+    AnalyzerEngine を取得します。
+    config.USE_ANALYZER_SNAPSHOT が有効な場合はスナップショットから読み込み（設定が変わっていれば再構築）、
+    無効な場合は setup_analyzer() で毎回構築します。
+    """
+    if not config.USE_ANALYZER_SNAPSHOT:
+        return setup_analyzer(timings=timings)
+    snapshot_dir = Path(config.ANALYZER_SNAPSHOT_DIR)
+    if not snapshot_dir.is_absolute():
+        snapshot_dir = Path(__file__).resolve().parent.parent / snapshot_dir
+    return snapshot.load_or_build(setup_analyzer, snapshot_dir, timings=timings, rebuild=rebuild)
+
 # 正規表現パターンを事前コンパイルしてパフォーマンスを向上（遅延評価で一度だけコンパイル）
 _digit_only_pattern = re.compile(r'^[\d\s\-:：、。，．]+$')
 _year_pattern = re.compile(r'^\d{4}$')
@@ -323,6 +388,16 @@ def _get_common_suffixes_pattern():
         _common_suffixes_pattern = re.compile(config.COMMON_SUFFIXES_PATTERN + r'$')
     return _common_suffixes_pattern
 
+_person_context_automaton = None
+
+def _get_person_context_automaton():
+    """PERSON のコンテキスト単語のオートマトンを返します（config の変更時のみ再構築）。"""
+    global _person_context_automaton
+    words = tuple(config.CONTEXT_WORDS.get("PERSON", []))
+    if _person_context_automaton is None or _person_context_automaton[0] != words:
+        _person_context_automaton = (words, KeywordAutomaton(words))
+    return _person_context_automaton[1]
+
 def filter_common_words(results, text):
     """
     一般的な日本語単語をPERSONとして誤検知した結果を除外します。
@@ -332,7 +407,10 @@ def filter_common_words(results, text):
     # 重複や包含関係を整理：より長い検出結果を優先し、短い重複を削除
     results = sorted(results, key=lambda x: (x.end - x.start, -x.start), reverse=True)
     filtered_results = []
-    seen_ranges = set()
+    # 採用済みの範囲（改行で切り詰めても開始位置は変わらないため、開始位置の候補は事前に確定する）
+    seen_ranges = ContainmentIndex(r.start for r in results)
+    # PERSON のコンテキスト単語の出現位置（最初に必要になったときに文書全体を 1 回だけ走査する）
+    person_context_hits = None
     
     for result in results:
         # 重複チェック：既に処理した範囲と重複している場合はスキップ
@@ -340,13 +418,8 @@ def filter_common_words(results, text):
         if range_key in seen_ranges:
             continue
         
-        # 包含関係チェック：既存の結果に完全に含まれている場合はスキップ
-        is_contained = False
-        for existing_start, existing_end in seen_ranges:
-            if existing_start <= result.start and result.end <= existing_end:
-                is_contained = True
-                break
-        if is_contained:
+        # 包含関係チェック：既存の結果に完全に含まれている場合はスキップ（O(log n)）
+        if seen_ranges.contains(result.start, result.end):
             continue
         # 検出されたテキストを取得
         detected_text = text[result.start:result.end].strip()
@@ -380,7 +453,6 @@ def filter_common_words(results, text):
             # 周辺テキストを確認
             context_start = max(0, result.start - 20)
             context_end = min(len(text), result.end + 20)
-            context_text = text[context_start:context_end].lower()
             
             # 一般的なビジネス用語パターンを除外（より効率的な正規表現）
             # 「〜情報」「〜記録」「〜設定」などのパターン
@@ -388,14 +460,13 @@ def filter_common_words(results, text):
                 continue
             
             # 数字のみのパターン（年号など）を除外
-            if _year_pattern.match(detected_text) and '年' not in context_text:
+            if _year_pattern.match(detected_text) and '年' not in text[context_start:context_end]:
                 continue
             
-            # コンテキスト単語が周辺にない場合、スコアを下げる
-            has_context = any(
-                word.lower() in context_text 
-                for word in config.CONTEXT_WORDS.get("PERSON", [])
-            )
+            # コンテキスト単語が周辺にない場合、スコアを下げる（出現位置への範囲クエリで判定）
+            if person_context_hits is None:
+                person_context_hits = _get_person_context_automaton().search(text)
+            has_context = person_context_hits.any_within(context_start, context_end)
             
             if not has_context and result.score < 0.75:
                 # コンテキストがなく、スコアが低い場合は除外
@@ -412,7 +483,8 @@ def filter_common_words(results, text):
                     entity_type=result.entity_type,
                     start=result.start,
                     end=new_end,
-                    score=result.score
+                    score=result.score,
+                    recognition_metadata=result.recognition_metadata
                 )
                 range_key = (result.start, new_end)
                 # 修正後のテキストで再度チェック（改行を除いたテキスト）
@@ -426,11 +498,7 @@ def filter_common_words(results, text):
                 # 修正後のテキストでコンテキストを再チェック
                 context_start = max(0, result.start - 20)
                 context_end = min(len(text), result.end + 20)
-                context_text = text[context_start:context_end].lower()
-                has_context = any(
-                    word.lower() in context_text 
-                    for word in config.CONTEXT_WORDS.get("PERSON", [])
-                )
+                has_context = person_context_hits.any_within(context_start, context_end)
                 if not has_context and result.score < 0.75:
                     continue
         
@@ -448,7 +516,8 @@ def filter_common_words(results, text):
                     entity_type=result.entity_type,
                     start=result.start,
                     end=new_end,
-                    score=result.score
+                    score=result.score,
+                    recognition_metadata=result.recognition_metadata
                 )
                 range_key = (result.start, new_end)
                 # 修正後のテキストで金額パターンを再チェック
@@ -464,69 +533,303 @@ def filter_common_words(results, text):
         
         # 検出結果を追加
         filtered_results.append(result)
-        seen_ranges.add(range_key)
+        seen_ranges.add(*range_key)
     
     return filtered_results
 
-def get_operators():
-    """エンティティごとの匿名化オペレーターを設定します。"""
-    
-    # 複数のエンティティタイプで共通のインデックス管理を行うためのマップ
-    entity_maps = {entity: {} for entity in config.TARGET_ENTITIES}
-    
-    def create_operator(entity_type):
-        def operator(old_value, **kwargs):
-            # 前後の空白を除去して一致判定の精度を上げる
-            val = old_value.strip()
-            # 既に別のエンティティタイプで登録されているかチェック
-            # (同一人物が PERSON と LOCATION の両方で検出される等のケース対策)
-            
-            entity_map = entity_maps[entity_type]
-            if val not in entity_map:
-                # 他のマップも含めて最大のインデックスを探すのではなく、
-                # そのエンティティタイプ内での登場順とする
-                entity_map[val] = len(entity_map) + 1
-            
-            index = entity_map[val]
-            return f"<{entity_type}{index}>"
-        return operator
+def create_anonymizer():
+    """
+    エンティティごとに出現順の番号でトークン化する匿名化エンジンを作成します。
+    番号はインスタンスごとに管理されるため、ファイルごとに新しく作成します。
+    """
+    return EntityAnonymizer(config.TARGET_ENTITIES)
 
-    operators = {}
-    for entity in config.TARGET_ENTITIES:
-        operators[entity] = OperatorConfig("custom", {"lambda": create_operator(entity)})
-    
-    return operators
+def analyze_text(analyzer, text, nlp_artifacts=None, profile=None, cache=None):
+    """
+    テキストを分析し、誤検知フィルタを適用した検出結果を返します。
+    nlp_artifacts を渡した場合は spaCy の処理を省略します（analyze_batch から使用）。
+    profile に dict を渡すと、Recognizer・フィルタ段階ごとの処理時間と件数を書き込みます
+    （形式は profiling モジュールを参照）。
+    cache（ResultCache）を渡すと、同じテキスト（RESULT_CACHE_BY_PARAGRAPH が有効な場合は同じブロック）の
+    検出結果を再利用します（プロファイル時・nlp_artifacts を渡した場合は使用しません）。
+    """
+    if profile is not None:
+        return _analyze_text_profiled(analyzer, text, nlp_artifacts, profile)
+    if cache is not None and nlp_artifacts is None:
+        return _analyze_batch_cached(analyzer, [text], config.NLP_BATCH_SIZE, cache)[0]
+    if config.FORM_FIELD_FAST_PATH and nlp_artifacts is None:
+        return _analyze_form(analyzer, text, split_form_fields(analyzer, text))
 
-def redact_file(analyzer, anonymizer, operators, input_path, output_path):
-    """ファイルを読み込み、PII を匿名化して出力パスに書き込みます。"""
-    try:
-        with open(input_path, 'r', encoding='utf-8') as f:
-            text = f.read()
+    # 設定ファイルから対象エンティティを取得して分析
+    results = analyzer.analyze(
+        text=text, 
+        language='ja', 
+        entities=config.TARGET_ENTITIES,
+        allow_list=config.ALLOW_LIST,
+        score_threshold=config.DEFAULT_SCORE_THRESHOLD,
+        nlp_artifacts=nlp_artifacts
+    )
+
+    # 一般的な日本語単語の誤検知を除外し、コンテキストベースの動的スコア調整を適用
+    return filter_common_words(results, text)
 
-        # 設定ファイルから対象エンティティを取得して分析
+def _analyze_form(analyzer, text, form, nlp_artifacts=None):
+    """
+    フォーム形式の行を除いたテキスト（form.free_text）だけを analyzer で分析し、フォームの行の検出結果と合わせて
+    誤検知フィルタを適用します。nlp_artifacts は form.free_text を処理したものを渡します。
+    """
+    results = analyzer.analyze(
+        text=form.free_text,
+        language='ja',
+        entities=config.TARGET_ENTITIES,
+        allow_list=config.ALLOW_LIST,
+        score_threshold=config.DEFAULT_SCORE_THRESHOLD,
+        nlp_artifacts=nlp_artifacts
+    )
+    return filter_common_words(merge_form_results(form, results), text)
+
+def _analyze_text_profiled(analyzer, text, nlp_artifacts, profile, form=None):
+    """
+    analyze_text と同じ処理を、段階ごとの処理時間と件数を計測しながら実行します。
+    form（split_form_fields の結果）を渡す場合、nlp_artifacts は form.free_text を処理したものを渡します。
+    """
+    profile.update(profiling.new_profile())
+    stages = profile["stages"]
+    total_start = time.perf_counter()
+
+    if form is None and config.FORM_FIELD_FAST_PATH and nlp_artifacts is None:
+        phase_start = time.perf_counter()
+        form = split_form_fields(analyzer, text)
+        stages["form_fields"] = {"seconds": time.perf_counter() - phase_start, "output": len(form.results)}
+    analyzed_text = form.free_text if form is not None else text
+
+    if nlp_artifacts is None:
+        phase_start = time.perf_counter()
+        nlp_artifacts = analyzer.nlp_engine.process_text(analyzed_text, 'ja')
+        stages["nlp"] = {"seconds": time.perf_counter() - phase_start}
+
+    phase_start = time.perf_counter()
+    with profiling.instrument_recognizers(analyzer.registry.recognizers, profile) as keys:
         results = analyzer.analyze(
-            text=text, 
-            language='ja', 
+            text=analyzed_text,
+            language='ja',
             entities=config.TARGET_ENTITIES,
             allow_list=config.ALLOW_LIST,
-            score_threshold=config.DEFAULT_SCORE_THRESHOLD
+            score_threshold=config.DEFAULT_SCORE_THRESHOLD,
+            nlp_artifacts=nlp_artifacts
         )
+    analyze_seconds = time.perf_counter() - phase_start
+    recognizer_seconds = sum(stats["seconds"] for stats in profile["recognizers"].values())
+    candidates = sum(stats["candidates"] for stats in profile["recognizers"].values())
+    stages["recognizers"] = {"seconds": recognizer_seconds, "output": candidates}
+    # コンテキストによるスコア補正・閾値による除外・重複除去
+    stages["analyzer_postprocess"] = {
+        "seconds": analyze_seconds - recognizer_seconds,
+        "input": candidates,
+        "output": len(results),
+    }
 
-        # 一般的な日本語単語の誤検知を除外し、コンテキストベースの動的スコア調整を適用
-        results = filter_common_words(results, text)
-        
-        # 重複する検出結果や包含関係にある結果を整理する（Presidioのデフォルト動作を補完）
-        # 同一テキストに対する複数のエンティティ割り当てなどを整理
-        
-        # 匿名化の実行（カスタムオペレーターを使用）
-        anonymized_result = anonymizer.anonymize(
-            text=text,
-            analyzer_results=results,
-            operators=operators
+    if form is not None:
+        results = merge_form_results(form, results)
+    phase_start = time.perf_counter()
+    filtered_results = filter_common_words(results, text)
+    stages["filter_common_words"] = {
+        "seconds": time.perf_counter() - phase_start,
+        "input": len(results),
+        "output": len(filtered_results),
+    }
+
+    profiling.count_survivors(profile, filtered_results, keys)
+    profile["total_seconds"] = time.perf_counter() - total_start
+    return filtered_results
+
+def analyze_batch(analyzer, texts, batch_size=None, profiles=None, cache=None):
+    """
+    複数のテキストをまとめて分析し、テキストごとの検出結果のリストを返します。
+    spaCy の処理は nlp.pipe でバッチ実行し、パターン Recognizer と filter_common_words は文書ごとに実行します。
+    profiles にリストを渡すと、テキストごとのプロファイルを追加します（nlp の時間はバッチの時間を文書数で割った値）。
+    cache（ResultCache）を渡すと、キャッシュにないテキスト（バッチ内の重複は 1 回）だけを分析します。
+    RESULT_CACHE_BY_PARAGRAPH が有効な場合は、テキストをブロック（split_blocks）に分けてブロック単位でキャッシュします。
+    """
+    if batch_size is None:
+        batch_size = config.NLP_BATCH_SIZE
+    if cache is not None and profiles is None:
+        return _analyze_batch_cached(analyzer, texts, batch_size, cache)
+    if profiles is None and config.FORM_FIELD_FAST_PATH:
+        forms = [split_form_fields(analyzer, text) for text in texts]
+        batch = analyzer.nlp_engine.process_batch([form.free_text for form in forms], language='ja', batch_size=batch_size)
+        return [
+            _analyze_form(analyzer, text, form, nlp_artifacts)
+            for text, form, (_, nlp_artifacts) in zip(texts, forms, batch)
+        ]
+    if profiles is None:
+        batch = analyzer.nlp_engine.process_batch(texts, language='ja', batch_size=batch_size)
+        return [analyze_text(analyzer, text, nlp_artifacts) for text, nlp_artifacts in batch]
+
+    forms = []
+    form_seconds = []
+    for text in texts:
+        start_time = time.perf_counter()
+        forms.append(split_form_fields(analyzer, text) if config.FORM_FIELD_FAST_PATH else None)
+        form_seconds.append(time.perf_counter() - start_time)
+    start_time = time.perf_counter()
+    analyzed_texts = [form.free_text if form is not None else text for text, form in zip(texts, forms)]
+    batch = list(analyzer.nlp_engine.process_batch(analyzed_texts, language='ja', batch_size=batch_size))
+    nlp_seconds = (time.perf_counter() - start_time) / len(batch) if batch else 0.0
+    results = []
+    for text, form, seconds, (_, nlp_artifacts) in zip(texts, forms, form_seconds, batch):
+        profile = {}
+        results.append(_analyze_text_profiled(analyzer, text, nlp_artifacts, profile, form=form))
+        stages = {"nlp": {"seconds": nlp_seconds}}
+        if form is not None:
+            stages = {"form_fields": {"seconds": seconds, "output": len(form.results)}, **stages}
+        profile["stages"] = {**stages, **profile["stages"]}
+        profile["total_seconds"] += nlp_seconds + seconds
+        profiles.append(profile)
+    return results
+
+def _analyze_batch_cached(analyzer, texts, batch_size, cache):
+    """analyze_batch のキャッシュを使用する場合の処理。"""
+    if not config.RESULT_CACHE_BY_PARAGRAPH:
+        return _analyze_unique_cached(analyzer, texts, batch_size, cache)
+
+    # すべてのテキストのブロックをまとめて分析し、検出位置を元のテキスト上の位置に戻す
+    blocks = [(i, offset, block) for i, text in enumerate(texts) for offset, block in split_blocks(text)]
+    block_results = _analyze_unique_cached(analyzer, [block for _, _, block in blocks], batch_size, cache)
+    outputs = [[] for _ in texts]
+    for (i, offset, _), results in zip(blocks, block_results):
+        for result in results:
+            result.start += offset
+            result.end += offset
+            outputs[i].append(result)
+    return outputs
+
+def _analyze_unique_cached(analyzer, texts, batch_size, cache):
+    """キャッシュにないテキストだけを、同じテキストは 1 回だけ分析します。"""
+    outputs = [None] * len(texts)
+    misses = {}  # キー -> (テキスト, キャッシュにないテキストの位置のリスト)
+    for i, text in enumerate(texts):
+        key = cache.key(text)
+        if key in misses:
+            misses[key][1].append(i)
+            continue
+        outputs[i] = cache.get(text, key=key)
+        if outputs[i] is None:
+            misses[key] = (text, [i])
+    if misses:
+        batch_results = analyze_batch(analyzer, [text for text, _ in misses.values()], batch_size=batch_size)
+        for (key, (text, indices)), results in zip(misses.items(), batch_results):
+            cache.put(text, results, key=key)
+            outputs[indices[0]] = results
+            for i in indices[1:]:
+                # 位置を書き換えられても影響しないよう、重複したテキストには別のオブジェクトを返す
+                outputs[i] = [RecognizerResult(r.entity_type, r.start, r.end, r.score) for r in results]
+    return outputs
+
+def _write_redacted(anonymizer, text, results, output_path):
+    """検出結果を匿名化して出力パスに書き込みます。"""
+    anonymized = anonymizer.anonymize(text, results)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(anonymized.text)
+
+def needs_streaming(input_path):
+    """ファイル全体を一度に分析できないサイズか（ストリーミング処理が必要か）を返します。"""
+    return os.path.getsize(input_path) > config.STREAM_WINDOW_BYTES
+
+def redact_file_streaming(analyzer, anonymizer, input_path, output_path, cache=None):
+    """
+    ファイルを STREAM_WINDOW_BYTES 単位のウィンドウで読み込み、匿名化しながら逐次書き込みます。
+    同じ匿名化エンジンを全ウィンドウで使うため、エンティティ番号はファイル全体で一貫します。
+    """
+    def analyze(text):
+        return analyze_text(analyzer, text, cache=cache)
+
+    def anonymize(text, results):
+        return anonymizer.anonymize(text, results).text
+
+    with open(input_path, 'r', encoding='utf-8') as reader, open(output_path, 'w', encoding='utf-8') as writer:
+        redact_stream(
+            reader,
+            writer,
+            analyze,
+            anonymize,
+            window_bytes=config.STREAM_WINDOW_BYTES,
+            overlap_bytes=config.STREAM_OVERLAP_BYTES,
         )
 
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(anonymized_result.text)
+def redact_text(analyzer, text, anonymizer=None, cache=None):
+    """
+    テキストを秘匿化し、AnonymizedText（匿名化後のテキスト・トークンと元の値の対応・置き換えた範囲）を返します。
+    STREAM_WINDOW_BYTES を超えるテキストはウィンドウ単位で処理します（API サーバーから使用）。
+    """
+    if anonymizer is None:
+        anonymizer = create_anonymizer()
+    if len(text.encode('utf-8')) <= config.STREAM_WINDOW_BYTES:
+        return anonymizer.anonymize(text, analyze_text(analyzer, text, cache=cache))
+
+    mapping = {}
+    items = []
+    consumed = 0
+
+    def anonymize(window_text, results):
+        # ウィンドウは先頭から順に重なりなく渡されるため、処理済みの文字数で位置を元のテキスト上に戻す
+        nonlocal consumed
+        anonymized = anonymizer.anonymize(window_text, results)
+        mapping.update(anonymized.mapping)
+        for item in anonymized.items:
+            item["start"] += consumed
+            item["end"] += consumed
+            items.append(item)
+        consumed += len(window_text)
+        return anonymized.text
+
+    writer = io.StringIO(newline='')
+    redact_stream(
+        io.StringIO(text, newline=''),
+        writer,
+        lambda window_text: analyze_text(analyzer, window_text, cache=cache),
+        anonymize,
+        window_bytes=config.STREAM_WINDOW_BYTES,
+        overlap_bytes=config.STREAM_OVERLAP_BYTES,
+    )
+    return AnonymizedText(writer.getvalue(), mapping, items)
+
+def redact_texts(analyzer, texts, batch_size=None, anonymizers=None, cache=None):
+    """
+    複数のテキストを analyze_batch でまとめて秘匿化し、テキストごとの AnonymizedText のリストを返します。
+    anonymizers（テキストごとの匿名化エンジン）を省略した場合、エンティティ番号はテキストごとに振り直します。
+    STREAM_WINDOW_BYTES を超えるテキストは redact_text で個別に処理します。
+    """
+    if anonymizers is None:
+        anonymizers = [create_anonymizer() for _ in texts]
+    outputs = [None] * len(texts)
+    batched = [i for i, text in enumerate(texts) if len(text.encode('utf-8')) <= config.STREAM_WINDOW_BYTES]
+    batch_results = analyze_batch(analyzer, [texts[i] for i in batched], batch_size=batch_size, cache=cache)
+    for i, results in zip(batched, batch_results):
+        outputs[i] = anonymizers[i].anonymize(texts[i], results)
+    for i, text in enumerate(texts):
+        if outputs[i] is None:
+            outputs[i] = redact_text(analyzer, text, anonymizers[i], cache=cache)
+    return outputs
+
+def redact_file(analyzer, input_path, output_path, cache=None):
+    """
+    ファイルを読み込み、PII を匿名化して出力パスに書き込みます。
+    STREAM_WINDOW_BYTES を超えるファイルはストリーミング処理します。
+    """
+    try:
+        # ファイルごとにインデックスをリセットした匿名化エンジンを使用する
+        anonymizer = create_anonymizer()
+        if needs_streaming(input_path):
+            redact_file_streaming(analyzer, anonymizer, input_path, output_path, cache=cache)
+            return True
+
+        with open(input_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+
+        results = analyze_text(analyzer, text, cache=cache)
+        _write_redacted(anonymizer, text, results, output_path)
         
         return True
     except Exception as e:
@@ -536,12 +839,107 @@ def redact_file(analyzer, anonymizer, operators, input_path, output_path):
         traceback.print_exc()
         return False
 
+def redact_batch(analyzer, tasks, batch_size=None, cache=None):
+    """
+    (入力パス, 出力パス) のリストを analyze_batch でまとめて秘匿化し、ファイルごとの成否を返します。
+    匿名化エンジン（エンティティ番号）はファイルごとに新規作成します。
+    バッチ全体の分析に失敗した場合は、1 ファイルずつの処理に切り替えます。
+    ストリーミング処理が必要な大きいファイルはバッチに含めず個別に処理します。
+    """
+    if len(tasks) == 1:
+        input_path, output_path = tasks[0]
+        return [redact_file(analyzer, input_path, output_path, cache=cache)]
+
+    outcomes = [False] * len(tasks)
+    loaded = []
+    for i, (input_path, output_path) in enumerate(tasks):
+        try:
+            if needs_streaming(input_path):
+                outcomes[i] = redact_file(analyzer, input_path, output_path, cache=cache)
+                continue
+            with open(input_path, 'r', encoding='utf-8') as f:
+                loaded.append((i, f.read()))
+        except Exception as e:
+            print(f"Error processing {input_path}: {e}")
+
+    try:
+        batch_results = analyze_batch(analyzer, [text for _, text in loaded], batch_size=batch_size, cache=cache)
+    except Exception as e:
+        print(f"バッチ分析に失敗したため 1 ファイルずつ処理します: {e}")
+        for i, _ in loaded:
+            input_path, output_path = tasks[i]
+            outcomes[i] = redact_file(analyzer, input_path, output_path, cache=cache)
+        return outcomes
+
+    for (i, text), results in zip(loaded, batch_results):
+        input_path, output_path = tasks[i]
+        try:
+            _write_redacted(create_anonymizer(), text, results, output_path)
+            outcomes[i] = True
+        except Exception as e:
+            print(f"Error processing {input_path}: {e}")
+            import traceback
+            traceback.print_exc()
+    return outcomes
+
+# --- 並列処理用のワーカー状態 ---
+# fork 起動の場合は親プロセスで読み込んだ Analyzer をそのまま引き継ぐ（spaCy モデルのページを copy-on-write で共有）
+# spawn 起動の場合は各ワーカーの初期化時に load_analyzer() を一度だけ実行する
+# 結果キャッシュはワーカーごとに作成する
+_worker_analyzer = None
+_worker_cache = None
+
+def _init_worker():
+    """ワーカープロセスの初期化。Analyzer が未読み込みの場合のみ構築します。"""
+    global _worker_analyzer, _worker_cache
+    if _worker_analyzer is None:
+        _worker_analyzer = load_analyzer()
+    _worker_cache = ResultCache()
+
+def _redact_batch_task(tasks):
+    """ワーカーで複数ファイルをまとめて秘匿化します。匿名化エンジンはファイルごとに新規作成します。"""
+    return redact_batch(_worker_analyzer, tasks, cache=_worker_cache)
+
+def _get_mp_context():
+    """fork が使える環境では fork を優先し、使えない場合は spawn にフォールバックします。"""
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+def _chunk_tasks(tasks, batch_size):
+    """タスクを batch_size 件ずつに分割します。"""
+    batch_size = max(1, batch_size)
+    return [tasks[i:i + batch_size] for i in range(0, len(tasks), batch_size)]
+
+def redact_files_parallel(analyzer, tasks, workers, batch_size=1):
+    """
+    (入力パス, 出力パス) のリストを複数プロセスで秘匿化します。
+    各ワーカーは batch_size 件ずつまとめて分析します（analyze_batch）。
+    結果は入力順に yield されるため、進捗表示の順序が保たれます。
+    """
+    global _worker_analyzer
+    ctx = _get_mp_context()
+    if ctx.get_start_method() == "fork":
+        # fork 前にモジュール変数へ設定しておくことで子プロセスへ引き継ぐ
+        _worker_analyzer = analyzer
+    chunks = _chunk_tasks(tasks, batch_size)
+    # 1 タスクあたりのオーバーヘッドを抑えつつ負荷の偏りを避けるチャンクサイズ
+    chunksize = max(1, min(16, len(chunks) // (workers * 4)))
+    with ctx.Pool(processes=workers, initializer=_init_worker) as pool:
+        for outcomes in pool.imap(_redact_batch_task, chunks, chunksize=chunksize):
+            yield from outcomes
+
 def main():
     parser = argparse.ArgumentParser(description="Japanese PII Redactor using Presidio")
     parser.add_argument("--input", type=str, help="Input directory containing markdown files")
     parser.add_argument("--output", type=str, help="Output directory for redacted files")
     parser.add_argument("--prefix", type=str, help="Prefix for output filenames", default="")
     parser.add_argument("--limit", type=int, help="Limit the number of files to process", default=None)
+    parser.add_argument("--pattern", type=str, help="Glob pattern of input files (e.g. '*.csv')", default="*.md")
+    parser.add_argument("--workers", type=int, help="Number of worker processes (1 = serial)", default=1)
+    parser.add_argument("--batch-size", type=int, help="Number of files analyzed together with nlp.pipe (1 = per file)", default=config.NLP_BATCH_SIZE)
+    parser.add_argument("--rebuild-snapshot", action="store_true", help="Ignore the cached analyzer snapshot and rebuild it")
+    parser.add_argument("--force", action="store_true", help="Re-redact all files even if the manifest says their output is up to date")
     
     args = parser.parse_args()
 
@@ -551,31 +949,79 @@ def main():
     
     output_dir.mkdir(parents=True, exist_ok=True)
 
+    md_files = sorted(list(input_dir.glob(args.pattern)))
+    if args.limit:
+        md_files = md_files[:args.limit]
+        
+    print(f"{input_dir} 内に {len(md_files)} 個のマークダウンファイルが見つかりました")
+
+    tasks = [(md_file, output_dir / f"{args.prefix}{md_file.name}") for md_file in md_files]
+
+    # 入力内容・設定・出力が前回から変わっていないファイルは処理しない
+    manifest = RedactionManifest.load(output_dir / config.REDACTION_MANIFEST_NAME)
+    fingerprint = snapshot.config_fingerprint()
+    pending = []
+    input_hashes = []
+    for input_path, output_path in tasks:
+        try:
+            input_hash = file_sha256(input_path)
+        except OSError:
+            input_hash = None
+        if not args.force and input_hash is not None and manifest.is_valid(output_path, input_hash, fingerprint):
+            continue
+        pending.append((input_path, output_path))
+        input_hashes.append(input_hash)
+    cache_hits = len(tasks) - len(pending)
+    print(f"キャッシュ: ヒット {cache_hits} / ミス {len(pending)}{' (--force)' if args.force else ''}")
+
+    if not pending:
+        print(f"完了! 更新が必要なファイルはありません。出力先: {output_dir}")
+        return
+
     print(f"Presidio エンジンを初期化中 (閾値: {config.DEFAULT_SCORE_THRESHOLD})...")
+    startup_timings = {}
     try:
-        analyzer = setup_analyzer()
-        anonymizer = AnonymizerEngine()
+        analyzer = load_analyzer(timings=startup_timings, rebuild=args.rebuild_snapshot)
     except Exception as e:
         print(f"エンジンの初期化に失敗しました: {e}")
         return
+    print(f"起動時間: {snapshot.format_timings(startup_timings)}")
 
-    md_files = sorted(list(input_dir.glob("*.md")))
-    if args.limit:
-        md_files = md_files[:args.limit]
-        
-    print(f"{input_dir} 内に {len(md_files)} 個のマークダウンファイルが見つかりました")
+    workers = max(1, min(args.workers, len(pending)))
+
+    cache = ResultCache(fingerprint=fingerprint)
+    start_time = time.perf_counter()
+    if workers > 1:
+        print(f"{workers} プロセスで並列処理します")
+        outcomes = redact_files_parallel(analyzer, pending, workers, batch_size=args.batch_size)
+    else:
+        outcomes = (
+            ok
+            for chunk in _chunk_tasks(pending, args.batch_size)
+            for ok in redact_batch(analyzer, chunk, batch_size=args.batch_size, cache=cache)
+        )
 
     success_count = 0
-    for md_file in md_files:
-        output_file = output_dir / f"{args.prefix}{md_file.name}"
-        # ファイルごとにインデックスをリセットしたオペレーターを取得
-        current_operators = get_operators()
-        if redact_file(analyzer, anonymizer, current_operators, md_file, output_file):
-            success_count += 1
-            if success_count % 50 == 0:
-                print(f"{success_count} ファイル処理済み...")
-
-    print(f"完了! {success_count} ファイルを匿名化しました。出力先: {output_dir}")
+    try:
+        for (input_path, output_path), input_hash, ok in zip(pending, input_hashes, outcomes):
+            if ok and input_hash is not None:
+                manifest.record(input_path, output_path, input_hash, fingerprint)
+            else:
+                manifest.discard(output_path)
+            if ok:
+                success_count += 1
+                if success_count % 50 == 0:
+                    print(f"{success_count} ファイル処理済み...")
+    finally:
+        # 中断された場合も、それまでに処理したファイルは次回省略できるよう保存する
+        manifest.save()
+    elapsed = time.perf_counter() - start_time
+
+    print(f"完了! {success_count} ファイルを匿名化しました（キャッシュ済み {cache_hits} ファイル）。出力先: {output_dir}")
+    print(f"処理時間: {elapsed:.2f}秒 ({len(pending) / elapsed if elapsed > 0 else 0:.2f}ファイル/秒, ワーカー数: {workers}, バッチサイズ: {args.batch_size}, 失敗: {len(pending) - success_count})")
+    if workers == 1:
+        stats = cache.stats()
+        print(f"結果キャッシュ: ヒット {stats['hits']} / ミス {stats['misses']}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,135 @@
+"""
+同じテキストの分析結果（analyzer.analyze + filter_common_words）を再利用する LRU キャッシュです。
+
+チャットの定型文・署名や、コーパス中の同一の文書は何度も分析されます。キャッシュにヒットした場合は
+spaCy・Recognizer の処理を省略し、匿名化（トークンへの置き換え）だけを実行します。
+
+キーはテキストのハッシュ（設定・コードのフィンガープリントを鍵とする BLAKE2b）、値は検出範囲
+（エンティティタイプ・開始位置・終了位置・スコア）のみで、元のテキストや PII の値は保持しません。
+そのため、エントリを破棄（LRU による追い出し・clear()）する際に PII を消去する処理は必要ありません。
+
+config.RESULT_CACHE_BY_PARAGRAPH が有効な場合は、文書を空行・"---" の行で区切ったブロック（split_blocks）
+ごとにキャッシュし、検出位置を文書全体の位置に戻して結合します（redactor.analyze_batch）。
+定型のフッターや、再提出された文書の変更のないブロックは分析を省略できます。
+"""
+
+import hashlib
+import re
+import sys
+from collections import OrderedDict
+
+from presidio_analyzer import RecognizerResult
+
+try:
+    from . import config
+    from . import snapshot
+except ImportError:
+    import config
+    import snapshot
+
+# 1 エントリあたりの管理コスト（OrderedDict のノード・キーの bytes）の概算（バイト）
+_ENTRY_OVERHEAD_BYTES = 200
+# 検出範囲 1 件（4 要素のタプルと float）の概算（バイト）
+_SPAN_BYTES = 96
+
+# ブロックの区切りとする行（空白のみの行、または "---" などの水平線）
+_SEPARATOR_LINE = re.compile(r'[ \t\u3000]*(?:-{3,}[ \t\u3000]*)?[\r\n]*')
+
+
+def split_blocks(text):
+    """
+    テキストを空行・"---" の行で区切り、(開始位置, ブロックのテキスト) のリストを返します。
+    区切りの行はどのブロックにも含めず、ブロック末尾の改行も含めません。
+    """
+    blocks = []
+    block_start = None
+    block_end = 0
+    position = 0
+    for line in text.splitlines(keepends=True):
+        if _SEPARATOR_LINE.fullmatch(line):
+            if block_start is not None:
+                blocks.append((block_start, text[block_start:block_end]))
+                block_start = None
+        else:
+            if block_start is None:
+                block_start = position
+            block_end = position + len(line.rstrip("\r\n"))
+        position += len(line)
+    if block_start is not None:
+        blocks.append((block_start, text[block_start:block_end]))
+    return blocks
+
+
+class ResultCache:
+    """
+    テキスト → 検出結果の LRU キャッシュ。エントリ数（max_entries）と概算のメモリ使用量（max_bytes）で上限を設けます。
+    キャッシュは作成時の設定（フィンガープリント）に対する結果です。実行中に config を変更した場合は clear() を呼ぶか作り直してください。
+    同時に複数のスレッドから使用しないでください（API サーバーでは分析スレッドからのみ使用します）。
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, fingerprint=None):
+        self.max_entries = max_entries if max_entries is not None else config.RESULT_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes if max_bytes is not None else config.RESULT_CACHE_MAX_BYTES
+        fingerprint = fingerprint or snapshot.config_fingerprint()
+        # フィンガープリントを鍵にしたハッシュのため、設定が異なるキャッシュのキーは一致しない
+        self._hash_key = hashlib.sha256(fingerprint.encode("utf-8")).digest()
+        self._entries = OrderedDict()  # キー -> (検出範囲のタプル, 概算バイト数)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, text):
+        """テキストのキャッシュキー（16 バイトのハッシュ）を返します。"""
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16, key=self._hash_key).digest()
+
+    def get(self, text, key=None):
+        """キャッシュ済みの検出結果（新しい RecognizerResult のリスト）を返します。ない場合は None を返します。"""
+        key = key or self.key(text)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return [RecognizerResult(entity_type, start, end, score) for entity_type, start, end, score in entry[0]]
+
+    def put(self, text, results, key=None):
+        """検出結果を保存し、上限を超えた場合は最も長く使われていないエントリから破棄します。"""
+        if self.max_entries <= 0:
+            return
+        key = key or self.key(text)
+        spans = tuple((r.entity_type, r.start, r.end, r.score) for r in results)
+        size = _ENTRY_OVERHEAD_BYTES + sys.getsizeof(spans) + len(spans) * _SPAN_BYTES
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[1]
+        self._entries[key] = (spans, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        """ヒット・ミスの件数とヒット率、エントリ数・概算のメモリ使用量を dict で返します（/metrics のレスポンス）。"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,189 @@
+"""
+API サーバーの /anonymize 用マイクロバッチスケジューラーです。
+
+チャットの入力は短いテキストが多数同時に届くため、1 件ずつ分析すると spaCy のバッチ処理（nlp.pipe）を活かせません。
+分析中に届いたリクエストを最大 max_batch_texts 件ずつまとめて 1 回で分析し、結果をそれぞれの呼び出し元（コルーチン）に返します。
+分析スレッドが空いている間に届いたリクエストは待たずにすぐ分析するため、負荷が低いときの遅延は増えず、
+負荷が高いほどバッチが大きくなります。
+wait_ms を指定した場合は、先頭のリクエストから最大 wait_ms ミリ秒、後続のリクエストが届くのを待ってから分析します。
+負荷が低いときのバッチは大きくなりますが、すべてのリクエストの遅延が最大 wait_ms ミリ秒増えます。
+リクエストの要素はテキストに限らず、process_batch が受け取れるもの（テキストと匿名化エンジンの組など）を渡せます。
+"""
+
+import asyncio
+from collections import Counter, deque
+
+try:
+    from . import config
+except ImportError:
+    import config
+
+
+class _Request:
+    __slots__ = ("item", "future", "enqueued_at")
+
+    def __init__(self, item, future, enqueued_at):
+        self.item = item
+        self.future = future
+        self.enqueued_at = enqueued_at
+
+
+class BatchMetrics:
+    """バッチの充填率とキュー待ち時間を集計します。待ち時間の分位点は直近 window 件から計算します。"""
+
+    def __init__(self, max_batch_texts, window=4096):
+        self.max_batch_texts = max_batch_texts
+        self.batches = 0
+        self.texts = 0
+        self.batch_sizes = Counter()
+        self.batch_seconds = 0.0
+        self.queue_delays = deque(maxlen=window)
+
+    def record(self, size, queue_delays, seconds):
+        self.batches += 1
+        self.texts += size
+        self.batch_sizes[size] += 1
+        self.batch_seconds += seconds
+        self.queue_delays.extend(queue_delays)
+
+    def snapshot(self):
+        """メトリクスを dict で返します（/metrics のレスポンス）。"""
+        delays = sorted(self.queue_delays)
+
+        def percentile(q):
+            return delays[min(len(delays) - 1, int(q * len(delays)))] * 1000 if delays else 0.0
+
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "batch_fill": {
+                "mean_size": self.texts / self.batches if self.batches else 0.0,
+                "mean_ratio": self.texts / (self.batches * self.max_batch_texts) if self.batches else 0.0,
+                "sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            },
+            "queue_delay_ms": {
+                "mean": sum(delays) / len(delays) * 1000 if delays else 0.0,
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": delays[-1] * 1000 if delays else 0.0,
+            },
+            "batch_ms_mean": self.batch_seconds / self.batches * 1000 if self.batches else 0.0,
+        }
+
+
+class MicroBatchScheduler:
+    """
+    submit() で受け付けた要素をまとめ、process_batch を executor で実行して結果を返します。
+
+    process_batch は要素（テキストなど）のリストを受け取り、同じ順序で結果のリストを返す関数です。
+    process_batch が例外を送出した場合は process_one で 1 件ずつ処理し、失敗したリクエストにのみ例外を返します。
+    """
+
+    def __init__(self, process_batch, process_one, executor, max_batch_texts=None, wait_ms=None):
+        self.process_batch = process_batch
+        self.process_one = process_one
+        self.executor = executor
+        self.max_batch_texts = max(1, max_batch_texts or config.SERVICE_BATCH_MAX_TEXTS)
+        self.wait_seconds = (wait_ms if wait_ms is not None else config.SERVICE_BATCH_WAIT_MS) / 1000
+        self.metrics = BatchMetrics(self.max_batch_texts)
+        self._queue = deque()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        """バッチを処理するタスクを開始します（イベントループ内で呼び出すこと）。"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def close(self):
+        """タスクを停止し、処理待ちのリクエストをキャンセルします。"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._queue:
+            self._queue.popleft().future.cancel()
+
+    @property
+    def queued(self):
+        return len(self._queue)
+
+    async def submit(self, item):
+        """要素を処理待ちに追加し、結果を待ちます。"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append(_Request(item, future, loop.time()))
+        self._wakeup.set()
+        return await future
+
+    def _run(self, items):
+        """executor で実行します。結果または例外を要素ごとに返します。"""
+        try:
+            return self.process_batch(items)
+        except Exception:
+            outcomes = []
+            for item in items:
+                try:
+                    outcomes.append(self.process_one(item))
+                except Exception as e:
+                    outcomes.append(e)
+            return outcomes
+
+    async def _next_batch(self):
+        """
+        先頭のリクエストから wait_seconds 経過するか max_batch_texts 件集まるまで待ち、バッチを取り出します。
+        wait_seconds が 0 の場合は待たずに、その時点で処理待ちのリクエストを取り出します。
+        """
+        loop = asyncio.get_running_loop()
+        while not self._queue:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        deadline = self._queue[0].enqueued_at + self.wait_seconds
+        while len(self._queue) < self.max_batch_texts:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+        batch = []
+        while self._queue and len(batch) < self.max_batch_texts:
+            request = self._queue.popleft()
+            # 呼び出し元が待つのをやめた（切断された）リクエストは処理しない
+            if not request.future.cancelled():
+                batch.append(request)
+        return batch
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            started_at = loop.time()
+            try:
+                outcomes = await loop.run_in_executor(self.executor, self._run, [request.item for request in batch])
+            except asyncio.CancelledError:
+                for request in batch:
+                    request.future.cancel()
+                raise
+            except Exception as e:
+                outcomes = [e] * len(batch)
+            self.metrics.record(
+                len(batch),
+                [started_at - request.enqueued_at for request in batch],
+                loop.time() - started_at,
+            )
+            for request, outcome in zip(batch, outcomes):
+                if request.future.done():
+                    continue
+                if isinstance(outcome, Exception):
+                    request.future.set_exception(outcome)
+                else:
+                    request.future.set_result(outcome)
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+秘匿化 API サーバー（FastAPI）です。仕様は project.md の「秘匿化APIサーバー仕様」を参照してください。
+
+起動時に Analyzer を 1 回だけ読み込み、すべてのリクエストで共有します。
+分析は CPU 処理のため専用スレッドで実行し、イベントループ（セッションストアの I/O など）を止めません。
+同時に届いた /anonymize のリクエストはマイクロバッチにまとめて分析します（redactor.scheduler）。
+/anonymize はセッションに保存した匿名化エンジンの状態（番号の対応）を復元して新しいメッセージだけを処理するため、
+会話が長くなっても 1 ターンあたりの処理時間は変わらず、同じ人物には同じトークンが割り当てられます。
+日本語トークナイザー（Sudachi）は同時に複数のスレッドから使用できないため、分析スレッドは 1 つです。
+CPU コアを使い切るには、複数のワーカープロセスで起動してください（各プロセスが Analyzer を読み込みます）。
+ワーカー間でセッションを共有するため、複数のワーカーでは Redis のセッションストアが必要です
+（既定の memory:// はプロセス内にしかないため、1 ワーカーでのみ使用できます）:
+
+    REDACTOR_SESSION_STORE_URL=redis://localhost:6379/0 uvicorn redactor.service:app --workers 4
+    python -m redactor.service --port 8000
+
+fastapi と uvicorn が必要です。Redis のセッションストアを使用する場合は redis も必要です。
+"""
+
+import argparse
+import asyncio
+import codecs
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Security, status
+from fastapi.responses import Response
+from fastapi.security import APIKeyHeader
+from pydantic import BaseModel, Field
+
+try:
+    from . import config
+    from .anonymizer import EntityAnonymizer
+    from .deanonymizer import CompiledMappingCache, StreamingDeanonymizer
+    from .redactor import load_analyzer, redact_text, redact_texts
+    from .result_cache import ResultCache
+    from .scheduler import MicroBatchScheduler
+    from .session_store import create_session_store
+except ImportError:
+    import config
+    from anonymizer import EntityAnonymizer
+    from deanonymizer import CompiledMappingCache, StreamingDeanonymizer
+    from redactor import load_analyzer, redact_text, redact_texts
+    from result_cache import ResultCache
+    from scheduler import MicroBatchScheduler
+    from session_store import create_session_store
+
+VERSION = "1.0.0"
+
+
+# --- リクエスト・レスポンスのスキーマ ---
+
+class AnonymizeRequest(BaseModel):
+    text: str = Field(..., min_length=1, max_length=config.SERVICE_MAX_TEXT_LENGTH)
+    session_id: str = Field(..., min_length=1, max_length=128)
+
+class Entity(BaseModel):
+    entity_type: str
+    original_text: str
+    anonymized_token: str
+    start: int
+    end: int
+    score: float
+
+class AnonymizeResponse(BaseModel):
+    anonymized_text: str
+    entities: List[Entity]
+
+class DeanonymizeRequest(BaseModel):
+    text: str = Field(..., min_length=1, max_length=config.SERVICE_MAX_TEXT_LENGTH)
+    session_id: str = Field(..., min_length=1, max_length=128)
+
+class DeanonymizeResponse(BaseModel):
+    deanonymized_text: str
+
+class MessageResponse(BaseModel):
+    message: str
+
+class HealthResponse(BaseModel):
+    status: str
+    version: str
+
+
+# --- 秘匿化エンジン ---
+
+class RedactorService:
+    """
+    共有の Analyzer で秘匿化を行います。
+    同時に届いたリクエストはマイクロバッチにまとめ（MicroBatchScheduler）、1 スレッドの executor で順に分析します。
+    処理待ちのリクエスト数は max_pending 件までに制限します。
+    """
+
+    def __init__(self, analyzer, max_pending=None, max_batch_texts=None, batch_wait_ms=None):
+        self.analyzer = analyzer
+        self.max_pending = max_pending or config.SERVICE_MAX_PENDING_REQUESTS
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="redactor-analysis")
+        # 定型文など同じテキストの検出結果を再利用する（分析スレッドからのみ使用）
+        self.cache = ResultCache()
+        # 要素は (テキスト, 匿名化エンジン) の組
+        self.scheduler = MicroBatchScheduler(
+            lambda items: redact_texts(
+                analyzer, [text for text, _ in items], anonymizers=[a for _, a in items], cache=self.cache
+            ),
+            lambda item: redact_text(analyzer, *item, cache=self.cache),
+            self.executor,
+            max_batch_texts=max_batch_texts,
+            wait_ms=batch_wait_ms,
+        )
+        self.pending = 0
+
+    def start(self):
+        self.scheduler.start()
+
+    async def anonymize(self, text, anonymizer):
+        """
+        テキストを anonymizer（EntityAnonymizer）で秘匿化し、AnonymizedText を返します。
+        処理待ちが上限に達している場合は 503 を返します。
+        """
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many pending requests",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            return await self.scheduler.submit((text, anonymizer))
+        finally:
+            self.pending -= 1
+
+    def metrics(self):
+        """
+        マイクロバッチのメトリクス（バッチの充填率・キュー待ち時間）、結果キャッシュのヒット率、
+        処理待ちのリクエスト数を返します。
+        """
+        return {
+            "pending": self.pending,
+            "queued": self.scheduler.queued,
+            **self.scheduler.metrics.snapshot(),
+            "result_cache": self.cache.stats(),
+        }
+
+    async def shutdown(self):
+        await self.scheduler.close()
+        self.executor.shutdown(wait=True)
+
+
+class SessionLocks:
+    """
+    セッションごとのロック。このプロセス内で同じセッションへの /anonymize を 1 件ずつ処理し、
+    同じプロセスのリクエスト同士が保存の競合（再試行）を起こさないようにします。使用中のリクエストがなくなったロックは破棄します。
+    他のワーカープロセスとの競合は、セッションストアのバージョンの比較（save_mapping の expected_version）で検出します。
+    """
+
+    def __init__(self):
+        self._locks = {}  # session_id -> [asyncio.Lock, 使用中のリクエスト数]
+
+    @asynccontextmanager
+    async def hold(self, session_id):
+        entry = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[session_id]
+
+
+class DeanonymizeStreamResponse(Response):
+    """
+    リクエストボディを受信しながら復号化し、確定した部分から順に返すレスポンス。
+
+    StreamingResponse は切断検知のためにリクエストの受信（receive）を並行して読み取るため、
+    ボディを受信しながら応答する用途では使用できません。受信と送信を 1 つのループで行います。
+    """
+
+    media_type = "text/plain"
+
+    def __init__(self, mapping, status_code=200):
+        self.mapping = mapping
+        self.status_code = status_code
+        self.background = None
+        self.init_headers()
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        stream = StreamingDeanonymizer(self.mapping)
+        # マルチバイト文字がチャンクの境界で分割される場合があるため、逐次デコードする
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            restored = stream.feed(decoder.decode(message.get("body", b"")))
+            if restored:
+                await send({"type": "http.response.body", "body": restored.encode("utf-8"), "more_body": True})
+            if not message.get("more_body", False):
+                break
+        restored = stream.feed(decoder.decode(b"", final=True)) + stream.flush()
+        await send({"type": "http.response.body", "body": restored.encode("utf-8"), "more_body": False})
+
+
+async def get_compiled_mapping(app, session_id):
+    """
+    セッションのマッピングをコンパイルした復号化器（CompiledMapping）を返します。セッションがない場合は None を返します。
+    セッションのバージョンが変わっていなければ、キャッシュ済みのコンパイル結果を再利用します。
+    """
+    version = await app.state.sessions.get_version(session_id)
+    if version is None:
+        return None
+    compiled = app.state.deanonymizers.get(session_id, version)
+    if compiled is not None:
+        return compiled
+    mapping, version = await app.state.sessions.get_mapping_with_version(session_id)
+    if mapping is None:
+        return None
+    return app.state.deanonymizers.put(session_id, version, mapping)
+
+
+# --- API 認証 ---
+
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+
+async def verify_api_key(api_key: Optional[str] = Security(api_key_header)):
+    """config.SERVICE_API_KEY が設定されている場合のみ X-API-Key を検証します。"""
+    if config.SERVICE_API_KEY is None:
+        return None
+    if api_key is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="API Key required")
+    if api_key != config.SERVICE_API_KEY:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid API Key")
+    return api_key
+
+
+# --- アプリケーション ---
+
+def create_app(analyzer=None, session_store=None):
+    """
+    FastAPI アプリケーションを作成します。
+    analyzer・session_store を省略した場合は、起動時に load_analyzer() と create_session_store() で作成します。
+    """
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # 起動時: Analyzer（spaCy モデル）を読み込み、全リクエストで共有する
+        app.state.redactor = RedactorService(analyzer if analyzer is not None else load_analyzer())
+        app.state.redactor.start()
+        app.state.sessions = session_store if session_store is not None else create_session_store()
+        app.state.deanonymizers = CompiledMappingCache()
+        app.state.session_locks = SessionLocks()
+        try:
+            yield
+        finally:
+            await app.state.redactor.shutdown()
+            await app.state.sessions.close()
+
+    app = FastAPI(
+        title="Teppeki Redactor API",
+        description="日本語PII秘匿化・復号化API",
+        version=VERSION,
+        lifespan=lifespan,
+    )
+
+    @app.get("/health", response_model=HealthResponse, tags=["Health"])
+    async def health():
+        return HealthResponse(status="healthy", version=VERSION)
+
+    @app.get("/metrics", tags=["Health"])
+    async def metrics(request: Request, api_key=Depends(verify_api_key)):
+        return request.app.state.redactor.metrics()
+
+    @app.post("/anonymize", response_model=AnonymizeResponse, tags=["Anonymize"])
+    async def anonymize(request: Request, body: AnonymizeRequest, api_key=Depends(verify_api_key)):
+        sessions = request.app.state.sessions
+        async with request.app.state.session_locks.hold(body.session_id):
+            for _ in range(config.SESSION_SAVE_MAX_ATTEMPTS):
+                # 前のターンまでの番号の対応を復元し、新しいメッセージだけを秘匿化する
+                state, version = await sessions.get_state_with_version(body.session_id)
+                anonymizer = EntityAnonymizer.from_state(config.TARGET_ENTITIES, state)
+                anonymized = await request.app.state.redactor.anonymize(body.text, anonymizer)
+                # マッピング情報をセッションに保存（既存のマッピングにマージ）し、番号の対応を更新する
+                # 別のワーカーが先に同じセッションを更新していた場合は、その状態から番号を割り当て直す
+                # （検出結果は結果キャッシュから再利用されるため、再分析はしない）
+                if await sessions.save_mapping(body.session_id, anonymized.mapping, anonymizer.get_state(), expected_version=version):
+                    return AnonymizeResponse(anonymized_text=anonymized.text, entities=anonymized.items)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Session was updated concurrently",
+            headers={"Retry-After": "1"},
+        )
+
+    @app.post("/deanonymize", response_model=DeanonymizeResponse, tags=["Deanonymize"])
+    async def deanonymize_text(request: Request, body: DeanonymizeRequest, api_key=Depends(verify_api_key)):
+        compiled = await get_compiled_mapping(request.app, body.session_id)
+        # マッピングがない（PII を含む入力がなかった・期限切れ）場合はそのまま返す
+        text = compiled.deanonymize(body.text) if compiled else body.text
+        return DeanonymizeResponse(deanonymized_text=text)
+
+    @app.post("/deanonymize/stream", response_class=DeanonymizeStreamResponse, tags=["Deanonymize"])
+    async def deanonymize_stream(
+        request: Request,
+        session_id: str = Query(..., min_length=1, max_length=128),
+        api_key=Depends(verify_api_key),
+    ):
+        """
+        リクエストボディ（UTF-8 テキスト、chunked 転送可）を受信した順に復号化し、そのままストリーミングで返します。
+        LLM の応答をチャンクごとに転送する用途向けで、トークンの途中で分割されたチャンクも正しく復号化します。
+        """
+        compiled = await get_compiled_mapping(request.app, session_id)
+        return DeanonymizeStreamResponse(compiled or {})
+
+    @app.delete("/session/{session_id}", response_model=MessageResponse, tags=["Session"])
+    async def delete_session(request: Request, session_id: str, api_key=Depends(verify_api_key)):
+        await request.app.state.sessions.delete_session(session_id)
+        request.app.state.deanonymizers.discard(session_id)
+        return MessageResponse(message="Session deleted successfully")
+
+    return app
+
+
+app = create_app()
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Japanese PII Redactor API server")
+    parser.add_argument("--host", type=str, help="Bind address", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="Bind port", default=8000)
+    args = parser.parse_args()
+
+    uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+API サーバー（redactor.service）のセッションストアです。
+
+セッションごとに、秘匿化で出力したトークンと元の値の対応（マッピング）と、
+匿名化エンジンの番号の対応（EntityAnonymizer.get_state()、以下「状態」）を保存します。
+ストアは SessionStore を継承して実装し、config.SESSION_STORE_URL で切り替えます。
+
+    memory://            プロセス内メモリ（単一プロセス・ローカル開発用。ワーカープロセス間で共有されないため、
+                         uvicorn --workers 2 以上では別のワーカーが処理した /deanonymize がセッションを見つけられない）
+    redis://host:port/db Redis（複数のワーカープロセス・インスタンスで共有する場合）
+
+/anonymize は状態をバージョンとともに読み込み、秘匿化した後、バージョンが変わっていない場合にだけ保存します
+（save_mapping の expected_version）。別のワーカーが先に同じセッションを更新していた場合は保存せずに False を返すため、
+呼び出し元は状態を読み込み直して番号を割り当て直します。
+"""
+
+import json
+import time
+from urllib.parse import urlparse
+
+try:
+    from . import config
+except ImportError:
+    import config
+
+
+class SessionStore:
+    """
+    セッションストアの基底クラス。すべてのメソッドはコルーチンです。
+    マッピングを保存するたびにセッションのバージョン（整数）が増えます。復号化器はバージョンが同じ間、
+    マッピングのコンパイル結果を再利用します（deanonymizer.CompiledMappingCache）。
+    """
+
+    async def get_mapping(self, session_id):
+        """セッションのマッピング（トークン → 元の値）を返します。存在しない場合は None を返します。"""
+        mapping, _ = await self.get_mapping_with_version(session_id)
+        return mapping
+
+    async def get_mapping_with_version(self, session_id):
+        """(マッピング, バージョン) を返します。存在しない場合は (None, None) を返します。"""
+        raise NotImplementedError
+
+    async def get_version(self, session_id):
+        """セッションのバージョンを返します。存在しない場合は None を返します。"""
+        raise NotImplementedError
+
+    async def get_state(self, session_id):
+        """セッションに保存した匿名化エンジンの状態を返します。存在しない場合は None を返します。"""
+        state, _ = await self.get_state_with_version(session_id)
+        return state
+
+    async def get_state_with_version(self, session_id):
+        """(匿名化エンジンの状態, バージョン) を返します。セッションが存在しない場合は (None, 0) を返します。"""
+        raise NotImplementedError
+
+    async def save_mapping(self, session_id, mapping, state=None, expected_version=None):
+        """
+        マッピングを既存のマッピングにマージして保存し、有効期間を延長します。保存した場合は True を返します。
+        state を指定した場合は、匿名化エンジンの状態も置き換えます。
+        expected_version を指定した場合は、セッションのバージョン（存在しない場合は 0）がこの値と一致するときだけ保存し、
+        一致しない（他のリクエストが先に保存した）場合は何も変更せずに False を返します。
+        """
+        raise NotImplementedError
+
+    async def delete_session(self, session_id):
+        """セッションを削除します。削除した場合は True を返します。"""
+        raise NotImplementedError
+
+    async def close(self):
+        """接続などのリソースを解放します。"""
+
+
+class _Session:
+    __slots__ = ("expires_at", "mapping", "version", "state")
+
+    def __init__(self):
+        self.expires_at = 0.0
+        self.mapping = {}
+        self.version = 0
+        self.state = None  # 匿名化エンジンの状態（JSON 文字列）
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    プロセス内の dict に保存するセッションストア。
+    イベントループのスレッドからのみ操作するため、ロックは不要です。
+    セッションはプロセス内にしかないため、API サーバーは 1 ワーカーで起動してください。
+    期限切れのセッションは参照時と、一定回数の保存ごとの一括削除で破棄します。
+    """
+
+    # この回数の保存ごとに期限切れのセッションを一括削除する
+    _PURGE_INTERVAL = 1024
+
+    def __init__(self, ttl_seconds=None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else config.SESSION_TTL_SECONDS
+        self._sessions = {}  # session_id -> _Session
+        self._saves = 0
+
+    def _get_live(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if session.expires_at <= time.monotonic():
+            del self._sessions[session_id]
+            return None
+        return session
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        for session_id in [key for key, session in self._sessions.items() if session.expires_at <= now]:
+            del self._sessions[session_id]
+
+    async def get_mapping_with_version(self, session_id):
+        session = self._get_live(session_id)
+        if session is None:
+            return None, None
+        return dict(session.mapping), session.version
+
+    async def get_version(self, session_id):
+        session = self._get_live(session_id)
+        return session.version if session is not None else None
+
+    async def get_state_with_version(self, session_id):
+        session = self._get_live(session_id)
+        if session is None:
+            return None, 0
+        # 呼び出し元が変更しても保存済みの状態に影響しないよう、JSON と同じ形でコピーして返す
+        return (json.loads(session.state) if session.state is not None else None), session.version
+
+    async def save_mapping(self, session_id, mapping, state=None, expected_version=None):
+        session = self._get_live(session_id)
+        if expected_version is not None and (session.version if session is not None else 0) != expected_version:
+            return False
+        if session is None:
+            session = self._sessions[session_id] = _Session()
+        session.mapping.update(mapping)
+        if state is not None:
+            session.state = json.dumps(state, ensure_ascii=False)
+        session.version += 1
+        session.expires_at = time.monotonic() + self.ttl_seconds
+        self._saves += 1
+        if self._saves % self._PURGE_INTERVAL == 0:
+            self._purge_expired()
+        return True
+
+    async def delete_session(self, session_id):
+        return self._sessions.pop(session_id, None) is not None
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Redis のハッシュ（トークン → 元の値）に保存するセッションストア。
+    バージョンは別のキー（session:<id>:version）に INCR で記録し、
+    匿名化エンジンの状態は JSON 文字列として session:<id>:state に保存します。
+    expected_version を指定した保存は、バージョンのキーを WATCH して MULTI/EXEC で行うため、
+    複数のワーカーが同じセッションを同時に更新しても、先に保存した方以外は False になります
+    （同じ番号を別の値に割り当てたマッピングが上書きされることはありません）。
+    redis パッケージ（redis.asyncio）が必要です。
+    """
+
+    key_prefix = "session:"
+
+    def __init__(self, url, ttl_seconds=None):
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise ImportError("Redis のセッションストアを使用するには redis パッケージをインストールしてください: pip install redis") from e
+        self.redis = Redis.from_url(url, decode_responses=True)
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else config.SESSION_TTL_SECONDS
+
+    def _get_key(self, session_id):
+        return f"{self.key_prefix}{session_id}"
+
+    def _get_version_key(self, session_id):
+        return f"{self.key_prefix}{session_id}:version"
+
+    def _get_state_key(self, session_id):
+        return f"{self.key_prefix}{session_id}:state"
+
+    async def get_mapping_with_version(self, session_id):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(self._get_key(session_id))
+            pipe.get(self._get_version_key(session_id))
+            mapping, version = await pipe.execute()
+        if version is None:
+            return None, None
+        return mapping, int(version)
+
+    async def get_version(self, session_id):
+        version = await self.redis.get(self._get_version_key(session_id))
+        return int(version) if version is not None else None
+
+    async def get_state_with_version(self, session_id):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.get(self._get_state_key(session_id))
+            pipe.get(self._get_version_key(session_id))
+            state, version = await pipe.execute()
+        return (json.loads(state) if state is not None else None), int(version or 0)
+
+    async def save_mapping(self, session_id, mapping, state=None, expected_version=None):
+        from redis.exceptions import WatchError
+
+        key = self._get_key(session_id)
+        version_key = self._get_version_key(session_id)
+        state_key = self._get_state_key(session_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            try:
+                if expected_version is not None:
+                    # EXEC までにバージョンが変わった場合は WatchError になり、何も書き込まれない
+                    await pipe.watch(version_key)
+                    if int(await pipe.get(version_key) or 0) != expected_version:
+                        return False
+                    pipe.multi()
+                if mapping:
+                    pipe.hset(key, mapping=mapping)
+                if state is not None:
+                    pipe.set(state_key, json.dumps(state, ensure_ascii=False))
+                pipe.incr(version_key)
+                for expiring_key in (key, version_key, state_key):
+                    pipe.expire(expiring_key, self.ttl_seconds)
+                await pipe.execute()
+            except WatchError:
+                return False
+        return True
+
+    async def delete_session(self, session_id):
+        keys = (self._get_key(session_id), self._get_version_key(session_id), self._get_state_key(session_id))
+        return await self.redis.delete(*keys) > 0
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_session_store(url=None):
+    """接続先の URL（省略時は config.SESSION_STORE_URL）に対応するセッションストアを作成します。"""
+    url = url or config.SESSION_STORE_URL
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return InMemorySessionStore()
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisSessionStore(url)
+    raise ValueError(f"未対応のセッションストアです: {url}")
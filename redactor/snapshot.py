@@ -0,0 +1,167 @@
+"""
+構築済みの AnalyzerEngine（spaCy パイプライン + Recognizer レジストリ）をディスクに保存し、
+次回以降の起動時に読み込むためのスナップショット機能です。
+
+スナップショットのファイル名には設定とコードのフィンガープリントを含めるため、
+検出結果に影響する設定や Recognizer の定義が変わると自動的に再構築されます。
+スナップショットは pickle 形式のため、信頼できるディレクトリにのみ保存してください。
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+import time
+from importlib import metadata
+from pathlib import Path
+
+try:
+    from . import config
+except ImportError:
+    import config
+
+SNAPSHOT_PREFIX = "analyzer-"
+SNAPSHOT_SUFFIX = ".pkl"
+
+# フィンガープリントに含めるソースファイル（Recognizer の構築・動作や秘匿化結果に影響するもの）
+# 秘匿化済みファイルのマニフェスト（manifest.py）でも同じフィンガープリントを使用する
+# config.py は検出結果に影響しない設定の変更で無効にならないよう、ファイルではなく _FINGERPRINT_SETTINGS の値で含める
+_FINGERPRINT_SOURCES = ("redactor.py", "pattern_scanner.py", "intervals.py", "nlp_pipeline.py", "morph_cache.py", "analyzer_engine.py", "streaming.py", "keywords.py", "anonymizer.py", "form_fields.py", "tables.py")
+_FINGERPRINT_PACKAGES = ("presidio-analyzer", "spacy")
+# フィンガープリントに含める設定（検出結果・秘匿化結果、またはスナップショットの AnalyzerEngine の構成に影響するもの）
+# API キーなどの秘密情報や、サーバー・キャッシュの運用設定（SERVICE_*・SESSION_*・RESULT_CACHE_MAX_* など）は含めない
+_FINGERPRINT_SETTINGS = (
+    "NLP_CONFIG", "NLP_MINIMAL_PIPELINE", "NLP_REQUIRED_COMPONENTS", "NLP_CACHE_MORPH",
+    "STREAM_WINDOW_BYTES", "STREAM_OVERLAP_BYTES", "RESULT_CACHE_BY_PARAGRAPH",
+    "FORM_FIELD_FAST_PATH", "FORM_FIELD_VALUE_ENTITIES", "FORM_FIELD_SCORE", "FORM_FIELD_MAX_VALUE_LENGTH",
+    "FORM_FIELD_EXTRA_LABELS", "TABLE_AWARE", "TABLE_SAMPLE_CELLS", "TABLE_COLUMN_MIN_RATIO",
+    "DEFAULT_SCORE_THRESHOLD", "TARGET_ENTITIES", "ALLOW_LIST", "USE_COMBINED_PATTERN_SCANNER",
+    "JP_PHONE_SCORE", "EMAIL_SCORE", "CC_SCORE", "PERSON_SCORE", "ROMAJI_NAME_SCORE", "ORG_SCORE", "LOCATION_SCORE",
+    "MY_NUMBER_SCORE", "DRIVERS_LICENSE_SCORE", "PASSPORT_SCORE", "BANK_ACCOUNT_SCORE", "TAX_NUMBER_SCORE",
+    "PASSWORD_SCORE", "SECRET_KEY_SCORE", "CERTIFICATE_SCORE", "SECURITY_CODE_SCORE", "PIN_SCORE",
+    "COMMON_JAPANESE_WORDS", "COMMON_SUFFIXES_PATTERN", "CONTEXT_WORDS",
+)
+
+def _package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+def config_fingerprint():
+    """
+    設定値・関連ソース・ライブラリのバージョンから、スナップショットの有効性を判定するハッシュを作成します。
+    設定は _FINGERPRINT_SETTINGS の値だけを含めます（実行時に config の値を書き換えた場合も検知できる）。
+    """
+    digest = hashlib.sha256()
+
+    settings = {name: getattr(config, name) for name in _FINGERPRINT_SETTINGS}
+    # set は順序が不定なのでソートしてから直列化する
+    digest.update(json.dumps(settings, sort_keys=True, ensure_ascii=False, default=sorted).encode("utf-8"))
+
+    module_dir = Path(__file__).resolve().parent
+    for filename in _FINGERPRINT_SOURCES:
+        path = module_dir / filename
+        if path.exists():
+            digest.update(filename.encode("utf-8"))
+            digest.update(path.read_bytes())
+
+    versions = [sys.version] + [f"{name}=={_package_version(name)}" for name in _FINGERPRINT_PACKAGES]
+    for model in config.NLP_CONFIG.get("models", []):
+        versions.append(f"{model['model_name']}=={_package_version(model['model_name'])}")
+    digest.update("\n".join(versions).encode("utf-8"))
+
+    return digest.hexdigest()
+
+def snapshot_path(snapshot_dir, fingerprint):
+    """フィンガープリントに対応するスナップショットのパスを返します。"""
+    return Path(snapshot_dir) / f"{SNAPSHOT_PREFIX}{fingerprint[:16]}{SNAPSHOT_SUFFIX}"
+
+def save_snapshot(analyzer, path):
+    """AnalyzerEngine をスナップショットとして保存します（書き込み途中のファイルを読まないよう置換で反映）。"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + f".{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(analyzer, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+    # 古いフィンガープリントのスナップショットを削除
+    for stale in path.parent.glob(f"{SNAPSHOT_PREFIX}*{SNAPSHOT_SUFFIX}"):
+        if stale != path:
+            try:
+                stale.unlink()
+            except OSError:
+                pass
+
+def load_snapshot(path):
+    """スナップショットから AnalyzerEngine を読み込みます。"""
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def load_or_build(builder, snapshot_dir, timings=None, rebuild=False):
+    """
+    有効なスナップショットがあれば読み込み、なければ builder() で構築して保存します。
+
+    :param builder: AnalyzerEngine を構築する関数（timings 引数を受け取る）
+    :param snapshot_dir: スナップショットの保存ディレクトリ
+    :param timings: フェーズごとの所要時間（秒）を書き込む dict
+    :param rebuild: True の場合はスナップショットを無視して再構築する
+    """
+    if timings is None:
+        timings = {}
+
+    start_time = time.perf_counter()
+    fingerprint = config_fingerprint()
+    path = snapshot_path(snapshot_dir, fingerprint)
+    timings["fingerprint"] = time.perf_counter() - start_time
+
+    if path.exists() and not rebuild:
+        start_time = time.perf_counter()
+        try:
+            analyzer = load_snapshot(path)
+            timings["snapshot_load"] = time.perf_counter() - start_time
+            return analyzer
+        except Exception as e:
+            # 壊れたスナップショットは再構築する
+            print(f"スナップショットの読み込みに失敗したため再構築します: {e}")
+
+    analyzer = builder(timings=timings)
+
+    start_time = time.perf_counter()
+    try:
+        save_snapshot(analyzer, path)
+    except Exception as e:
+        print(f"スナップショットの保存に失敗しました: {e}")
+    timings["snapshot_save"] = time.perf_counter() - start_time
+
+    return analyzer
+
+def format_timings(timings):
+    """フェーズごとの所要時間を 1 行の文字列にまとめます。"""
+    total = sum(timings.values())
+    phases = ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in timings.items())
+    return f"{total * 1000:.1f}ms ({phases})"
+
+if __name__ == "__main__":
+    import argparse
+
+    try:
+        from .redactor import setup_analyzer
+    except ImportError:
+        from redactor import setup_analyzer
+
+    parser = argparse.ArgumentParser(description="AnalyzerEngine のスナップショットを事前構築します")
+    parser.add_argument("--dir", type=str, help="スナップショットの保存ディレクトリ", default=None)
+    parser.add_argument("--rebuild", action="store_true", help="既存のスナップショットを無視して再構築する")
+
+    args = parser.parse_args()
+
+    base_dir = Path(__file__).resolve().parent.parent
+    snapshot_dir = Path(args.dir) if args.dir else base_dir / config.ANALYZER_SNAPSHOT_DIR
+
+    timings = {}
+    load_or_build(setup_analyzer, snapshot_dir, timings=timings, rebuild=args.rebuild)
+    print(f"スナップショット: {snapshot_path(snapshot_dir, config_fingerprint())}")
+    print(f"起動時間: {format_timings(timings)}")
@@ -0,0 +1,115 @@
+"""
+巨大な文書を行単位のウィンドウに分割し、逐次的に秘匿化するストリーミング処理です。
+
+ファイル全体を読み込まずに、一定サイズのウィンドウごとに分析・匿名化して出力へ書き込むため、
+ピークメモリはファイルサイズに依存しません。日本語トークナイザー（Sudachi）の入力上限
+（約 48KB）を超えるファイルも処理できます。
+
+ウィンドウの末尾には「先読み」領域を設け、そこから始まる検出結果は次のウィンドウで確定します。
+次のウィンドウの先頭には直前の出力済みテキストを「前文脈」として付与し（出力はしない）、
+後読みを使うパターンや NER が境界付近でも同じように動作するようにします。
+"""
+
+from collections import deque
+
+# 1 行がこの文字数を超える場合は分割して読み込む（UTF-8 は 1 文字最大 4 バイト）
+_MAX_BYTES_PER_CHAR = 4
+
+
+def _byte_len(text):
+    return len(text.encode("utf-8"))
+
+
+def _tail_lines(text, max_bytes):
+    """text の末尾から、合計 max_bytes 以下に収まる行（行単位）を返します。"""
+    tail = []
+    total = 0
+    for line in reversed(text.splitlines(keepends=True)):
+        size = _byte_len(line)
+        if total + size > max_bytes:
+            break
+        tail.append(line)
+        total += size
+    return "".join(reversed(tail)), total
+
+
+def redact_stream(reader, writer, analyze, anonymize, window_bytes, overlap_bytes):
+    """
+    reader のテキストをウィンドウごとに秘匿化し、writer へ逐次書き込みます。
+
+    :param reader: 入力（テキストモードのファイルオブジェクト）
+    :param writer: 出力（テキストモードのファイルオブジェクト）
+    :param analyze: テキストを受け取り検出結果（RecognizerResult のリスト）を返す関数
+    :param anonymize: (テキスト, 検出結果) を受け取り匿名化後のテキストを返す関数。
+                      エンティティ番号をウィンドウ間で揃えるため、同じ匿名化エンジン（EntityAnonymizer）を使い続けること
+    :param window_bytes: 1 回に分析するテキストの最大バイト数
+    :param overlap_bytes: 前文脈・先読みのバイト数（最長のパターンより大きくする）
+    :return: 処理したウィンドウ数
+    """
+    if overlap_bytes <= 0 or window_bytes < 3 * overlap_bytes:
+        raise ValueError("window_bytes は overlap_bytes の 3 倍以上にしてください")
+
+    max_piece_chars = max(1, overlap_bytes // _MAX_BYTES_PER_CHAR)
+    pending = deque()  # 未出力の断片 (テキスト, バイト数)
+    pending_bytes = 0
+    context = ""
+    context_bytes = 0
+    next_piece = None
+    exhausted = False
+    windows = 0
+
+    while True:
+        # ウィンドウが一杯になるまで行（長い行は分割）を読み込む
+        while not exhausted and context_bytes + pending_bytes < window_bytes:
+            if next_piece is None:
+                piece = reader.readline(max_piece_chars)
+                if not piece:
+                    exhausted = True
+                    break
+                next_piece = (piece, _byte_len(piece))
+            if context_bytes + pending_bytes + next_piece[1] > window_bytes:
+                break
+            pending.append(next_piece)
+            pending_bytes += next_piece[1]
+            next_piece = None
+
+        if not pending:
+            break
+
+        # 末尾の overlap_bytes 分を先読みとして残し、それより前の断片を確定させる
+        if exhausted:
+            emit_count = len(pending)
+        else:
+            emit_count = 0
+            remaining = pending_bytes
+            for _, size in pending:
+                if remaining - size < overlap_bytes:
+                    break
+                remaining -= size
+                emit_count += 1
+            emit_count = max(emit_count, 1)
+
+        offset = len(context)
+        text = context + "".join(piece for piece, _ in pending)
+        cut = offset + sum(len(pending[i][0]) for i in range(emit_count))
+
+        # 前文脈で始まる結果は前のウィンドウで確定済み、先読みで始まる結果は次のウィンドウで確定する
+        results = [r for r in analyze(text) if offset <= r.start < cut]
+        # 確定位置をまたぐ結果があれば、その終了位置まで出力する
+        end = max([cut] + [r.end for r in results])
+        for result in results:
+            result.start -= offset
+            result.end -= offset
+        writer.write(anonymize(text[offset:end], results))
+        windows += 1
+
+        # 出力済みの末尾を次の前文脈に、未出力部分を次のウィンドウの先頭にする
+        context, context_bytes = _tail_lines(text[:end], overlap_bytes)
+        pending.clear()
+        pending_bytes = 0
+        for piece in text[end:].splitlines(keepends=True):
+            size = _byte_len(piece)
+            pending.append((piece, size))
+            pending_bytes += size
+
+    return windows
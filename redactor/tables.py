@@ -0,0 +1,218 @@
+"""
+Markdown の表・CSV を列単位で分析する表モードです（form_fields.split_form_fields から使用）。
+
+CRM のエクスポートなどの表は、列の見出し（"担当者"・"電話" など）が列のすべてのセルのエンティティタイプを決めます。
+セルごとに spaCy を実行する代わりに、列ごとにタイプを判定してセルをまとめて分類します。
+
+- 見出しが値全体をエンティティとするタイプ（config.FORM_FIELD_VALUE_ENTITIES）を示す列は、セル全体を検出します。
+- 見出しが対応しない列は、正規表現の検出結果と記号・数字だけで説明できないセルを最大 config.TABLE_SAMPLE_CELLS 件
+  抽出して 1 回だけ分析し、config.TABLE_COLUMN_MIN_RATIO 以上のセルが同じタイプと判定されれば列全体をそのタイプとします。
+- どちらにも当てはまらないセル（備考などの自由記述）は、通常どおり spaCy で分析します。
+
+spaCy の実行回数はセル数ではなく列数（見本の分析）に比例します。
+"""
+
+import re
+from collections import Counter, namedtuple
+
+from presidio_analyzer import RecognizerResult
+
+try:
+    from . import config
+except ImportError:
+    import config
+
+# セル（前後の空白を除いた範囲）。text は元のテキスト上の text[start:end]
+Cell = namedtuple("Cell", ["start", "end"])
+# header: 見出しのセル、rows: 行ごとのセルのリスト、lines: 表の行（見出し・区切り行を含む）の (開始位置, 終了位置) のリスト
+Table = namedtuple("Table", ["header", "rows", "lines"])
+
+_TABLE_ROW = re.compile(r'[ \t]*\|.*\|?[ \t\r]*')
+_TABLE_SEPARATOR = re.compile(r'[ \t]*\|?(?:[ \t]*:?-{3,}:?[ \t]*\|)+(?:[ \t]*:?-{3,}:?[ \t]*)?[ \t\r]*')
+# CSV のフィールド（引用符で囲まれたフィールドは改行・カンマ・"" を含められる）
+_CSV_FIELD = re.compile(r'"(?:[^"]|"")*"|[^,\r\n]*')
+
+
+def _strip_span(text, start, end):
+    """範囲の前後の空白を除いた Cell を返します。"""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return Cell(start, end)
+
+
+def _markdown_cells(text, start, end):
+    """Markdown の表の 1 行をセルに分割します（\\| はセルの区切りとしない）。"""
+    line = text[start:end].rstrip("\r")
+    inner_start = start + (len(line) - len(line.lstrip()))
+    inner_end = start + len(line.rstrip())
+    if text.startswith("|", inner_start):
+        inner_start += 1
+    if inner_end > inner_start and text[inner_end - 1] == "|" and text[inner_end - 2] != "\\":
+        inner_end -= 1
+    cells = []
+    cell_start = inner_start
+    position = inner_start
+    while position < inner_end:
+        if text[position] == "|" and text[position - 1] != "\\":
+            cells.append(_strip_span(text, cell_start, position))
+            cell_start = position + 1
+        position += 1
+    cells.append(_strip_span(text, cell_start, inner_end))
+    return cells
+
+
+def find_markdown_tables(text):
+    """テキスト中の Markdown の表（見出し行・区切り行・データ行）を Table のリストで返します。"""
+    lines = []
+    position = 0
+    for line in text.splitlines(keepends=True):
+        lines.append((position, position + len(line.rstrip("\r\n"))))
+        position += len(line)
+
+    tables = []
+    i = 0
+    while i + 1 < len(lines):
+        header_start, header_end = lines[i]
+        separator_start, separator_end = lines[i + 1]
+        if not (_TABLE_ROW.fullmatch(text, header_start, header_end)
+                and _TABLE_SEPARATOR.fullmatch(text, separator_start, separator_end)):
+            i += 1
+            continue
+        header = _markdown_cells(text, header_start, header_end)
+        rows = []
+        table_lines = [lines[i], lines[i + 1]]
+        j = i + 2
+        while j < len(lines) and _TABLE_ROW.fullmatch(text, *lines[j]) and text[lines[j][0]:lines[j][1]].strip():
+            rows.append(_markdown_cells(text, *lines[j]))
+            table_lines.append(lines[j])
+            j += 1
+        if rows:
+            tables.append(Table(header, rows, table_lines))
+        i = j
+    return tables
+
+
+def find_csv_table(text):
+    """
+    テキスト全体が CSV（見出し行 + 2 行以上、すべての行の列数が 2 以上で一致）の場合に Table を返します。
+    それ以外の場合は None を返します。引用符で囲まれたフィールドは引用符を除いた範囲をセルとします。
+    """
+    records = []
+    lines = []
+    position = 0
+    length = len(text.rstrip("\r\n"))
+    while position < length:
+        record = []
+        record_start = position
+        while True:
+            match = _CSV_FIELD.match(text, position)
+            start, end = match.span()
+            if end - start >= 2 and text[start] == '"':
+                record.append(Cell(start + 1, end - 1))
+            else:
+                record.append(_strip_span(text, start, end))
+            position = end
+            if position < length and text[position] == ",":
+                position += 1
+                continue
+            break
+        if position < length and text[position] not in "\r\n":
+            return None  # 引用符の後に余分な文字がある（CSV ではない）
+        lines.append((record_start, position))
+        records.append(record)
+        if text.startswith("\r\n", position):
+            position += 2
+        elif position < length:
+            position += 1
+    if len(records) < 3:
+        return None
+    columns = len(records[0])
+    if columns < 2 or any(len(record) != columns for record in records):
+        return None
+    # 見出しは短いラベルであること（カンマを含む文章を CSV と誤認しない）
+    if any(not 0 < cell.end - cell.start <= 30 for cell in records[0]):
+        return None
+    return Table(records[0], records[1:], lines)
+
+
+def find_tables(text):
+    """テキスト中の表（テキスト全体が CSV の場合はその表、それ以外は Markdown の表）を返します。"""
+    if "," in text and "|" not in text[:text.find("\n") if "\n" in text else len(text)]:
+        table = find_csv_table(text)
+        if table is not None:
+            return [table]
+    if "|" not in text:
+        return []
+    return find_markdown_tables(text)
+
+
+def _infer_column_type(analyzer, text, cells):
+    """
+    見本のセルを 1 回の分析でまとめて判定し、TABLE_COLUMN_MIN_RATIO 以上のセルで半分以上を占める
+    エンティティタイプ（FORM_FIELD_VALUE_ENTITIES のいずれか）を返します。該当しない場合は None を返します。
+    """
+    sample = [text[cell.start:cell.end] for cell in cells[:config.TABLE_SAMPLE_CELLS]]
+    joined = "\n".join(sample)
+    results = analyzer.analyze(
+        text=joined,
+        language='ja',
+        entities=config.FORM_FIELD_VALUE_ENTITIES,
+        allow_list=config.ALLOW_LIST,
+        score_threshold=config.DEFAULT_SCORE_THRESHOLD,
+    )
+    votes = Counter()
+    offset = 0
+    for value in sample:
+        covered = Counter()
+        for result in results:
+            overlap = min(result.end, offset + len(value)) - max(result.start, offset)
+            if overlap > 0:
+                covered[result.entity_type] += overlap
+        for entity_type, chars in covered.items():
+            if chars * 2 >= len(value):
+                votes[entity_type] += 1
+        offset += len(value) + 1
+    if not votes:
+        return None
+    entity_type, count = votes.most_common(1)[0]
+    return entity_type if count >= config.TABLE_COLUMN_MIN_RATIO * len(sample) else None
+
+
+def analyze_tables(analyzer, text, tables, parser, scan_cells, explained):
+    """
+    表を列単位で分析し、(検出結果, 高速処理した範囲のリスト) を返します。
+    高速処理した範囲は、列単位で分類したセルです。見出し・区切り記号と通常どおり分析するセルは spaCy の分析対象に残し、
+    自由記述のセルの検出結果も見出しの単語をコンテキストとしてスコアを補正されるようにします。
+
+    :param parser: 見出しからエンティティタイプを判定する FormFieldParser
+    :param scan_cells: セルのリストを受け取り、正規表現の Recognizer の検出結果をセルごとに返す関数
+                       （見出しのコンテキスト単語によるスコア補正を含む）
+    :param explained: (セル, 検出結果) を受け取り、セルが検出結果と記号・数字だけで説明できるかを返す関数
+    """
+    results = []
+    handled = []
+    for table in tables:
+        labels = [text[cell.start:cell.end] for cell in table.header]
+        for column, label in enumerate(labels):
+            cells = [row[column] for row in table.rows if column < len(row) and row[column].end > row[column].start]
+            if not cells:
+                continue
+            cell_results = scan_cells(cells, label)
+            entity_type = parser.label_entity(label) if label else None
+            if entity_type not in config.FORM_FIELD_VALUE_ENTITIES:
+                unexplained = [cell for cell, found in zip(cells, cell_results) if not explained(cell, found)]
+                entity_type = _infer_column_type(analyzer, text, unexplained) if unexplained else None
+            for cell, found in zip(cells, cell_results):
+                if entity_type in config.FORM_FIELD_VALUE_ENTITIES:
+                    if cell.end - cell.start > config.FORM_FIELD_MAX_VALUE_LENGTH:
+                        continue
+                    # 記号・数字だけのセル（"-" など）は値全体を検出しない
+                    if not explained(cell, []) and not any(r.entity_type == entity_type for r in found):
+                        found = found + [RecognizerResult(entity_type, cell.start, cell.end, config.FORM_FIELD_SCORE)]
+                elif not explained(cell, found):
+                    continue
+                results.extend(found)
+                handled.append((cell.start, cell.end))
+    return results, handled
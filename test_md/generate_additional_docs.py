@@ -1862,7 +1862,7 @@ AB1234567890
 
 発行: 出入国在留管理庁
 """},
-}
+})
 
 def generate_documents():
     """テストドキュメントを生成"""
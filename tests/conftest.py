@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# redactor パッケージをリポジトリルートから読み込む
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,195 @@
+import random
+from functools import lru_cache
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("presidio_analyzer")
+spacy = pytest.importorskip("spacy")
+
+from presidio_analyzer import AnalyzerEngine, Pattern, PatternRecognizer, RecognizerRegistry
+from presidio_analyzer.context_aware_enhancers import LemmaContextAwareEnhancer
+from presidio_analyzer.nlp_engine import NlpArtifacts, NlpEngine
+
+from redactor import config
+from redactor.analyzer_engine import DeduplicatingAnalyzerEngine, deduplication_supported
+
+SAMPLE_DOCUMENTS = sorted((Path(__file__).resolve().parent.parent / "test_md").glob("*.md"))
+
+
+@lru_cache(maxsize=None)
+def _blank_pipeline():
+    return spacy.blank("en")
+
+
+class WhitespaceNlpEngine(NlpEngine):
+    """空白区切りのトークンをレンマとする、学習済みモデルを使わない NLP エンジン。"""
+
+    def __init__(self):
+        self.nlp = _blank_pipeline()
+
+    def load(self):
+        pass
+
+    def is_loaded(self):
+        return True
+
+    def process_text(self, text, language):
+        doc = self.nlp(text)
+        return NlpArtifacts(
+            entities=[],
+            tokens=doc,
+            tokens_indices=[token.idx for token in doc],
+            lemmas=[token.text for token in doc],
+            nlp_engine=self,
+            language=language,
+        )
+
+    def process_batch(self, texts, language, batch_size=1, n_process=1, **kwargs):
+        for text in texts:
+            yield text, self.process_text(text, language)
+
+    def is_stopword(self, word, language):
+        return False
+
+    def is_punct(self, word, language):
+        return False
+
+    def get_supported_entities(self):
+        return []
+
+    def get_supported_languages(self):
+        return ["ja"]
+
+
+def build(engine_class):
+    registry = RecognizerRegistry(supported_languages=["ja"])
+    registry.add_recognizer(PatternRecognizer(
+        supported_entity="PHONE_NUMBER",
+        patterns=[Pattern("phone", r"\d{2,4}-\d{4}(?:-\d{4})?", 0.65), Pattern("digits", r"\d{4}", 0.4)],
+        context=["tel"],
+        supported_language="ja",
+    ))
+    registry.add_recognizer(PatternRecognizer(
+        supported_entity="PERSON",
+        patterns=[Pattern("name", r"[A-Z][a-z]+(?: [A-Z][a-z]+)?", 0.6)],
+        context=["name"],
+        supported_language="ja",
+    ))
+    return engine_class(
+        registry=registry,
+        nlp_engine=WhitespaceNlpEngine(),
+        supported_languages=["ja"],
+        context_aware_enhancer=LemmaContextAwareEnhancer(
+            context_similarity_factor=0.35, min_score_with_context_similarity=0.75
+        ),
+    )
+
+
+def random_text(rng):
+    words = ["tel", "name", "Taro", "Taro Yamada", "03-1234-5678", "1234", "Host", "and", "\n"]
+    return " ".join(rng.choice(words) for _ in range(rng.randint(0, 60)))
+
+
+def as_tuples(results):
+    return [(r.entity_type, r.start, r.end, r.score) for r in results]
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("threshold", [0.0, 0.5, 0.85])
+def test_matches_analyzer_engine(seed, threshold):
+    rng = random.Random(seed)
+    text = random_text(rng)
+    kwargs = dict(text=text, language="ja", entities=["PHONE_NUMBER", "PERSON"], score_threshold=threshold, allow_list=["Host"])
+    expected = build(AnalyzerEngine).analyze(**kwargs)
+    assert as_tuples(build(DeduplicatingAnalyzerEngine).analyze(**kwargs)) == as_tuples(expected)
+
+
+@pytest.mark.skipif(not deduplication_supported(), reason="対応しないバージョンの presidio-analyzer では置き換えない")
+def test_uses_given_deduplicator():
+    calls = []
+
+    def deduplicate(results):
+        calls.append(len(results))
+        return results
+
+    engine = build(DeduplicatingAnalyzerEngine)
+    engine.deduplicate = deduplicate
+    engine.analyze(text="tel 03-1234-5678", language="ja", score_threshold=0.0)
+    assert calls
+
+
+def test_does_not_patch_presidio():
+    from presidio_analyzer import EntityRecognizer
+
+    import redactor.redactor  # noqa: F401
+
+    assert EntityRecognizer.remove_duplicates.__module__.startswith("presidio_analyzer")
+
+
+def test_morph_cache_version_gate():
+    pytest.importorskip("spacy.lang.ja")
+    from redactor.morph_cache import morph_cache_supported
+
+    assert morph_cache_supported("3.8.2")
+    assert morph_cache_supported("3.7.5")
+    assert not morph_cache_supported("3.9.0")
+    assert not morph_cache_supported("4.0.0.dev1")
+
+
+def test_deduplication_version_gate():
+    assert deduplication_supported("2.2.364")
+    assert not deduplication_supported("2.2.365")
+    assert not deduplication_supported("2.3.0")
+
+
+def sample_analyzer(monkeypatch):
+    """
+    学習済みモデルの代わりに spaCy の日本語トークナイザーだけのパイプラインを使い、setup_analyzer と同じ Recognizer・
+    コンテキストエンハンサーの DeduplicatingAnalyzerEngine を返します（sudachipy が必要）。
+    """
+    pytest.importorskip("sudachipy")
+    from presidio_analyzer.nlp_engine import SpacyNlpEngine
+
+    import redactor.redactor as redactor_module
+
+    nlp_engine = SpacyNlpEngine(models=[{"lang_code": "ja", "model_name": "ja_core_news_lg"}])
+    nlp_engine.nlp = {"ja": spacy.blank("ja")}
+    monkeypatch.setattr(config, "USE_ANALYZER_SNAPSHOT", False)
+    monkeypatch.setattr(redactor_module, "create_nlp_engine", lambda: nlp_engine)
+    return redactor_module.setup_analyzer()
+
+
+@pytest.mark.parametrize("threshold", [0.0, config.DEFAULT_SCORE_THRESHOLD])
+def test_matches_analyzer_engine_on_sample_documents(monkeypatch, threshold):
+    analyzer = sample_analyzer(monkeypatch)
+    stock = AnalyzerEngine(
+        registry=analyzer.registry,
+        nlp_engine=analyzer.nlp_engine,
+        supported_languages=analyzer.supported_languages,
+        context_aware_enhancer=analyzer.context_aware_enhancer,
+    )
+    assert SAMPLE_DOCUMENTS
+    for path in SAMPLE_DOCUMENTS:
+        text = path.read_text(encoding="utf-8")
+        expected = stock.analyze(text=text, language="ja", score_threshold=threshold)
+        assert as_tuples(analyzer.analyze(text=text, language="ja", score_threshold=threshold)) == as_tuples(expected), path.name
+
+
+def test_morph_cache_matches_stock_tokenizer_on_sample_documents(monkeypatch):
+    pytest.importorskip("sudachipy")
+    from redactor.morph_cache import CachedMorphJapaneseTokenizer, morph_cache_supported, use_cached_morph
+
+    if not morph_cache_supported():
+        pytest.skip("対応しないバージョンの spaCy では置き換えない")
+    monkeypatch.setattr(config, "NLP_CACHE_MORPH", True)
+    stock = spacy.blank("ja")
+    cached = use_cached_morph(spacy.blank("ja"))
+    assert type(cached.tokenizer) is CachedMorphJapaneseTokenizer
+
+    def tokens(doc):
+        return [(t.text, t.whitespace_, t.lemma_, t.norm_, t.tag_, t.pos_, str(t.morph)) for t in doc]
+
+    for path in SAMPLE_DOCUMENTS:
+        text = path.read_text(encoding="utf-8")
+        assert tokens(cached(text)) == tokens(stock(text)), path.name
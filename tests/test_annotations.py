@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+from redactor.annotations import ENTITY_ALIASES, dump_span, match_spans, read_spans, score_spans
+
+
+def naive_match_spans(expected, detected):
+    """すべての (検出, 正解) の組を比較する実装。"""
+    def kind(entity_type):
+        return ENTITY_ALIASES.get(entity_type, entity_type)
+
+    return [
+        [
+            index for index, (expected_start, expected_end, expected_type) in enumerate(expected)
+            if kind(expected_type) == kind(entity_type) and min(end, expected_end) - max(start, expected_start) > 0
+        ]
+        for start, end, entity_type in detected
+    ]
+
+
+def random_spans(rng, count):
+    spans = []
+    for _ in range(count):
+        start = rng.randrange(100)
+        spans.append((start, start + rng.randint(1, 15), rng.choice(["PERSON", "ORG", "ORGANIZATION", "PHONE_NUMBER"])))
+    return spans
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_match_spans_matches_naive(seed):
+    rng = random.Random(seed)
+    expected = random_spans(rng, rng.randint(0, 30))
+    detected = random_spans(rng, rng.randint(0, 30))
+    assert [sorted(found) for found in match_spans(expected, detected)] == naive_match_spans(expected, detected)
+
+
+def test_score_spans():
+    expected = [(0, 5, "PERSON"), (10, 15, "ORG"), (20, 25, "PHONE_NUMBER")]
+    detected = [(0, 5, "PERSON"), (12, 18, "ORGANIZATION"), (30, 35, "PERSON"), (20, 25, "PERSON")]
+    assert score_spans(expected, detected) == {
+        "PERSON": {"tp": 1, "fp": 2, "fn": 0, "exact": 1},
+        "ORG": {"tp": 1, "fp": 0, "fn": 0, "exact": 0},
+        "PHONE_NUMBER": {"tp": 0, "fp": 0, "fn": 1, "exact": 0},
+    }
+
+
+def test_spans_file_round_trip(tmp_path):
+    path = tmp_path / "doc.spans.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        dump_span(f, 3, 8, "PERSON")
+        dump_span(f, 10, 12, "ORG")
+    assert read_spans(path) == [(3, 8, "PERSON"), (10, 12, "ORG")]
@@ -0,0 +1,68 @@
+import random
+from collections import namedtuple
+
+import pytest
+
+from redactor.anonymizer import EntityAnonymizer
+
+Result = namedtuple("Result", ["entity_type", "start", "end", "score"])
+
+ENTITY_TYPES = ["PERSON", "ORG", "PHONE_NUMBER"]
+
+
+def test_tokens_are_numbered_from_the_end():
+    text = "山田 と 佐藤 と 山田"
+    results = [Result("PERSON", 0, 2, 0.9), Result("PERSON", 5, 7, 0.9), Result("PERSON", 10, 12, 0.9)]
+    anonymized = EntityAnonymizer(ENTITY_TYPES).anonymize(text, results)
+    assert anonymized.text == "<PERSON1> と <PERSON2> と <PERSON1>"
+    assert anonymized.mapping == {"<PERSON1>": "山田", "<PERSON2>": "佐藤"}
+
+
+def test_state_round_trip_keeps_numbering():
+    anonymizer = EntityAnonymizer(ENTITY_TYPES)
+    anonymizer.anonymize("山田", [Result("PERSON", 0, 2, 0.9)])
+    restored = EntityAnonymizer.from_state(ENTITY_TYPES, anonymizer.get_state())
+    assert restored.anonymize("佐藤 山田", [Result("PERSON", 0, 2, 0.9)]).text == "<PERSON2> 山田"
+
+
+def baseline_operators(entity_types):
+    """main() が AnonymizerEngine に渡していたエンティティごとの lambda オペレーター。"""
+    from presidio_anonymizer.entities import OperatorConfig
+
+    entity_maps = {entity: {} for entity in entity_types}
+
+    def create_operator(entity_type):
+        def operator(old_value, **kwargs):
+            val = old_value.strip()
+            entity_map = entity_maps[entity_type]
+            if val not in entity_map:
+                entity_map[val] = len(entity_map) + 1
+            return f"<{entity_type}{entity_map[val]}>"
+        return operator
+
+    return {entity: OperatorConfig("custom", {"lambda": create_operator(entity)}) for entity in entity_types}
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_matches_anonymizer_engine(seed):
+    pytest.importorskip("presidio_anonymizer")
+    from presidio_anonymizer import AnonymizerEngine
+    from presidio_anonymizer.entities import RecognizerResult
+
+    rng = random.Random(seed)
+    words = ["山田", "佐藤", "ACME", "03-1234", " ", "  ", "\n", "と"]
+    text = "".join(rng.choice(words) for _ in range(30))
+    results = []
+    for _ in range(rng.randint(0, 15)):
+        start = rng.randrange(len(text))
+        end = min(len(text), start + rng.randint(1, 8))
+        # ENTITY_TYPES 以外のタイプは <EMAIL_ADDRESS> のように置き換えられる
+        entity_type = rng.choice(ENTITY_TYPES + ["EMAIL_ADDRESS"])
+        results.append(Result(entity_type, start, end, rng.choice([0.6, 0.85, 1.0])))
+
+    expected = AnonymizerEngine().anonymize(
+        text=text,
+        analyzer_results=[RecognizerResult(r.entity_type, r.start, r.end, r.score) for r in results],
+        operators=baseline_operators(ENTITY_TYPES),
+    )
+    assert EntityAnonymizer(ENTITY_TYPES).anonymize(text, results).text == expected.text
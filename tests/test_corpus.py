@@ -0,0 +1,57 @@
+import pytest
+
+pytest.importorskip("presidio_analyzer")
+pytest.importorskip("spacy")
+
+from redactor.corpus import generate_corpus, max_pii_density, parse_template
+
+
+TEMPLATE = """# 振込依頼書
+- 依頼人名: 佐々木商事株式会社
+- カード会員: 鈴木花子
+- お支払日: 2024年2月10日
+- 担当者: 外為課 田中太郎
+- 備考: 田中さんに確認済み
+- 支店: 新宿支店
+"""
+
+
+def test_slots_come_from_slot_labels():
+    template = parse_template("transfer", TEMPLATE)
+
+    assert [(prefix.strip(), entity_type) for _, prefix, entity_type, _ in template.slots] == [
+        ("- 依頼人名:", "ORG"),
+        ("- カード会員:", "PERSON"),
+        ("- 担当者:", "PERSON"),
+    ]
+    # form_fields の対応表では CREDIT_CARD と判定されるラベルも、SLOT_LABELS になければ地の文として扱う
+    texts = [line[1] for line in template.lines if line[0] == "text"]
+    assert "- お支払日: 2024年2月10日\n" in texts
+    assert "- 支店: 新宿支店\n" in texts
+    # スロットの人名（肩書きを除いた姓）を含む行は使用しない
+    assert not any("田中" in text for text in texts)
+
+
+def test_custom_slot_labels():
+    template = parse_template("transfer", TEMPLATE, {"お支払日": "CREDIT_CARD"})
+
+    assert [entity_type for _, _, entity_type, _ in template.slots] == ["CREDIT_CARD"]
+
+
+def test_density_near_limit_finishes(tmp_path):
+    template = parse_template("transfer", TEMPLATE)
+    limit = max_pii_density(template.slots)
+
+    # 地の文の行があるため目標には届かないが、スロットの行の追加を打ち切って終了する
+    with pytest.warns(UserWarning):
+        documents, chars, spans = generate_corpus(tmp_path, documents=1, size=2048, density=limit, templates=[template])
+
+    assert documents == 1
+    assert spans / chars * 1000 > limit * 0.8
+
+
+def test_density_above_limit_is_rejected(tmp_path):
+    template = parse_template("transfer", TEMPLATE)
+
+    with pytest.raises(ValueError):
+        generate_corpus(tmp_path, documents=1, density=max_pii_density(template.slots) + 1, templates=[template])
@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from redactor.deanonymizer import CompiledMapping, CompiledMappingCache, StreamingDeanonymizer, deanonymize
+
+
+def naive_deanonymize(text, mapping):
+    """トークンごとに str.replace を繰り返す実装（長いトークンを先に置き換える）。"""
+    for token in sorted(mapping, key=len, reverse=True):
+        text = text.replace(token, mapping[token])
+    return text
+
+
+def person_mapping(count):
+    return {f"<PERSON{i}>": f"人物{i}" for i in range(1, count + 1)}
+
+
+def test_person1_does_not_match_inside_person10():
+    mapping = person_mapping(12)
+    text = "<PERSON1> と <PERSON10> と <PERSON11><PERSON1>"
+    assert deanonymize(text, mapping) == "人物1 と 人物10 と 人物11人物1"
+
+
+def test_unknown_and_partial_tokens_are_kept():
+    mapping = person_mapping(2)
+    text = "<PERSON3> <PERSON <PERSON1 <EMAIL_ADDRESS1> <<PERSON2>>"
+    assert deanonymize(text, mapping) == "<PERSON3> <PERSON <PERSON1 <EMAIL_ADDRESS1> <人物2>"
+
+
+def test_token_that_prefixes_another_token():
+    # 長いトークンを優先する
+    mapping = {"<A>": "x", "<A>B>": "y"}
+    assert deanonymize("<A>B> <A>", mapping) == naive_deanonymize("<A>B> <A>", mapping)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_matches_naive_replace(seed):
+    rng = random.Random(seed)
+    mapping = person_mapping(rng.randint(1, 120))
+    mapping.update({f"<EMAIL_ADDRESS{i}>": f"user{i}@example.com" for i in range(1, rng.randint(1, 15))})
+    tokens = list(mapping) + ["<PERSON0>", "<PERSON", "<", ">", "PERSON1>", "本文 "]
+    text = "".join(rng.choice(tokens) for _ in range(200))
+    assert CompiledMapping(mapping).deanonymize(text) == naive_deanonymize(text, mapping)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_streaming_matches_whole_text(seed):
+    rng = random.Random(seed)
+    mapping = person_mapping(15)
+    tokens = list(mapping) + ["<PERSON", "<", "了解です。", "\n"]
+    text = "".join(rng.choice(tokens) for _ in range(100))
+    stream = StreamingDeanonymizer(mapping)
+    output = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 7)
+        output.append(stream.feed(text[position:position + size]))
+        position += size
+    output.append(stream.flush())
+    assert "".join(output) == naive_deanonymize(text, mapping)
+
+
+def test_streaming_holds_only_token_prefixes():
+    stream = StreamingDeanonymizer(person_mapping(10))
+    assert stream.feed("こんにちは <PERS") == "こんにちは "
+    assert stream.feed("ON1") == ""
+    assert stream.feed("0> さん <x") == "人物10 さん <x"
+    assert stream.flush() == ""
+
+
+def test_cache_is_keyed_by_version():
+    cache = CompiledMappingCache(max_sessions=1)
+    compiled = cache.put("a", 1, person_mapping(1))
+    assert cache.get("a", 1) is compiled
+    assert cache.get("a", 2) is None
+    cache.put("b", 1, {})
+    assert cache.get("a", 1) is None
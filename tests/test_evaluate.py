@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip("presidio_analyzer")
+pytest.importorskip("spacy")
+
+from presidio_analyzer import AnalyzerEngine, Pattern, PatternRecognizer, RecognizerRegistry
+from presidio_analyzer.context_aware_enhancers import LemmaContextAwareEnhancer
+
+from redactor import config
+from redactor.evaluate import analyze_unthresholded, apply_score_setting, parse_score_setting
+from redactor.redactor import analyze_text
+from test_analyzer_engine import WhitespaceNlpEngine
+
+
+TEXT = """連絡先一覧
+- 電話: 03-1234-5678
+- 担当: 090-1111-2222 tel
+tel 06-9876-5432 / 1234
+"""
+
+
+def build_analyzer():
+    registry = RecognizerRegistry(supported_languages=["ja"])
+    registry.add_recognizer(PatternRecognizer(
+        supported_entity="PHONE_NUMBER",
+        patterns=[Pattern("phone", r"\d{2,4}-\d{4}-\d{4}", 0.6), Pattern("digits", r"\d{4}", 0.4)],
+        context=["電話", "tel"],
+        supported_language="ja",
+    ))
+    return AnalyzerEngine(
+        registry=registry,
+        nlp_engine=WhitespaceNlpEngine(),
+        supported_languages=["ja"],
+        context_aware_enhancer=LemmaContextAwareEnhancer(
+            context_similarity_factor=0.35, min_score_with_context_similarity=0.75
+        ),
+    )
+
+
+def as_tuples(results):
+    return sorted((r.entity_type, r.start, r.end) for r in results)
+
+
+@pytest.mark.parametrize("fast_path", [False, True])
+def test_sweep_matches_configured_pipeline(monkeypatch, fast_path):
+    monkeypatch.setattr(config, "FORM_FIELD_FAST_PATH", fast_path)
+    analyzer = build_analyzer()
+    setting = parse_score_setting(str(config.DEFAULT_SCORE_THRESHOLD))
+
+    swept = apply_score_setting(analyze_unthresholded(analyzer, TEXT), TEXT, setting)
+    assert as_tuples(swept) == as_tuples(analyze_text(analyzer, TEXT))
+
+
+def test_sweep_marks_form_field_results(monkeypatch):
+    monkeypatch.setattr(config, "FORM_FIELD_FAST_PATH", True)
+    results = analyze_unthresholded(build_analyzer(), TEXT, explain=True)
+
+    form_result = next(r for r in results if TEXT[r.start:r.end] == "03-1234-5678")
+    # ラベルのコンテキストで補正した結果は、raw_results が補正し直せるよう印が付く
+    assert form_result.recognition_metadata[form_result.IS_SCORE_ENHANCED_BY_CONTEXT_KEY]
@@ -0,0 +1,121 @@
+import pytest
+
+pytest.importorskip("presidio_analyzer")
+
+from presidio_analyzer import AnalyzerEngine, Pattern, PatternRecognizer, RecognizerRegistry, RecognizerResult
+from presidio_analyzer.context_aware_enhancers import LemmaContextAwareEnhancer
+
+from redactor import config
+from redactor.form_fields import FormFieldParser, merge_form_results, split_form_fields
+
+
+class _StubNlpEngine:
+    """split_form_fields は NLP エンジンを使用しないため、AnalyzerEngine の構築に必要な最小限の実装。"""
+
+    def is_loaded(self):
+        return True
+
+    def get_supported_languages(self):
+        return ["ja"]
+
+    def get_supported_entities(self):
+        return []
+
+
+def build_analyzer():
+    registry = RecognizerRegistry(supported_languages=["ja"])
+    registry.add_recognizer(PatternRecognizer(
+        supported_entity="PHONE_NUMBER",
+        patterns=[Pattern("phone", r"\d{2,4}-\d{4}-\d{4}", 0.6)],
+        context=["電話"],
+        supported_language="ja",
+    ))
+    return AnalyzerEngine(
+        registry=registry,
+        nlp_engine=_StubNlpEngine(),
+        supported_languages=["ja"],
+        context_aware_enhancer=LemmaContextAwareEnhancer(
+            context_similarity_factor=0.35, min_score_with_context_similarity=0.75
+        ),
+    )
+
+
+@pytest.fixture
+def parser(monkeypatch):
+    monkeypatch.setattr(config, "TABLE_AWARE", False)
+    return FormFieldParser([("電話", "PHONE_NUMBER"), ("氏名", "PERSON")])
+
+
+def test_blanks_only_values(parser):
+    text = "依頼人名: みずほ銀行\n- 氏名: 山田太郎\n電話: 03-1234-5678\n備考: なし"
+    form = split_form_fields(build_analyzer(), text, parser)
+
+    assert len(form.free_text) == len(text)
+    # ラベルは spaCy・コンテキストによる補正から参照できるよう残る
+    assert form.free_text.splitlines() == [
+        "依頼人名: みずほ銀行",
+        "- 氏名: " + "\u3000" * len("山田太郎"),
+        "電話: " + "\u3000" * len("03-1234-5678"),
+        "備考: なし",
+    ]
+    assert sorted((r.entity_type, text[r.start:r.end]) for r in form.results) == [
+        ("PERSON", "山田太郎"),
+        ("PHONE_NUMBER", "03-1234-5678"),
+    ]
+
+
+def test_unexplained_value_is_left_for_spacy(parser):
+    text = "電話: 山田 03-1234-5678"
+    form = split_form_fields(build_analyzer(), text, parser)
+
+    assert form.free_text == text
+    assert form.results == []
+
+
+def test_table_blanks_only_classified_cells(monkeypatch):
+    monkeypatch.setattr(config, "TABLE_AWARE", True)
+    parser = FormFieldParser([("電話", "PHONE_NUMBER"), ("氏名", "PERSON")])
+    text = "| 氏名 | 電話 |\n|---|---|\n| 山田太郎 | 03-1234-5678 |\n"
+    form = split_form_fields(build_analyzer(), text, parser)
+
+    assert len(form.free_text) == len(text)
+    assert form.free_text.splitlines()[:2] == ["| 氏名 | 電話 |", "|---|---|"]
+    assert "山田太郎" not in form.free_text and "03-1234-5678" not in form.free_text
+    assert sorted((r.entity_type, text[r.start:r.end]) for r in form.results) == [
+        ("PERSON", "山田太郎"),
+        ("PHONE_NUMBER", "03-1234-5678"),
+    ]
+
+
+def test_merge_drops_results_on_labels_and_blanked_values(parser):
+    text = "- 氏名: 山田太郎\n備考: 鈴木さん"
+    form = split_form_fields(build_analyzer(), text, parser)
+    note = text.index("鈴木")
+    free_results = [
+        # NER がラベルと空白をまとめて固有表現とした場合
+        RecognizerResult("ORGANIZATION", 2, text.index("\n"), 0.85),
+        # ラベルの一部を人名とした場合
+        RecognizerResult("PERSON", 2, 4, 0.85),
+        RecognizerResult("PERSON", note, note + 2, 0.85),
+    ]
+
+    merged = merge_form_results(form, free_results)
+
+    assert sorted((r.entity_type, text[r.start:r.end]) for r in merged) == [
+        ("PERSON", "山田太郎"),
+        ("PERSON", "鈴木"),
+    ]
+
+
+def test_label_words_do_not_suppress_value(parser):
+    # "氏名" 自体が人名として検出されても、値全体の検出結果が採用される
+    analyzer = build_analyzer()
+    analyzer.registry.add_recognizer(PatternRecognizer(
+        supported_entity="PERSON",
+        patterns=[Pattern("name", r"氏名|山田太郎", 0.6)],
+        supported_language="ja",
+    ))
+    text = "氏名: 山田太郎"
+    form = split_form_fields(analyzer, text, parser)
+
+    assert [(r.entity_type, text[r.start:r.end]) for r in form.results] == [("PERSON", "山田太郎")]
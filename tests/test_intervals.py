@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from redactor.intervals import ContainmentIndex
+
+
+def naive_contains(ranges, start, end):
+    """filter_common_words の元の実装（登録済みの範囲をすべて走査する）。"""
+    return any(existing_start <= start and end <= existing_end for existing_start, existing_end in ranges)
+
+
+def random_ranges(rng, count, length):
+    ranges = []
+    for _ in range(count):
+        start = rng.randrange(length)
+        ranges.append((start, start + rng.randrange(0, 12)))
+    return ranges
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_contains_matches_naive_scan(seed):
+    rng = random.Random(seed)
+    candidates = random_ranges(rng, 60, 80)
+    index = ContainmentIndex(start for start, _ in candidates)
+    registered = []
+    for start, end in candidates:
+        for query in random_ranges(rng, 10, 90):
+            assert index.contains(*query) == naive_contains(registered, *query)
+        index.add(start, end)
+        registered.append((start, end))
+        assert (start, end) in index
+
+
+def test_empty_index():
+    index = ContainmentIndex([])
+    assert not index.contains(0, 0)
+    assert index.max_end_before(10) == -1
+
+
+def test_identical_range_is_contained():
+    index = ContainmentIndex([3])
+    index.add(3, 7)
+    assert index.contains(3, 7)
+    assert index.contains(4, 7)
+    assert not index.contains(2, 7)
+    assert not index.contains(3, 8)
+    assert (3, 7) in index
+    assert (4, 7) not in index
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_remove_duplicates_matches_presidio(seed):
+    presidio_analyzer = pytest.importorskip("presidio_analyzer")
+    from redactor.pattern_scanner import remove_duplicates
+
+    rng = random.Random(seed)
+    results = [
+        presidio_analyzer.RecognizerResult(
+            rng.choice(["PERSON", "ORG", "PHONE_NUMBER"]), start, end, rng.choice([0.5, 0.7, 0.85, 1.0])
+        )
+        for start, end in random_ranges(rng, 40, 60)
+    ]
+    expected = presidio_analyzer.EntityRecognizer.remove_duplicates(list(results))
+    assert remove_duplicates(list(results)) == expected
@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+from redactor.keywords import KeywordAutomaton
+
+
+def naive_any_within(text, words, start, end):
+    """filter_common_words の元の実装（周辺テキストを切り出し、単語ごとに部分文字列検索する）。"""
+    window = text[start:end].lower()
+    return any(word.lower() in window for word in words)
+
+
+def assert_matches_naive(text, words):
+    hits = KeywordAutomaton(words).search(text)
+    for start in range(len(text) + 1):
+        for end in range(start, len(text) + 1):
+            assert hits.any_within(start, end) == naive_any_within(text, words, start, end), (start, end)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_texts_match_naive_search(seed):
+    rng = random.Random(seed)
+    alphabet = "abAB氏名様"
+    words = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(6)]
+    text = "".join(rng.choice(alphabet + " ") for _ in range(40))
+    assert_matches_naive(text, words)
+
+
+def test_person_context_words():
+    words = ["氏名", "名前", "名義", "Name", "NAME", "担当", "様", "ローマ字", "表記", "代表者", "代表"]
+    assert_matches_naive("担当者: 山田太郎 様\nname: Taro YAMADA\n代表者名義", words)
+
+
+def test_overlapping_and_nested_words():
+    # "he" は "she"・"hers" の途中で一致する（失敗遷移で引き継がれる最短の一致）
+    assert_matches_naive("ushers and his shelf", ["he", "she", "his", "hers"])
+
+
+def test_empty_word_always_matches():
+    hits = KeywordAutomaton(["", "abc"]).search("xyz")
+    assert hits.any_within(1, 1)
+
+
+def test_lowercase_changing_length_falls_back_to_substring_search():
+    # 'İ'.lower() は 2 文字になるため、範囲ごとの検索に切り替わる
+    assert_matches_naive("İstanbul 氏名 ab", ["氏名", "i̇s", "AB"])
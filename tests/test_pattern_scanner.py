@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("presidio_analyzer")
+pytest.importorskip("spacy")
+
+from presidio_analyzer import Pattern, PatternRecognizer
+
+from redactor import config, pattern_scanner
+from redactor.pattern_scanner import MultiPatternRecognizer
+from redactor.redactor import analyze_text
+from test_analyzer_engine import SAMPLE_DOCUMENTS, sample_analyzer
+
+
+def as_set(results):
+    return {(r.entity_type, r.start, r.end, r.score) for r in results}
+
+
+def test_combined_scanner_matches_individual_recognizers(monkeypatch):
+    analyzers = {}
+    for combined in (True, False):
+        monkeypatch.setattr(config, "USE_COMBINED_PATTERN_SCANNER", combined)
+        analyzers[combined] = sample_analyzer(monkeypatch)
+    assert any(isinstance(r, MultiPatternRecognizer) for r in analyzers[True].registry.recognizers)
+    assert not any(isinstance(r, MultiPatternRecognizer) for r in analyzers[False].registry.recognizers)
+
+    assert SAMPLE_DOCUMENTS
+    for path in SAMPLE_DOCUMENTS:
+        text = path.read_text(encoding="utf-8")
+        # 閾値なしの結果でコンテキストによるスコア補正も比較する
+        unthresholded = [as_set(a.analyze(text=text, language="ja", score_threshold=0.0)) for a in analyzers.values()]
+        assert unthresholded[0] == unthresholded[1], path.name
+        configured = [as_set(analyze_text(a, text)) for a in analyzers.values()]
+        assert configured[0] == configured[1], path.name
+
+
+def test_regex_timeout_skips_pattern(monkeypatch, caplog):
+    monkeypatch.setattr(pattern_scanner, "REGEX_TIMEOUT_SECONDS", 0.2)
+    scanner = MultiPatternRecognizer([
+        PatternRecognizer(supported_entity="PIN", patterns=[Pattern("catastrophic", r"^(a|aa)+$", 0.5)], supported_language="ja"),
+        PatternRecognizer(supported_entity="PHONE_NUMBER", patterns=[Pattern("phone", r"0\d{1,4}-\d{1,4}-\d{4}", 0.6)], supported_language="ja"),
+    ])
+    text = "a" * 40 + "b 03-1234-5678"
+
+    with caplog.at_level("WARNING", logger="presidio-analyzer"):
+        matches = scanner.scan(text)
+
+    # タイムアウトしたパターンを打ち切り、ほかのパターンの一致は返す
+    assert [(text[start:end], entity_type) for start, end, entity_type, *_ in matches] == [("03-1234-5678", "PHONE_NUMBER")]
+    assert "timed out" in caplog.text
@@ -0,0 +1,209 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from redactor.scheduler import BatchMetrics, MicroBatchScheduler
+
+
+class FakeBatch:
+    """受け取ったバッチを記録し、要素を大文字にして返す batch 関数。gate を閉じると処理を止める。"""
+
+    def __init__(self, fail_batch=False):
+        self.batches = []
+        self.singles = []
+        self.fail_batch = fail_batch
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+
+    def process_batch(self, items):
+        self.started.set()
+        self.gate.wait(5)
+        self.batches.append(list(items))
+        if self.fail_batch:
+            raise RuntimeError("batch failed")
+        return [item.upper() for item in items]
+
+    def process_one(self, item):
+        self.singles.append(item)
+        if item == "bad":
+            raise ValueError(item)
+        return item.upper()
+
+
+def run(fake, scenario, **kwargs):
+    async def main():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            scheduler = MicroBatchScheduler(fake.process_batch, fake.process_one, executor, **kwargs)
+            scheduler.start()
+            try:
+                return await scenario(scheduler)
+            finally:
+                await scheduler.close()
+
+    return asyncio.run(main())
+
+
+async def wait_started(fake):
+    await asyncio.get_running_loop().run_in_executor(None, fake.started.wait, 5)
+
+
+def test_idle_request_is_not_delayed():
+    fake = FakeBatch()
+
+    async def scenario(scheduler):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await scheduler.submit("a")
+        return result, loop.time() - start
+
+    result, elapsed = run(fake, scenario, wait_ms=0)
+
+    assert result == "A"
+    assert fake.batches == [["a"]]
+    assert elapsed < 0.5
+
+
+def test_requests_arriving_during_analysis_are_batched():
+    fake = FakeBatch()
+    fake.gate.clear()
+
+    async def scenario(scheduler):
+        first = asyncio.ensure_future(scheduler.submit("a"))
+        await wait_started(fake)
+        # 分析中に届いたリクエストは次のバッチにまとめる
+        rest = [asyncio.ensure_future(scheduler.submit(item)) for item in "bcd"]
+        await asyncio.sleep(0)
+        fake.gate.set()
+        return await asyncio.gather(first, *rest)
+
+    assert run(fake, scenario, wait_ms=0, max_batch_texts=16) == ["A", "B", "C", "D"]
+    assert fake.batches == [["a"], ["b", "c", "d"]]
+
+
+def test_wait_window_flush():
+    fake = FakeBatch()
+
+    async def scenario(scheduler):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first = asyncio.ensure_future(scheduler.submit("a"))
+        await asyncio.sleep(0.02)
+        second = asyncio.ensure_future(scheduler.submit("b"))
+        results = await asyncio.gather(first, second)
+        return results, loop.time() - start
+
+    results, elapsed = run(fake, scenario, wait_ms=200)
+
+    assert results == ["A", "B"]
+    # 件数が上限に達しなくても、待ち時間が過ぎれば届いたリクエストをまとめて分析する
+    assert fake.batches == [["a", "b"]]
+    assert elapsed >= 0.19
+
+
+def test_max_batch_flush():
+    fake = FakeBatch()
+
+    async def scenario(scheduler):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        results = await asyncio.gather(*(scheduler.submit(item) for item in "abc"))
+        return results, loop.time() - start
+
+    results, elapsed = run(fake, scenario, wait_ms=10_000, max_batch_texts=3)
+
+    assert results == ["A", "B", "C"]
+    # 上限に達したバッチは待ち時間を待たずに分析する
+    assert fake.batches == [["a", "b", "c"]]
+    assert elapsed < 5
+
+
+def test_batch_error_falls_back_to_single_requests():
+    fake = FakeBatch(fail_batch=True)
+    fake.gate.clear()
+
+    async def scenario(scheduler):
+        first = asyncio.ensure_future(scheduler.submit("a"))
+        await wait_started(fake)
+        rest = [asyncio.ensure_future(scheduler.submit(item)) for item in ("b", "bad", "c")]
+        await asyncio.sleep(0)
+        fake.gate.set()
+        return await asyncio.gather(first, *rest, return_exceptions=True)
+
+    results = run(fake, scenario, wait_ms=0)
+
+    assert results[:2] == ["A", "B"]
+    assert isinstance(results[2], ValueError)
+    assert results[3] == "C"
+    assert fake.singles == ["a", "b", "bad", "c"]
+
+
+def test_cancelled_request_is_not_processed():
+    fake = FakeBatch()
+    fake.gate.clear()
+
+    async def scenario(scheduler):
+        first = asyncio.ensure_future(scheduler.submit("a"))
+        await wait_started(fake)
+        cancelled = asyncio.ensure_future(scheduler.submit("b"))
+        kept = asyncio.ensure_future(scheduler.submit("c"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        fake.gate.set()
+        return await asyncio.gather(first, kept)
+
+    assert run(fake, scenario, wait_ms=0) == ["A", "C"]
+    assert fake.batches == [["a"], ["c"]]
+
+
+def test_close_cancels_queued_requests():
+    fake = FakeBatch()
+    fake.gate.clear()
+
+    async def main():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            scheduler = MicroBatchScheduler(fake.process_batch, fake.process_one, executor, wait_ms=0)
+            scheduler.start()
+            first = asyncio.ensure_future(scheduler.submit("a"))
+            await wait_started(fake)
+            queued = asyncio.ensure_future(scheduler.submit("b"))
+            await asyncio.sleep(0)
+            assert scheduler.queued == 1
+            await scheduler.close()
+            fake.gate.set()
+            outcomes = await asyncio.gather(first, queued, return_exceptions=True)
+            return [isinstance(outcome, asyncio.CancelledError) for outcome in outcomes]
+
+    assert asyncio.run(main()) == [True, True]
+
+
+def test_metrics_values():
+    metrics = BatchMetrics(max_batch_texts=4)
+    metrics.record(1, [0.001], 0.010)
+    metrics.record(3, [0.002, 0.004, 0.003], 0.030)
+
+    snapshot = metrics.snapshot()
+
+    assert snapshot["batches"] == 2
+    assert snapshot["texts"] == 4
+    assert snapshot["batch_fill"] == {"mean_size": 2.0, "mean_ratio": 0.5, "sizes": {"1": 1, "3": 1}}
+    assert snapshot["queue_delay_ms"]["mean"] == pytest.approx(2.5)
+    assert snapshot["queue_delay_ms"]["p50"] == pytest.approx(3.0)
+    assert snapshot["queue_delay_ms"]["max"] == pytest.approx(4.0)
+    assert snapshot["batch_ms_mean"] == pytest.approx(20.0)
+
+
+def test_scheduler_records_metrics():
+    fake = FakeBatch()
+
+    async def scenario(scheduler):
+        await asyncio.gather(*(scheduler.submit(item) for item in "abc"))
+        return scheduler.metrics.snapshot()
+
+    snapshot = run(fake, scenario, wait_ms=0, max_batch_texts=2)
+
+    assert snapshot["texts"] == 3
+    assert snapshot["batches"] == len(fake.batches)
+    assert sum(int(size) * count for size, count in snapshot["batch_fill"]["sizes"].items()) == 3
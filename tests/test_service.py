@@ -0,0 +1,141 @@
+import pytest
+
+pytest.importorskip("presidio_analyzer")
+pytest.importorskip("spacy")
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient
+from presidio_analyzer import AnalyzerEngine, Pattern, PatternRecognizer, RecognizerRegistry
+from presidio_analyzer.context_aware_enhancers import LemmaContextAwareEnhancer
+
+from redactor import config
+from redactor.service import create_app
+from redactor.session_store import InMemorySessionStore
+from test_analyzer_engine import WhitespaceNlpEngine
+
+
+def build_analyzer():
+    """学習済みモデルを使わず、決まった人名と電話番号だけを検出する Analyzer。"""
+    registry = RecognizerRegistry(supported_languages=["ja"])
+    registry.add_recognizer(PatternRecognizer(
+        supported_entity="PERSON",
+        patterns=[Pattern("name", r"山田太郎|佐藤花子", 0.9)],
+        supported_language="ja",
+    ))
+    registry.add_recognizer(PatternRecognizer(
+        supported_entity="PHONE_NUMBER",
+        patterns=[Pattern("phone", r"0\d{1,4}-\d{1,4}-\d{4}", 0.9)],
+        supported_language="ja",
+    ))
+    return AnalyzerEngine(
+        registry=registry,
+        nlp_engine=WhitespaceNlpEngine(),
+        supported_languages=["ja"],
+        context_aware_enhancer=LemmaContextAwareEnhancer(
+            context_similarity_factor=0.35, min_score_with_context_similarity=0.75
+        ),
+    )
+
+
+class ConflictingSessionStore(InMemorySessionStore):
+    """保存が常に他のワーカーと競合するセッションストア。"""
+
+    async def save_mapping(self, session_id, mapping, state=None, expected_version=None):
+        return False
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(config, "SERVICE_API_KEY", None)
+    with TestClient(create_app(build_analyzer(), InMemorySessionStore(ttl_seconds=60))) as client:
+        yield client
+
+
+def anonymize(client, text, session_id="s1", **kwargs):
+    response = client.post("/anonymize", json={"text": text, "session_id": session_id}, **kwargs)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_numbering_is_consistent_across_turns(client):
+    first = anonymize(client, "担当は山田太郎です。")
+    second = anonymize(client, "佐藤花子と山田太郎が出席。")
+
+    assert first["anonymized_text"] == "担当は<PERSON1>です。"
+    assert second["anonymized_text"] == "<PERSON2>と<PERSON1>が出席。"
+    assert [(e["original_text"], e["anonymized_token"]) for e in second["entities"]] == [
+        ("佐藤花子", "<PERSON2>"),
+        ("山田太郎", "<PERSON1>"),
+    ]
+    # 別のセッションは番号を共有しない
+    assert anonymize(client, "佐藤花子", session_id="s2")["anonymized_text"] == "<PERSON1>"
+
+
+def test_deanonymize_round_trip(client):
+    text = "山田太郎（03-1234-5678）から佐藤花子へ"
+    anonymized = anonymize(client, text)["anonymized_text"]
+
+    response = client.post("/deanonymize", json={"text": anonymized, "session_id": "s1"})
+
+    assert response.status_code == 200
+    assert response.json() == {"deanonymized_text": text}
+
+
+def test_deanonymize_stream_round_trip(client):
+    text = "山田太郎（03-1234-5678）から佐藤花子へ"
+    anonymized = anonymize(client, text)["anonymized_text"].encode("utf-8")
+
+    def chunks():
+        # トークンとマルチバイト文字の途中で分割する
+        for i in range(0, len(anonymized), 5):
+            yield anonymized[i:i + 5]
+
+    response = client.post("/deanonymize/stream", params={"session_id": "s1"}, content=chunks())
+
+    assert response.status_code == 200
+    assert response.text == text
+
+
+def test_delete_session(client):
+    anonymized = anonymize(client, "山田太郎")["anonymized_text"]
+
+    response = client.delete("/session/s1")
+
+    assert response.status_code == 200
+    # マッピングがないセッションはそのまま返し、番号は 1 から振り直す
+    assert client.post("/deanonymize", json={"text": anonymized, "session_id": "s1"}).json() == {"deanonymized_text": anonymized}
+    assert anonymize(client, "佐藤花子")["anonymized_text"] == "<PERSON1>"
+
+
+def test_api_key(client, monkeypatch):
+    monkeypatch.setattr(config, "SERVICE_API_KEY", "secret")
+    body = {"text": "山田太郎", "session_id": "s1"}
+
+    assert client.post("/anonymize", json=body).status_code == 401
+    assert client.post("/anonymize", json=body, headers={"X-API-Key": "wrong"}).status_code == 403
+    assert client.post("/deanonymize", json=body, headers={"X-API-Key": "wrong"}).status_code == 403
+    assert client.delete("/session/s1").status_code == 401
+    assert anonymize(client, "山田太郎", headers={"X-API-Key": "secret"})["anonymized_text"] == "<PERSON1>"
+    # ヘルスチェックは認証しない
+    assert client.get("/health").status_code == 200
+
+
+def test_version_conflict(monkeypatch):
+    monkeypatch.setattr(config, "SERVICE_API_KEY", None)
+    with TestClient(create_app(build_analyzer(), ConflictingSessionStore(ttl_seconds=60))) as client:
+        response = client.post("/anonymize", json={"text": "山田太郎", "session_id": "s1"})
+
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_overload(client):
+    client.app.state.redactor.max_pending = 0
+
+    response = client.post("/anonymize", json={"text": "山田太郎", "session_id": "s1"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    # 処理待ちの上限は /deanonymize には影響しない
+    assert client.post("/deanonymize", json={"text": "x", "session_id": "s1"}).status_code == 200
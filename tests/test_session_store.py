@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from redactor.session_store import InMemorySessionStore, RedisSessionStore
+
+
+def memory_store():
+    return InMemorySessionStore(ttl_seconds=60)
+
+
+def redis_store():
+    fakeredis = pytest.importorskip("fakeredis")
+    store = RedisSessionStore.__new__(RedisSessionStore)
+    store.redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    store.ttl_seconds = 60
+    return store
+
+
+@pytest.fixture(params=[memory_store, redis_store], ids=["memory", "redis"])
+def store(request):
+    return request.param()
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_state_round_trip(store):
+    async def scenario():
+        assert await store.get_state_with_version("s") == (None, 0)
+        assert await store.save_mapping("s", {"<PERSON1>": "山田"}, {"PERSON": {"山田": 1}}, expected_version=0)
+        assert await store.get_state_with_version("s") == ({"PERSON": {"山田": 1}}, 1)
+        assert await store.get_mapping_with_version("s") == ({"<PERSON1>": "山田"}, 1)
+
+    run(scenario())
+
+
+def test_concurrent_turns_do_not_overwrite(store):
+    async def scenario():
+        await store.save_mapping("s", {"<PERSON1>": "山田"}, {"PERSON": {"山田": 1}})
+        # 2 つのワーカーが同じ状態（バージョン 1）を読み込み、それぞれ <PERSON2> を別の人物に割り当てる
+        _, version_a = await store.get_state_with_version("s")
+        _, version_b = await store.get_state_with_version("s")
+        assert await store.save_mapping("s", {"<PERSON2>": "佐藤"}, {"PERSON": {"山田": 1, "佐藤": 2}}, expected_version=version_a)
+        assert not await store.save_mapping("s", {"<PERSON2>": "鈴木"}, {"PERSON": {"山田": 1, "鈴木": 2}}, expected_version=version_b)
+        # 競合した方は最新の状態から番号を割り当て直す
+        state, version = await store.get_state_with_version("s")
+        assert state == {"PERSON": {"山田": 1, "佐藤": 2}}
+        assert await store.save_mapping("s", {"<PERSON3>": "鈴木"}, {"PERSON": {**state["PERSON"], "鈴木": 3}}, expected_version=version)
+        mapping, _ = await store.get_mapping_with_version("s")
+        assert mapping == {"<PERSON1>": "山田", "<PERSON2>": "佐藤", "<PERSON3>": "鈴木"}
+
+    run(scenario())
+
+
+def test_new_session_conflict(store):
+    async def scenario():
+        assert await store.save_mapping("s", {"<PERSON1>": "山田"}, {"PERSON": {"山田": 1}}, expected_version=0)
+        assert not await store.save_mapping("s", {"<PERSON1>": "佐藤"}, {"PERSON": {"佐藤": 1}}, expected_version=0)
+        assert await store.get_mapping("s") == {"<PERSON1>": "山田"}
+
+    run(scenario())
+
+
+def test_unconditional_save_and_delete(store):
+    async def scenario():
+        assert await store.save_mapping("s", {"<PERSON1>": "山田"})
+        assert await store.save_mapping("s", {"<PERSON2>": "佐藤"})
+        assert await store.get_version("s") == 2
+        assert await store.delete_session("s")
+        assert await store.get_version("s") is None
+
+    run(scenario())
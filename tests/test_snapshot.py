@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("presidio_analyzer")
+
+from redactor import config, snapshot
+
+# フィンガープリントに含めない設定（検出結果に影響しない運用設定・秘密情報）
+NON_DETECTION_SETTINGS = {
+    "NLP_BATCH_SIZE", "REDACTION_MANIFEST_NAME", "RESULT_CACHE_MAX_ENTRIES", "RESULT_CACHE_MAX_BYTES",
+    "SERVICE_MAX_PENDING_REQUESTS", "SERVICE_BATCH_WAIT_MS", "SERVICE_BATCH_MAX_TEXTS", "SERVICE_MAX_TEXT_LENGTH",
+    "SERVICE_API_KEY", "SESSION_STORE_URL", "SESSION_TTL_SECONDS", "SESSION_SAVE_MAX_ATTEMPTS",
+    "DEANONYMIZER_CACHE_SESSIONS", "USE_ANALYZER_SNAPSHOT", "ANALYZER_SNAPSHOT_DIR",
+}
+
+
+def test_every_setting_is_classified():
+    # 設定を追加した場合は、検出結果に影響するかどうかでどちらかの一覧に追加する
+    settings = {name for name in dir(config) if name.isupper()}
+    assert settings == set(snapshot._FINGERPRINT_SETTINGS) | NON_DETECTION_SETTINGS
+    assert not set(snapshot._FINGERPRINT_SETTINGS) & NON_DETECTION_SETTINGS
+
+
+@pytest.mark.parametrize("name, value", [
+    ("SERVICE_API_KEY", "secret"),
+    ("SESSION_STORE_URL", "redis://localhost:6379/0"),
+    ("SERVICE_MAX_PENDING_REQUESTS", 1),
+    ("RESULT_CACHE_MAX_ENTRIES", 1),
+    ("DEANONYMIZER_CACHE_SESSIONS", 1),
+])
+def test_operational_settings_do_not_change_fingerprint(monkeypatch, name, value):
+    before = snapshot.config_fingerprint()
+    monkeypatch.setattr(config, name, value)
+    assert snapshot.config_fingerprint() == before
+
+
+@pytest.mark.parametrize("name, value", [
+    ("DEFAULT_SCORE_THRESHOLD", 0.5),
+    ("TARGET_ENTITIES", ["PERSON"]),
+    ("FORM_FIELD_FAST_PATH", False),
+])
+def test_detection_settings_change_fingerprint(monkeypatch, name, value):
+    before = snapshot.config_fingerprint()
+    monkeypatch.setattr(config, name, value)
+    assert snapshot.config_fingerprint() != before
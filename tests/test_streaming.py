@@ -0,0 +1,97 @@
+import io
+import random
+import re
+
+import pytest
+
+from redactor.anonymizer import EntityAnonymizer
+from redactor.deanonymizer import deanonymize
+from redactor.streaming import redact_stream
+
+# ウィンドウ境界をまたぐ複数行の一致（PEM ブロックのようなもの）を含む正規表現の分析器
+_PATTERNS = [
+    ("PERSON", re.compile(r"[A-Z][a-z]+ [A-Z][a-z]+")),
+    ("PHONE_NUMBER", re.compile(r"\d{2,4}-\d{4}-\d{4}")),
+    ("SECRET_KEY", re.compile(r"-----BEGIN KEY-----\n(?:[a-z0-9]+\n)+-----END KEY-----")),
+]
+ENTITY_TYPES = [entity_type for entity_type, _ in _PATTERNS]
+
+
+class _Result:
+    """redact_stream が位置を書き換えるため可変の検出結果。"""
+
+    def __init__(self, entity_type, start, end, score=1.0):
+        self.entity_type = entity_type
+        self.start = start
+        self.end = end
+        self.score = score
+
+
+def analyze(text):
+    return [
+        _Result(entity_type, match.start(), match.end())
+        for entity_type, pattern in _PATTERNS
+        for match in pattern.finditer(text)
+    ]
+
+
+def random_document(seed, lines=400):
+    rng = random.Random(seed)
+    names = ["Taro Yamada", "Hanako Sato", "Ichiro Suzuki", "Jiro Tanaka"]
+    pieces = []
+    for _ in range(lines):
+        kind = rng.random()
+        if kind < 0.3:
+            pieces.append(f"担当: {rng.choice(names)} 様\n")
+        elif kind < 0.5:
+            pieces.append(f"電話: 0{rng.randint(3, 90)}-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}\n")
+        elif kind < 0.55:
+            body = "".join(f"{rng.getrandbits(64):016x}\n" for _ in range(rng.randint(1, 6)))
+            pieces.append(f"-----BEGIN KEY-----\n{body}-----END KEY-----\n")
+        else:
+            pieces.append("備考" * rng.randint(0, 40) + "\n")
+    return "".join(pieces)
+
+
+def stream(text, anonymize, window_bytes=600, overlap_bytes=200):
+    writer = io.StringIO()
+    windows = redact_stream(io.StringIO(text), writer, analyze, anonymize, window_bytes, overlap_bytes)
+    return writer.getvalue(), windows
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_identity_round_trip(seed):
+    text = random_document(seed)
+    output, windows = stream(text, lambda window_text, results: window_text)
+    assert windows > 1
+    assert output == text
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_matches_whole_text_anonymization(seed):
+    text = random_document(seed)
+    expected = EntityAnonymizer(ENTITY_TYPES).anonymize(text, analyze(text))
+
+    anonymizer = EntityAnonymizer(ENTITY_TYPES)
+    mapping = {}
+
+    def anonymize(window_text, results):
+        anonymized = anonymizer.anonymize(window_text, results)
+        mapping.update(anonymized.mapping)
+        return anonymized.text
+
+    output, _ = stream(text, anonymize)
+    # 番号はウィンドウごとに後ろから割り当てるため、ファイル全体の処理と番号が異なることがある
+    assert re.sub(r"\d+>", ">", output) == re.sub(r"\d+>", ">", expected.text)
+    assert deanonymize(output, mapping) == text
+
+
+def test_long_line_is_split():
+    text = "x" * 5000 + "\nTaro Yamada\n"
+    output, _ = stream(text, lambda window_text, results: window_text)
+    assert output == text
+
+
+def test_rejects_small_window():
+    with pytest.raises(ValueError):
+        stream("abc", lambda window_text, results: window_text, window_bytes=500, overlap_bytes=200)